@@ -0,0 +1 @@
+__all__ = ["warm_start"]
\ No newline at end of file
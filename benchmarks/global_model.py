@@ -0,0 +1,112 @@
+import argparse
+import logging
+import tempfile
+
+from json import dumps
+from os import path
+from time import perf_counter
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from src.scripts.model_training.model_training import PRODUCTS, load_training_dataset, prepare_product_df
+from src.scripts.model_registry.model_registry import get_version_dir
+from src.scripts.model_training.global_model.global_model import (GLOBAL_MODEL_FILE, GlobalModel,
+    train_global_model, publish_global_model, load_global_model, get_global_models_dir, read_city_catalog)
+
+# The global model against per-city Prophet models: forecast error over
+# rolling origins, training cost as the number of cities grows and the cost of
+# loading the served model. Only one city has a dataset here, so the scaling
+# runs replicate it under jittered locations.
+
+TRAINING_DATASET = 'src.scripts.model_training.model_training.load_training_dataset'
+
+
+def forecast_errors(df, origin, hours, products, city_name, location):
+    history = df[df['timestamp'] < origin]
+    actual = df[(df['timestamp'] >= origin) & (df['timestamp'] < origin + hours * 3600)]
+    results = []
+
+    started = perf_counter()
+    with mock.patch(TRAINING_DATASET, return_value=history):
+        arrays = train_global_model([city_name], products, catalog={city_name: location})
+    global_time = perf_counter() - started
+    global_model = GlobalModel(arrays)
+
+    dates = pd.DataFrame({'ds': pd.to_datetime(actual['timestamp'], unit='s')})
+    with tempfile.TemporaryDirectory() as workdir:
+        for product in products:
+            started = perf_counter()
+            prophet = PRODUCTS[product](prepare_product_df(history, product), path.join(workdir, f'{product}.json'))
+            prophet_time = perf_counter() - started
+
+            y = actual[product].to_numpy()
+            prophet_yhat = prophet.predict(dates)['yhat'].to_numpy()
+            global_yhat = global_model.city_model(product, city_name, location).predict(dates)['yhat'].to_numpy()
+            results.append({
+                'origin': pd.Timestamp(origin, unit='s').strftime('%Y-%m-%d %H:%M'),
+                'product': product,
+                'prophet_mae': round(float(np.abs(prophet_yhat - y).mean()), 3),
+                'global_mae': round(float(np.abs(global_yhat - y).mean()), 3),
+                'prophet_fit_s': round(prophet_time, 3),
+                'global_fit_s_all_products': round(global_time, 3)
+            })
+    return results
+
+
+def training_scaling(df, city_counts, products, location):
+    rng = np.random.default_rng(0)
+    results = []
+    for cities in city_counts:
+        lat, lon, utc = location
+        catalog = {f'city{i:05d}': (lat + rng.uniform(-5, 5), lon + rng.uniform(-5, 5), utc)
+                   for i in range(cities)}
+        started = perf_counter()
+        with mock.patch(TRAINING_DATASET, return_value=df):
+            arrays = train_global_model(list(catalog), products, catalog=catalog)
+        elapsed = perf_counter() - started
+
+        with tempfile.TemporaryDirectory() as models_dir:
+            publish_global_model(models_dir, arrays, version='v1')
+            filename = path.join(get_version_dir(get_global_models_dir(models_dir), 'v1'), GLOBAL_MODEL_FILE)
+            started = perf_counter()
+            load_global_model(filename).city_model(products[0], 'city00000', catalog['city00000'])
+            load_time = perf_counter() - started
+            size = path.getsize(filename)
+
+        results.append({
+            'cities': cities,
+            'global_fit_s': round(elapsed, 2),
+            'global_model_files': 1,
+            'global_model_kb': round(size / 1024, 1),
+            'global_load_ms': round(load_time * 1000, 2),
+            'prophet_model_files': cities * len(products)
+        })
+    return results
+
+
+def run(city_name, products, origins, hours, city_counts, window_days):
+    df = load_training_dataset(city_name, window_days)
+    location = read_city_catalog()[city_name.lower()]
+    last = int(df['timestamp'].max())
+    errors = []
+    for k in range(origins, 0, -1):
+        errors += forecast_errors(df, last - k * hours * 3600, hours, products, city_name.lower(), location)
+    return errors, training_scaling(df, city_counts, products, location)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Global multi-city model vs. per-city Prophet models")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--products', nargs='+', default=['temp', 'humidity', 'pressure'])
+    parser.add_argument('--origins', type=int, default=3, help="rolling forecast origins")
+    parser.add_argument('--hours', type=int, default=240, help="forecast horizon")
+    parser.add_argument('--cities', nargs='+', type=int, default=[10, 100, 1000])
+    parser.add_argument('--window-days', type=int, default=365)
+    args = parser.parse_args()
+
+    errors, scaling = run(args.city, args.products, args.origins, args.hours, args.cities, args.window_days)
+    for result in errors + scaling:
+        print(dumps(result))
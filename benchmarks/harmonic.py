@@ -0,0 +1,91 @@
+import argparse
+import logging
+import tempfile
+
+from json import dumps
+from os import path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from src.scripts.model_training.model_training import PRODUCTS, load_training_dataset, prepare_product_df
+from src.scripts.model_training.harmonic.harmonic import create_harmonic_model
+from src.scripts.model_pack.model_pack import PackedProphetModel, prophet_pack_entry
+
+# The harmonic engine against the Prophet models of the same product: fit
+# time, forecast latency and the error of forecasts from rolling origins at
+# the end of the dataset. Latency is measured on the served model types, the
+# Prophet models both as fitted and as a model pack entry.
+
+
+def time_call(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        function()
+        timings.append(perf_counter() - started)
+    return float(np.median(timings))
+
+
+def forecast_latency(model, hours, repeat):
+    return time_call(lambda: model.predict(model.make_future_dataframe(periods=hours, freq='h')), repeat)
+
+
+def benchmark_origin(df, origin, product, hours, repeat, workdir):
+    history = prepare_product_df(df[df['timestamp'] < origin], product)
+    actual = df[(df['timestamp'] >= origin) & (df['timestamp'] < origin + hours * 3600)]
+    dates = pd.DataFrame({'ds': pd.to_datetime(actual['timestamp'], unit='s')})
+    y = actual[product].to_numpy()
+
+    started = perf_counter()
+    prophet = PRODUCTS[product](history, path.join(workdir, f'{product}.json'))
+    prophet_fit = perf_counter() - started
+    started = perf_counter()
+    harmonic = create_harmonic_model(history, path.join(workdir, f'{product}.harmonic.npz'))
+    harmonic_fit = perf_counter() - started
+
+    _, scalars, arrays = prophet_pack_entry(prophet)
+    packed = PackedProphetModel(arrays, **scalars)
+    return {
+        'product': product,
+        'origin': pd.Timestamp(origin, unit='s').strftime('%Y-%m-%d %H:%M'),
+        'prophet_mae': float(np.abs(prophet.predict(dates)['yhat'].to_numpy() - y).mean()),
+        'harmonic_mae': float(np.abs(harmonic.predict(dates)['yhat'].to_numpy() - y).mean()),
+        'prophet_fit_s': prophet_fit,
+        'harmonic_fit_s': harmonic_fit,
+        'prophet_predict_ms': forecast_latency(prophet, hours, repeat) * 1000,
+        'packed_prophet_predict_ms': forecast_latency(packed, hours, repeat) * 1000,
+        'harmonic_predict_ms': forecast_latency(harmonic, hours, repeat) * 1000
+    }
+
+
+def run(city_name, products, origins, hours, repeat, window_days):
+    df = load_training_dataset(city_name, window_days)
+    last = int(df['timestamp'].max())
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for product in products:
+            measured = [benchmark_origin(df, last - k * hours * 3600, product, hours, repeat, workdir)
+                        for k in range(origins, 0, -1)]
+            result = {'product': product, 'origins': origins, 'hours': hours}
+            for key in measured[0]:
+                if key not in result and key != 'origin':
+                    result[key] = round(float(np.mean([m[key] for m in measured])), 3)
+            results.append(result)
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Harmonic regression engine vs. Prophet models")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--products', nargs='+', default=[p for p in PRODUCTS if p != 'weather_description'])
+    parser.add_argument('--origins', type=int, default=3, help="rolling forecast origins")
+    parser.add_argument('--hours', type=int, default=240, help="forecast horizon")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--window-days', type=int, default=365)
+    args = parser.parse_args()
+
+    for result in run(args.city, args.products, args.origins, args.hours, args.repeat, args.window_days):
+        print(dumps(result))
@@ -0,0 +1,324 @@
+import argparse
+import logging
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+
+from csv import DictReader
+from datetime import datetime, timezone
+from json import dumps, loads
+from os import path, cpu_count, makedirs
+from statistics import mean, median, stdev
+from time import perf_counter, time
+from unittest.mock import patch
+
+import pandas as pd
+
+from src.redis.get import get
+from src.redis.get.get import (construct_searchable_city_names, get_city, get_all_cities, get_number_of_cities,
+                               hash_table_city_keys)
+from src.scripts.data_retrieval.transform.transform import transform_raw_to_prepared
+from src.scripts.metrics.metrics import instrument_redis
+from src.scripts.model_prediction import model_prediction
+from src.scripts.model_prediction.model_prediction import open_weather_models, predict_hourly_city_weather
+from src.scripts.model_registry.model_registry import get_model_file
+from src.scripts.model_training.harmonic.harmonic import create_harmonic_model
+from src.scripts.model_training.model_training import (PRODUCTS, get_product_config, get_product_frame,
+                                                       prepare_training_frame, apply_training_window)
+from src.scripts.tracing.tracing import trace_redis
+
+# Micro-benchmarks of the hot paths, in the spirit of pytest-benchmark: every
+# case is calibrated to rounds of at least a millisecond, timed for --rounds
+# rounds after a warmup, and reported as min/median/mean/stddev/max per call.
+#
+#   PYTHONPATH=. python -m benchmarks.hot_paths --save bench.json
+#   PYTHONPATH=. python -m benchmarks.hot_paths --baseline bench.json --save new.json
+#
+# With --baseline the medians are compared to a stored run, cases slower by
+# more than --threshold are flagged and the exit status is 1.
+#
+# The Redis helpers run against fakeredis (--redis fake, needs the fakeredis
+# package) or a local redis-server (--redis redis://localhost:6379/15, the
+# database is flushed), seeded with the cities of data/cities and synthetic
+# cities up to each --catalogs size. Each call connects as the API does.
+#
+# The models are fitted by the fit cases on the last --window-days of the
+# city dataset, shifted by whole days to end at the current hour so forecast
+# horizons are measured from a fresh model, and saved to a temporary models
+# directory in the flat layout, which is not cached: open_weather_models loads
+# them from disk on every call.
+
+GROUPS = ['names', 'redis', 'transform', 'fit', 'models', 'predict']
+
+CITIES_FILENAME = path.join('data', 'cities', 'cities.csv')
+DATASETS_DIR = path.join('data', 'datasets')
+
+QUERIES = ['N', 'Chi', 'new_york_city']
+SYLLABLES = ['an', 'bel', 'cor', 'dan', 'el', 'far', 'gar', 'hol', 'is', 'jor', 'kel', 'lan', 'mor', 'nor', 'or',
+             'port', 'quin', 'ros', 'san', 'tor', 'ul', 'ver', 'wes', 'yor', 'zan']
+
+# transform_raw_to_prepared's renames, reversed to write raw datasets.
+RAW_COLUMNS = {'timestamp': 'ts', 'feels_like': 'app_temp', 'clouds_percentage': 'clouds',
+               'sun_horison_angle': 'elev_angle', 'precipitation': 'precip', 'pressure': 'pres', 'humidity': 'rh',
+               'wind_speed': 'wind_spd', 'wind_direction': 'wind_dir'}
+
+
+def time_call(function, iterations):
+    started = perf_counter()
+    for _ in range(iterations):
+        function()
+    return perf_counter() - started
+
+
+def calibrate(function, min_round_s):
+    # Iterations per round, so fast calls are not timed below the clock's
+    # resolution.
+    iterations = 1
+    while True:
+        seconds = time_call(function, iterations)
+        if seconds >= min_round_s or iterations >= 1_000_000:
+            return iterations
+        iterations *= 10 if seconds < min_round_s / 10 else 2
+
+
+def bench(name, group, function, params=None, rounds=5, warmup=1, min_round_s=0.001):
+    for _ in range(warmup):
+        function()
+    iterations = calibrate(function, min_round_s) if warmup else 1
+    times = [time_call(function, iterations) / iterations for _ in range(rounds)]
+    result = {
+        'name': name + (f"[{'-'.join(str(value) for value in params.values())}]" if params else ''),
+        'group': group,
+        'params': params or {},
+        'stats': {
+            'rounds': rounds,
+            'iterations': iterations,
+            'min_ms': round(min(times) * 1000, 6),
+            'median_ms': round(median(times) * 1000, 6),
+            'mean_ms': round(mean(times) * 1000, 6),
+            'stddev_ms': round(stdev(times) * 1000, 6) if rounds > 1 else 0.,
+            'max_ms': round(max(times) * 1000, 6),
+            'ops': round(1 / mean(times), 3)
+        }
+    }
+    logging.info(f"{result['name']}: median {result['stats']['median_ms']:.3f} ms")
+    return result
+
+
+def read_cities():
+    with open(CITIES_FILENAME) as file:
+        return list(DictReader(file))
+
+
+def synthetic_cities(size, seed=0):
+    # The real cities, then unique made-up ones with the same fields.
+    cities = read_cities()[:size]
+    names = {city['name'] for city in cities}
+    rng = random.Random(seed)
+    while len(cities) < size:
+        name = ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))).capitalize()
+                        for _ in range(rng.randint(1, 2)))
+        if name in names:
+            name = f"{name} {len(cities)}"
+        names.add(name)
+        cities.append({'name': name, 'country': 'USA', 'zip_code': f"{rng.randint(10000, 99999)}",
+                       'lon': f"{rng.uniform(-125, -67):.4f}", 'lat': f"{rng.uniform(25, 49):.4f}",
+                       'utc_time_difference': str(rng.randint(-8, -5))})
+    return cities
+
+
+def create_redis_client(redis_url):
+    # A client factory for the stand-in, fakeredis shares one in-memory server.
+    if redis_url == 'fake':
+        try:
+            from fakeredis import FakeRedis, FakeServer
+        except ImportError:
+            sys.exit("--redis fake needs the fakeredis package, or pass --redis redis://localhost:6379/15")
+        server = FakeServer()
+        return lambda: FakeRedis(server=server)
+    from redis import Redis
+    return lambda: Redis.from_url(redis_url)
+
+
+def seed_catalog(redis_cnt, cities, batch=10_000):
+    redis_cnt.flushdb()
+    for start in range(0, len(cities), batch):
+        pipe = redis_cnt.pipeline(transaction=False)
+        for city in cities[start:start + batch]:
+            pipe.hset(city['name'], mapping={key: city[key] for key in hash_table_city_keys})
+            pipe.zadd('city_names', {city['name']: 0})
+        pipe.execute()
+
+
+def connected_to(create_client):
+    # Routes get.py's connections to the stand-in, instrumented as in the API.
+    return patch.object(get, 'connect_to_redis',
+                        lambda host, port: trace_redis(instrument_redis(create_client())))
+
+
+def bench_names(args):
+    return [bench('construct_searchable_city_names', 'names', lambda: construct_searchable_city_names(query),
+                  {'query': query}, args.rounds) for query in QUERIES]
+
+
+def bench_redis(args, create_client, catalogs):
+    results = []
+    for size in catalogs:
+        started = perf_counter()
+        seed_catalog(create_client(), synthetic_cities(size))
+        logging.info(f"Seeded {size} cities in {perf_counter() - started:.1f} s")
+        with connected_to(create_client):
+            for query in QUERIES:
+                results.append(bench('get_city', 'redis', lambda: get_city(query, 1, 6),
+                                     {'catalog': size, 'query': query}, args.rounds))
+            results.append(bench('get_city', 'redis', lambda: get_city('Chicago', 0, 1, exact_match=True),
+                                 {'catalog': size, 'query': 'exact'}, args.rounds))
+            results.append(bench('get_all_cities', 'redis', lambda: get_all_cities(1, 6), {'catalog': size},
+                                 args.rounds))
+            results.append(bench('get_number_of_cities', 'redis', lambda: get_number_of_cities('New'),
+                                 {'catalog': size}, args.rounds))
+    return results
+
+
+def read_shifted_dataset(city_name, window_days):
+    df = apply_training_window(pd.read_csv(path.join(DATASETS_DIR, city_name, f'{city_name}.csv')), window_days)
+    day = 24 * 60 * 60
+    now = int(time()) // 3600 * 3600
+    return df.assign(timestamp=df['timestamp'] + (now - int(df['timestamp'].max())) // day * day)
+
+
+def bench_transform(args, df, workdir):
+    raw = df.drop(columns=['day_sin', 'day_cos', 'year_sin', 'year_cos']).rename(columns=RAW_COLUMNS)
+    raw_filename, output_filename = path.join(workdir, 'raw.csv'), path.join(workdir, 'prepared.csv')
+    raw.assign(snow=0., vis=10.).to_csv(raw_filename, index=False)
+    return [bench('transform_raw_to_prepared', 'transform',
+                  lambda: transform_raw_to_prepared(raw_filename, output_filename), {'rows': len(raw)}, args.rounds)]
+
+
+def bench_fit(args, df, city_dir):
+    # Fits and saves every product's model, as the training does.
+    frame = prepare_training_frame(df)
+    results = []
+    for product, create_model in PRODUCTS.items():
+        filename = path.join(city_dir, get_model_file(product))
+        product_frame = get_product_frame(frame, product)
+        results.append(bench(f'fit.{create_model.__name__}', 'fit',
+                             lambda: create_model(product_frame, filename, config=get_product_config(product)),
+                             {'product': product, 'rows': len(frame)}, args.fit_rounds, warmup=0))
+    product_frame = get_product_frame(frame, 'temp')
+    results.append(bench('fit.create_harmonic_model', 'fit',
+                         lambda: create_harmonic_model(product_frame, path.join(city_dir, 'temp.harmonic.npz')),
+                         {'product': 'temp', 'rows': len(frame)}, args.fit_rounds, warmup=0))
+    return results
+
+
+def bench_models(args, city_name, hours):
+    return [bench('open_weather_models', 'models', lambda: open_weather_models(city_name, hours, global_params=()),
+                  {'city': city_name}, args.rounds)]
+
+
+def bench_predict(args, city_name):
+    return [bench('predict_hourly_city_weather', 'predict',
+                  lambda: predict_hourly_city_weather(city_name, hours, global_params=(), engines={}),
+                  {'city': city_name, 'hours': hours}, args.predict_rounds) for hours in args.hours]
+
+
+def run(args):
+    groups = set(args.groups)
+    create_client = create_redis_client(args.redis) if groups & {'redis', 'models', 'predict'} else None
+    results = bench_names(args) if 'names' in groups else []
+    if 'redis' in groups:
+        results += bench_redis(args, create_client, args.catalogs)
+    if not groups & {'transform', 'fit', 'models', 'predict'}:
+        return results
+
+    df = read_shifted_dataset(args.city, args.window_days)
+    with tempfile.TemporaryDirectory() as workdir:
+        if 'transform' in groups:
+            results += bench_transform(args, df, workdir)
+        if not groups & {'fit', 'models', 'predict'}:
+            return results
+
+        city_dir = path.join(workdir, 'models', args.city)
+        makedirs(city_dir)
+        fits = bench_fit(args, df, city_dir)
+        results += fits if 'fit' in groups else []
+        if not groups & {'models', 'predict'}:
+            return results
+        seed_catalog(create_client(), read_cities())
+        with connected_to(create_client), patch.object(model_prediction, 'MODELS_DIR', path.join(workdir, 'models')):
+            if 'models' in groups:
+                results += bench_models(args, args.city, max(args.hours))
+            if 'predict' in groups:
+                results += bench_predict(args, args.city)
+    return results
+
+
+def describe_run(results, args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'machine': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': cpu_count()},
+        'commit': commit,
+        'datetime': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'options': {'redis': 'fake' if args.redis == 'fake' else 'redis', 'window_days': args.window_days},
+        'benchmarks': results
+    }
+
+
+def compare(run_results, baseline, threshold):
+    # Median of each case against the baseline's, slower than 1 + threshold
+    # times it is a regression.
+    baseline_medians = {result['name']: result['stats']['median_ms'] for result in baseline['benchmarks']}
+    comparisons = []
+    for result in run_results['benchmarks']:
+        previous = baseline_medians.get(result['name'])
+        if not previous:
+            continue
+        ratio = result['stats']['median_ms'] / previous
+        comparisons.append({'name': result['name'], 'baseline_ms': previous, 'median_ms': result['stats']['median_ms'],
+                            'ratio': round(ratio, 3), 'regression': ratio > 1 + threshold})
+    return comparisons
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the API and training hot paths")
+    parser.add_argument('--groups', nargs='+', choices=GROUPS, default=GROUPS)
+    parser.add_argument('--redis', default='fake', help="'fake' for fakeredis or a redis:// URL (flushed)")
+    parser.add_argument('--catalogs', nargs='+', type=int, default=[31, 10_000],
+                        help="city catalog sizes, e.g. 31 10000 1000000")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--window-days', type=int, default=90)
+    parser.add_argument('--hours', nargs='+', type=int, default=[24, 168, 240])
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--predict-rounds', type=int, default=5)
+    parser.add_argument('--fit-rounds', type=int, default=1)
+    parser.add_argument('--save', help="JSON file to save the results to")
+    parser.add_argument('--baseline', help="JSON results of a previous run to compare to")
+    parser.add_argument('--threshold', type=float, default=0.2, help="median slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    run_results = describe_run(run(args), args)
+    if args.save:
+        with open(args.save, 'w') as file:
+            file.write(dumps(run_results, indent=2))
+    for result in run_results['benchmarks']:
+        stats = result['stats']
+        print(f"{result['name']:<60} median {stats['median_ms']:>12.4f} ms  "
+              f"min {stats['min_ms']:>12.4f} ms  stddev {stats['stddev_ms']:>10.4f} ms")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            comparisons = compare(run_results, loads(file.read()), args.threshold)
+        regressions = [comparison for comparison in comparisons if comparison['regression']]
+        for comparison in comparisons:
+            flag = 'REGRESSION' if comparison['regression'] else ''
+            print(f"{comparison['name']:<60} {comparison['baseline_ms']:>12.4f} -> {comparison['median_ms']:>12.4f} ms "
+                  f"x{comparison['ratio']:<6} {flag}")
+        print(dumps({'compared': len(comparisons), 'regressions': len(regressions)}))
+        sys.exit(1 if regressions else 0)
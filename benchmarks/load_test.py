@@ -0,0 +1,394 @@
+import argparse
+import logging
+import random
+import subprocess
+import sys
+import threading
+
+from collections import Counter
+from csv import DictReader
+from datetime import datetime, timezone
+from json import dumps
+from math import ceil
+from os import environ, listdir, path
+from queue import Queue, Empty
+from time import perf_counter, sleep
+from urllib.parse import urlsplit
+
+import numpy as np
+import requests
+
+# End to end load test of the API with an SLO report, on one box and offline.
+# Clients replay a mix of city searches typed letter by letter, paginated
+# listings, totals and forecasts, the forecast cities drawn from a Zipf law
+# (a few cities get most of the traffic) and the horizons from --hours. Each
+# route gets its throughput, p50/p95/p99 and error and shed (503) rates, which
+# are checked against the --slo targets, the exit status is 1 if one fails.
+#
+# Against a running API and the Redis it reads (seeded by src/redis/seed):
+#
+#   python -m benchmarks.load_test --url http://localhost:4000 --duration 60
+#
+# Or start the API here, gunicorn (--start wsgi) or uvicorn (--start asgi),
+# on the models of --models-dir and wait for /readyz. --seed loads
+# data/cities into the --redis database first, which is flushed:
+#
+#   python -m benchmarks.load_test --start wsgi --seed --rate 20 --duration 120
+#
+# Without --rate every client sends its next request as soon as the previous
+# one is answered (closed loop), the throughput is then the capacity of the
+# API. With --rate requests arrive at that mean rate whatever the API's
+# latency (open loop) and their latency counts from their arrival, including
+# the wait for a free client, so a saturated API shows in the tail instead of
+# slowing the load down. On one CPU the clients share it with the API, keep
+# --clients low.
+
+ROUTES = {
+    'search': '/cities/<city_name>',
+    'listing': '/cities/',
+    'total': '/cities/total/<city_name>',
+    'forecast': '/predict/<city_name>/<prediction_hours>'
+}
+
+DEFAULT_MIX = 'search=55,listing=15,total=10,forecast=20'
+DEFAULT_SLOS = ['search.p99_ms=250', 'listing.p99_ms=250', 'total.p99_ms=250', 'forecast.p95_ms=5000',
+                'forecast.p99_ms=10000', 'all.error_rate=0.01', 'all.shed_rate=0.05']
+
+CITIES_FILENAME = path.join('data', 'cities', 'cities.csv')
+MODELS_DIR = path.join('data', 'models')
+LISTING_LIMITS = [6, 12, 24]
+SEARCH_LIMIT = 6
+
+
+def parse_mix(mix):
+    weights = {}
+    for pair in mix.split(','):
+        route, _, weight = pair.partition('=')
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Unknown route '{route}', expected one of {', '.join(ROUTES)}")
+        weights[route] = float(weight)
+    return weights
+
+
+def parse_slo(slo):
+    # route.metric=target, e.g. forecast.p99_ms=5000 or all.error_rate=0.01.
+    # Targets of the *_rps metrics are minimums, the others maximums.
+    try:
+        name, target = slo.split('=')
+        route, metric = name.split('.')
+        target = float(target)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid SLO '{slo}', expected route.metric=target")
+    if route not in ROUTES and route != 'all':
+        raise argparse.ArgumentTypeError(f"Unknown route '{route}' in SLO '{slo}'")
+    return route, metric, target
+
+
+def zipf_weights(size, exponent):
+    return [1 / rank ** exponent for rank in range(1, size + 1)]
+
+
+def read_city_names():
+    with open(CITIES_FILENAME) as file:
+        return [row['name'] for row in DictReader(file)]
+
+
+def url_name(city_name):
+    return city_name.lower().replace(' ', '_')
+
+
+def find_forecast_cities(city_names, models_dir):
+    # The catalog cities with models, in the catalog's order.
+    if not path.isdir(models_dir):
+        return []
+    with_models = set(listdir(models_dir))
+    return [url_name(name) for name in city_names if url_name(name) in with_models]
+
+
+def create_workload(args, city_names, forecast_cities):
+    mix = args.mix
+    if mix.get('forecast') and not forecast_cities:
+        sys.exit(f"No forecast cities, pass --forecast-cities or models in {args.models_dir}")
+    return {
+        'routes': list(mix), 'route_weights': list(mix.values()),
+        'cities': city_names, 'city_weights': zipf_weights(len(city_names), args.zipf),
+        'forecast_cities': forecast_cities, 'forecast_weights': zipf_weights(len(forecast_cities), args.zipf),
+        'hours': args.hours
+    }
+
+
+def search_path(rng, city_name):
+    # One keystroke of a search: users stop typing at any letter, short
+    # prefixes, which match the most cities, are the most frequent.
+    typed = rng.randint(1, len(city_name))
+    prefix = url_name(city_name[:rng.randint(1, typed)]).rstrip('_')
+    return f"/cities/{prefix}?page=1&limit={SEARCH_LIMIT}"
+
+
+def listing_path(rng, size):
+    limit = rng.choice(LISTING_LIMITS)
+    pages = ceil(size / limit)
+    page = rng.choices(range(1, pages + 1), zipf_weights(pages, 1.5))[0]
+    return f"/cities/?page={page}&limit={limit}"
+
+
+def total_path(rng, city_name):
+    if rng.random() < 0.5:
+        return "/cities/total/"
+    return f"/cities/total/{url_name(city_name[:rng.randint(1, 3)]).rstrip('_')}"
+
+
+def next_request(rng, workload):
+    route = rng.choices(workload['routes'], workload['route_weights'])[0]
+    if route == 'forecast':
+        city_name = rng.choices(workload['forecast_cities'], workload['forecast_weights'])[0]
+        return route, f"/predict/{city_name}/{rng.choice(workload['hours'])}"
+    if route == 'listing':
+        return route, listing_path(rng, len(workload['cities']))
+    city_name = rng.choices(workload['cities'], workload['city_weights'])[0]
+    return route, search_path(rng, city_name) if route == 'search' else total_path(rng, city_name)
+
+
+def send(session, url, request_path, timeout):
+    # The outcome of a request: shed 503s apart from the errors, stale
+    # forecasts served under overload count as degraded successes.
+    try:
+        response = session.get(url + request_path, timeout=timeout)
+    except requests.RequestException:
+        return 'error', None
+    if response.status_code in (200, 304):
+        return 'degraded' if 'X-Forecast-Degraded' in response.headers else 'ok', response.status_code
+    if response.status_code == 503 and 'Retry-After' in response.headers:
+        return 'shed', response.status_code
+    return 'error', response.status_code
+
+
+def run_closed_loop(args, workload, started, records):
+    stop = threading.Event()
+
+    def client(seed):
+        rng = random.Random(seed)
+        with requests.Session() as session:
+            while not stop.is_set():
+                route, request_path = next_request(rng, workload)
+                sent = perf_counter()
+                outcome, status_code = send(session, args.url, request_path, args.timeout)
+                records.append((route, sent - started, perf_counter() - sent, outcome, status_code))
+
+    threads = [threading.Thread(target=client, args=(args.random_seed + i,), daemon=True)
+               for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    stop.wait(args.warmup + args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return 0
+
+
+def run_open_loop(args, workload, started, records):
+    # Poisson arrivals at args.rate, queued for the clients. Returns the
+    # requests still queued at the end, never sent.
+    arrivals = Queue()
+    stop = threading.Event()
+
+    def client():
+        with requests.Session() as session:
+            while not stop.is_set():
+                try:
+                    arrival, route, request_path = arrivals.get(timeout=0.1)
+                except Empty:
+                    continue
+                outcome, status_code = send(session, args.url, request_path, args.timeout)
+                records.append((route, arrival - started, perf_counter() - arrival, outcome, status_code))
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    rng = random.Random(args.random_seed)
+    end = started + args.warmup + args.duration
+    arrival = started
+    while True:
+        arrival += rng.expovariate(args.rate)
+        if arrival >= end:
+            break
+        sleep(max(0., arrival - perf_counter()))
+        route, request_path = next_request(rng, workload)
+        arrivals.put((arrival, route, request_path))
+    sleep(max(0., end - perf_counter()))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return arrivals.qsize()
+
+
+def summarize_route(records, seconds):
+    outcomes = Counter(record[3] for record in records)
+    # Latencies of the answered requests, degraded ones included.
+    latencies = np.array([record[2] for record in records if record[3] in ('ok', 'degraded')]) * 1000
+    summary = {
+        'requests': len(records),
+        'rps': round(len(records) / seconds, 2),
+        'ok_rps': round(len(latencies) / seconds, 2),
+        'error_rate': round(outcomes['error'] / len(records), 4) if records else 0.,
+        'shed_rate': round(outcomes['shed'] / len(records), 4) if records else 0.,
+        'degraded_rate': round(outcomes['degraded'] / len(records), 4) if records else 0.,
+        'statuses': {str(status_code): count for status_code, count in
+                     sorted(Counter(record[4] for record in records).items(), key=lambda item: str(item[0]))}
+    }
+    if len(latencies):
+        summary.update({f'p{q}_ms': round(float(np.percentile(latencies, q)), 1) for q in (50, 95, 99)})
+        summary['max_ms'] = round(float(latencies.max()), 1)
+    return summary
+
+
+def summarize(records, warmup, seconds, routes):
+    # Requests sent during the warmup are left out.
+    records = [record for record in records if record[1] >= warmup]
+    summaries = {route: summarize_route([record for record in records if record[0] == route], seconds)
+                 for route in routes}
+    summaries['all'] = summarize_route(records, seconds)
+    return summaries
+
+
+def check_slos(summaries, slos):
+    # SLOs of routes out of the mix are skipped, a missing metric, e.g. the
+    # percentiles of a route without a success, fails.
+    results = []
+    for route, metric, target in slos:
+        if route not in summaries:
+            continue
+        value = summaries[route].get(metric)
+        if value is None:
+            passed = False
+        elif metric.endswith('rps'):
+            passed = value >= target
+        else:
+            passed = value <= target
+        results.append({'slo': f"{route}.{metric}", 'target': target, 'value': value, 'passed': passed})
+    return results
+
+
+def check_redis(redis_url, seed):
+    from redis import Redis, RedisError
+
+    redis_cnt = Redis.from_url(redis_url)
+    try:
+        redis_cnt.ping()
+    except RedisError as e:
+        sys.exit(f"Redis at {redis_url} is not reachable ({e}), start a local redis-server first")
+    if seed:
+        from .hot_paths import read_cities, seed_catalog
+        seed_catalog(redis_cnt, read_cities())
+        logging.info(f"Seeded {redis_cnt.zcard('city_names')} cities into {redis_url}")
+
+
+def start_api(server, url, models_dir, log_filepath):
+    port = str(urlsplit(url).port or 80)
+    env = dict(environ, WEATHER_API_PORT=port)
+    env.setdefault('WEATHER_MODELS_DIR', path.abspath(models_dir) + '/')
+    if server == 'wsgi':
+        command = [sys.executable, '-m', 'gunicorn', '-c', path.join('src', 'api', 'gunicorn.conf.py'),
+                   'src.api.app:app']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'src.api.asgi:app', '--host', '127.0.0.1', '--port', port,
+                   '--log-level', 'warning']
+    with open(log_filepath, 'ab') as log_file:
+        return subprocess.Popen(command, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def stop_api(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def wait_until_ready(url, process, timeout):
+    # Polls /readyz, the models are warmed up before it turns 200.
+    deadline = perf_counter() + timeout
+    while perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"The API exited with status {process.returncode}, see its log")
+        try:
+            if requests.get(url + '/readyz', timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        sleep(0.5)
+    sys.exit(f"The API at {url} was not ready after {timeout} s")
+
+
+def run(args):
+    city_names = read_city_names()
+    forecast_cities = args.forecast_cities or find_forecast_cities(city_names, args.models_dir)
+    workload = create_workload(args, city_names, forecast_cities)
+    check_redis(args.redis, args.seed)
+
+    process = start_api(args.start, args.url, args.models_dir, args.api_log) if args.start else None
+    try:
+        wait_until_ready(args.url, process, args.ready_timeout)
+        records = []
+        started = perf_counter()
+        if args.rate:
+            unsent = run_open_loop(args, workload, started, records)
+        else:
+            unsent = run_closed_loop(args, workload, started, records)
+    finally:
+        if process is not None:
+            stop_api(process)
+
+    summaries = summarize(records, args.warmup, args.duration, workload['routes'])
+    return {
+        'datetime': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'options': {'url': args.url, 'server': args.start, 'mix': args.mix, 'clients': args.clients,
+                    'rate': args.rate, 'duration_s': args.duration, 'warmup_s': args.warmup,
+                    'forecast_cities': forecast_cities, 'hours': args.hours, 'zipf': args.zipf,
+                    'random_seed': args.random_seed},
+        'routes': {route: dict(summary, route=ROUTES.get(route, '*')) for route, summary in summaries.items()},
+        'unsent': unsent,
+        'slos': check_slos(summaries, args.slo)
+    }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="End to end load test of the API with an SLO report")
+    parser.add_argument('--url', default='http://localhost:4000')
+    parser.add_argument('--start', choices=['wsgi', 'asgi'], help="start the API, with gunicorn or uvicorn")
+    parser.add_argument('--api-log', default=path.join('/tmp', 'weather-load-test-api.log'))
+    parser.add_argument('--ready-timeout', type=float, default=300, help="seconds to wait for /readyz")
+    parser.add_argument('--redis', default='redis://redis:6379/0', help="the Redis the API reads")
+    parser.add_argument('--seed', action='store_true', help="flush the --redis database and load data/cities")
+    parser.add_argument('--models-dir', default=MODELS_DIR)
+    parser.add_argument('--forecast-cities', nargs='+', help="most popular first, default the cities with models")
+    parser.add_argument('--hours', nargs='+', type=int, default=[24, 48, 72, 120, 168, 240])
+    parser.add_argument('--zipf', type=float, default=1.1, help="exponent of the city popularity")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help="relative weights of the routes")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--rate', type=float, default=0, help="requests per second, open loop, 0 for a closed loop")
+    parser.add_argument('--duration', type=float, default=60, help="seconds measured")
+    parser.add_argument('--warmup', type=float, default=10, help="seconds of load before the measure")
+    parser.add_argument('--timeout', type=float, default=120, help="seconds per request")
+    parser.add_argument('--random-seed', type=int, default=0)
+    parser.add_argument('--slo', nargs='+', type=parse_slo, default=[parse_slo(slo) for slo in DEFAULT_SLOS])
+    parser.add_argument('--save', help="JSON file to save the report to")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.save:
+        with open(args.save, 'w') as file:
+            file.write(dumps(report, indent=2))
+    for route, summary in report['routes'].items():
+        latencies = '  '.join(f"{q} {summary[f'{q}_ms']:>9.1f} ms" for q in ('p50', 'p95', 'p99')
+                              if f'{q}_ms' in summary)
+        print(f"{route:<9} {summary['requests']:>7} requests {summary['rps']:>8.2f} rps  {latencies}  "
+              f"errors {summary['error_rate']:.2%}  shed {summary['shed_rate']:.2%}")
+    for slo in report['slos']:
+        print(f"{'PASS' if slo['passed'] else 'FAIL'}  {slo['slo']:<24} {slo['value']} (target {slo['target']:g})")
+    failed = [slo['slo'] for slo in report['slos'] if not slo['passed']]
+    print(dumps({'requests': report['routes']['all']['requests'], 'rps': report['routes']['all']['rps'],
+                 'unsent': report['unsent'], 'slos_failed': failed}))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,75 @@
+import argparse
+import threading
+
+from json import dumps
+from time import perf_counter
+
+import numpy as np
+import requests
+
+# City lookup latency of a running API with and without forecast traffic.
+# Forecast clients request forecasts back to back, enough of them keep every
+# forecast worker busy, while the city clients measure /cities lookups. Run it
+# against the WSGI server (gunicorn) and the ASGI one (uvicorn) on the same
+# models and Redis:
+#
+#   python -m benchmarks.mixed_load --url http://localhost:4000 --city chicago
+
+
+def run_clients(url, path, clients, stop, latencies, errors, shed=None):
+    # Shed (503) responses count apart from the errors, degraded ones as
+    # successes.
+    def client():
+        with requests.Session() as session:
+            while not stop.is_set():
+                started = perf_counter()
+                try:
+                    status_code = session.get(url + path, timeout=120).status_code
+                except requests.RequestException:
+                    status_code = None
+                if status_code == 200:
+                    latencies.append(perf_counter() - started)
+                elif status_code == 503 and shed is not None:
+                    shed.append(perf_counter() - started)
+                else:
+                    errors.append(path)
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def percentiles(latencies):
+    if not latencies:
+        return {'requests': 0}
+    ms = np.array(latencies) * 1000
+    return {'requests': len(ms), 'p50_ms': round(float(np.percentile(ms, 50)), 1),
+            'p99_ms': round(float(np.percentile(ms, 99)), 1), 'max_ms': round(float(ms.max()), 1)}
+
+
+def run_phase(url, city_name, hours, city_clients, forecast_clients, duration):
+    stop = threading.Event()
+    city_latencies, forecast_latencies, errors, shed = [], [], [], []
+    threads = run_clients(url, f'/predict/{city_name}/{hours}', forecast_clients, stop, forecast_latencies, errors,
+                          shed)
+    threads += run_clients(url, f'/cities/{city_name}', city_clients, stop, city_latencies, errors, shed)
+    stop.wait(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {'forecast_clients': forecast_clients, 'city': percentiles(city_latencies),
+            'forecast': percentiles(forecast_latencies), 'shed': percentiles(shed), 'errors': len(errors)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="City lookup latency under forecast load")
+    parser.add_argument('--url', default='http://localhost:4000')
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--hours', type=int, default=240)
+    parser.add_argument('--city-clients', type=int, default=4)
+    parser.add_argument('--forecast-clients', nargs='+', type=int, default=[0, 8])
+    parser.add_argument('--duration', type=float, default=20, help="seconds per phase")
+    args = parser.parse_args()
+
+    for forecast_clients in args.forecast_clients:
+        print(dumps(run_phase(args.url, args.city, args.hours, args.city_clients, forecast_clients, args.duration)))
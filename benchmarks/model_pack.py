@@ -0,0 +1,143 @@
+import argparse
+import logging
+import multiprocessing
+import queue
+import shutil
+import tempfile
+
+from json import dumps
+from os import path, makedirs
+from time import perf_counter
+
+import numpy as np
+
+from src.scripts.model_training.model_training import (PRODUCTS, load_training_dataset, prepare_product_df,
+                                                       get_model_filename)
+from src.scripts.model_pack.model_pack import build_model_pack, MODEL_PACK_FILENAME
+from src.scripts.model_registry.model_registry import get_model_file
+
+# Memory of API workers that hold every city's models, and the time a fresh
+# worker takes to load them: one deserialized model per file vs. one
+# memory-mapped model pack per city. All workers stay alive until each of them
+# has measured, so pages shared between them show up in PSS.
+
+MEMORY_FIELDS = {'Rss': 'rss_mb', 'Pss': 'pss_mb', 'Private_Clean': 'private_mb', 'Private_Dirty': 'private_mb'}
+
+
+def read_memory():
+    memory = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in MEMORY_FIELDS:
+                key = MEMORY_FIELDS[name]
+                memory[key] = memory.get(key, 0) + int(value.split()[0]) / 1024
+    return memory
+
+
+def prepare_cities(workdir, city_name, cities, window_days):
+    template = path.join(workdir, 'template')
+    makedirs(template)
+    df = load_training_dataset(city_name, window_days)
+    for product, create_model in PRODUCTS.items():
+        create_model(prepare_product_df(df, product), get_model_filename(template, product), slim=True)
+    build_model_pack(template, {product: get_model_file(product) for product in PRODUCTS})
+
+    city_dirs = []
+    for i in range(cities):
+        city_dir = path.join(workdir, f'city{i:04d}')
+        shutil.copytree(template, city_dir)
+        city_dirs.append(city_dir)
+    return city_dirs
+
+
+def load_city(city_dir, format):
+    from src.scripts.model_prediction.model_prediction import read_weather_model
+    from src.scripts.model_pack.model_pack import load_model_pack
+
+    if format == 'pack':
+        models = load_model_pack(path.join(city_dir, MODEL_PACK_FILENAME))
+        # Fault the mapped pages in, as serving forecasts would.
+        for model in models.values():
+            for value in vars(model).values():
+                if isinstance(value, np.ndarray):
+                    value.view(np.uint8).sum()
+        return models
+    return {product: read_weather_model(path.join(city_dir, get_model_file(product)), product)
+            for product in PRODUCTS}
+
+
+def worker(city_dirs, format, barrier, results):
+    import src.scripts.model_prediction.model_prediction  # noqa: F401, serving imports are not measured
+    baseline = read_memory()
+    started = perf_counter()
+    try:
+        models = [load_city(city_dir, format) for city_dir in city_dirs]
+    except Exception:
+        barrier.abort()
+        raise
+    load_time = perf_counter() - started
+    barrier.wait()
+    memory = read_memory()
+    results.put({
+        'load_time_s': round(load_time, 3),
+        **{key: round(value, 1) for key, value in memory.items()},
+        'models_mb': round(memory['rss_mb'] - baseline['rss_mb'], 1),
+        'models': sum(len(m) for m in models)
+    })
+    barrier.wait()
+
+
+def run_workers(city_dirs, format, workers):
+    context = multiprocessing.get_context('spawn')
+    barrier, results = context.Barrier(workers), context.Queue()
+    processes = [context.Process(target=worker, args=(city_dirs, format, barrier, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    measured = []
+    while len(measured) < workers:
+        if any(process.exitcode not in (None, 0) for process in processes):
+            raise RuntimeError(f"A '{format}' worker failed")
+        try:
+            measured.append(results.get(timeout=1))
+        except queue.Empty:
+            pass
+    for process in processes:
+        process.join()
+    return measured
+
+
+def run(city_name, cities_counts, formats, workers, window_days):
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        city_dirs = prepare_cities(workdir, city_name, max(cities_counts), window_days)
+        for cities in cities_counts:
+            for format in formats:
+                measured = run_workers(city_dirs[:cities], format, workers)
+                results.append({
+                    'format': format,
+                    'cities': cities,
+                    'workers': workers,
+                    'models_per_worker': measured[0]['models'],
+                    'cold_load_s': max(m['load_time_s'] for m in measured),
+                    'rss_mb_per_worker': max(m['rss_mb'] for m in measured),
+                    'pss_mb_per_worker': max(m['pss_mb'] for m in measured),
+                    'private_mb_per_worker': max(m['private_mb'] for m in measured),
+                    'models_rss_mb_per_worker': max(m['models_mb'] for m in measured)
+                })
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Worker memory and cold load time, model files vs. model packs")
+    parser.add_argument('--city', default='chicago', help="city whose models are replicated")
+    parser.add_argument('--cities', nargs='+', type=int, default=[31, 1000])
+    parser.add_argument('--formats', nargs='+', default=['files', 'pack'], choices=['files', 'pack'])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--window-days', type=int, default=365)
+    args = parser.parse_args()
+
+    for result in run(args.city, args.cities, args.formats, args.workers, args.window_days):
+        print(dumps(result))
@@ -0,0 +1,77 @@
+import argparse
+import logging
+import tempfile
+import tracemalloc
+
+from json import dumps
+from os import path
+from statistics import median
+from time import perf_counter
+
+from src.scripts.model_training.model_training import (PRODUCTS, read_city_dataset,
+                                                       apply_training_window, prepare_product_df)
+from src.scripts.model_training.utils.utils import load_prophet_model
+
+# File size, load time, load memory and forecast latency of Prophet models
+# trained on different windows, saved with and without their history.
+
+def measure_load(filename, repeats):
+    times = []
+    for _ in range(repeats):
+        started = perf_counter()
+        load_prophet_model(filename)
+        times.append(perf_counter() - started)
+
+    tracemalloc.start()
+    model = load_prophet_model(filename)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return model, median(times), peak
+
+
+def measure_forecast(model, hours, repeats):
+    times = []
+    for _ in range(repeats):
+        started = perf_counter()
+        model.predict(model.make_future_dataframe(periods=hours, freq='h'))
+        times.append(perf_counter() - started)
+    return median(times)
+
+
+def run(city_name, product, windows, forecast_hours, repeats):
+    df = read_city_dataset(city_name)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for window_days in windows:
+            product_df = prepare_product_df(apply_training_window(df, window_days), product)
+            for slim in (False, True):
+                filename = path.join(workdir, f'{product}_{window_days}_{slim}.json')
+                PRODUCTS[product](product_df, filename, slim=slim)
+                model, load_time, load_peak = measure_load(filename, repeats)
+                results.append({
+                    'product': product,
+                    'window_days': window_days,
+                    'rows': len(product_df),
+                    'format': 'slim' if slim else 'full',
+                    'file_bytes': path.getsize(filename),
+                    'load_time_ms': round(load_time * 1000, 2),
+                    'load_peak_bytes': load_peak,
+                    'forecast_time_ms': round(measure_forecast(model, forecast_hours, repeats) * 1000, 2)
+                })
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Model size and load time by training window and format")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--product', default='temp', choices=[p for p in PRODUCTS if p != 'weather_description'])
+    parser.add_argument('--windows', nargs='+', type=int, default=[0, 365, 90],
+                        help="window sizes in days, 0 for the whole dataset")
+    parser.add_argument('--forecast-hours', type=int, default=168)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    windows = [w or None for w in args.windows]
+    for result in run(args.city, args.product, windows, args.forecast_hours, args.repeats):
+        print(dumps(result))
@@ -0,0 +1,49 @@
+import argparse
+
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from time import perf_counter
+
+import numpy as np
+import requests
+
+# A burst of concurrent forecast requests for one city, as at the top of the
+# hour, against a running API: wall time of the burst and request latencies.
+# Compare a server started with WEATHER_SINGLE_FLIGHT=off to one with
+# coalescing, e.g.
+#
+#   python -m benchmarks.single_flight --url http://localhost:4000 --clients 64
+
+
+def request_forecast(url, city_name, hours):
+    started = perf_counter()
+    ok = requests.get(f'{url}/predict/{city_name}/{hours}', timeout=600).status_code == 200
+    return ok, perf_counter() - started
+
+
+def run_burst(url, city_name, hours, clients):
+    horizons = [hours[i % len(hours)] for i in range(clients)]
+    started = perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda h: request_forecast(url, city_name, h), horizons))
+    wall_time = perf_counter() - started
+    latencies = np.array([seconds for ok, seconds in results if ok]) * 1000
+    return {
+        'clients': clients,
+        'horizons': hours,
+        'wall_time_s': round(wall_time, 2),
+        'failed': sum(not ok for ok, _ in results),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        'p99_ms': round(float(np.percentile(latencies, 99)), 1) if len(latencies) else None
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Burst of concurrent forecasts for one city")
+    parser.add_argument('--url', default='http://localhost:4000')
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--hours', nargs='+', type=int, default=[24, 48, 240])
+    parser.add_argument('--clients', type=int, default=64)
+    args = parser.parse_args()
+
+    print(dumps(run_burst(args.url, args.city, args.hours, args.clients)))
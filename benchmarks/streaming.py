@@ -0,0 +1,76 @@
+import argparse
+import subprocess
+import sys
+import threading
+
+from json import dumps, loads
+from os import sysconf
+from time import perf_counter
+
+# Buffered vs NDJSON forecasts of growing horizons: time to the first byte,
+# total time, body size and the request's peak RSS over the RSS before it.
+# Every measurement runs in a fresh process calling the Flask app in process
+# (no network), after a warmup forecast, with the city's models under
+# WEATHER_MODELS_DIR and its Redis entry reachable:
+#
+#   WEATHER_MODELS_DIR=data/models/ python -m benchmarks.streaming --city chicago
+
+PAGE_SIZE = sysconf('SC_PAGE_SIZE')
+
+
+def read_rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def sample_peak_rss(stop, peak):
+    while not stop.wait(0.002):
+        peak[0] = max(peak[0], read_rss())
+
+
+def measure(city_name, hours, mode):
+    from src.api.app import app
+
+    client = app.test_client()
+    query = '?format=ndjson' if mode == 'ndjson' else ''
+    client.get(f'/predict/{city_name}/24{query}').close()
+
+    stop, before = threading.Event(), read_rss()
+    peak = [before]
+    sampler = threading.Thread(target=sample_peak_rss, args=(stop, peak), daemon=True)
+    sampler.start()
+
+    started = perf_counter()
+    response = client.get(f'/predict/{city_name}/{hours}{query}', buffered=False)
+    chunks = iter(response.response)
+    size, first_byte = 0, None
+    for chunk in chunks:
+        if chunk and first_byte is None:
+            first_byte = perf_counter() - started
+        size += len(chunk)
+    total = perf_counter() - started
+    response.close()
+    stop.set()
+    sampler.join()
+    peak[0] = max(peak[0], read_rss())
+
+    return {'mode': mode, 'hours': hours, 'status': response.status_code, 'bytes': size,
+            'ttfb_ms': round(first_byte * 1000, 1), 'total_ms': round(total * 1000, 1),
+            'peak_rss_growth_mb': round((peak[0] - before) / 2 ** 20, 1)}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Buffered vs streamed forecasts: TTFB and peak RSS")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--hours', nargs='+', type=int, default=[24, 720, 2160])
+    parser.add_argument('--measure', nargs=2, metavar=('MODE', 'HOURS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(dumps(measure(args.city, int(args.measure[1]), args.measure[0])))
+    else:
+        for hours in args.hours:
+            for mode in ['buffered', 'ndjson']:
+                output = subprocess.check_output([sys.executable, '-m', 'benchmarks.streaming', '--city', args.city,
+                                                  '--measure', mode, str(hours)])
+                print(dumps(loads(output.decode().strip().splitlines()[-1])))
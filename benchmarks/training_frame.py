@@ -0,0 +1,80 @@
+import argparse
+import logging
+import tracemalloc
+
+from json import dumps
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from src.scripts.model_training.model_training import (PRODUCTS, read_city_dataset, prepare_product_df,
+                                                       prepare_training_frame, get_product_frame)
+
+# Time and peak allocations of preparing the model inputs of every product
+# out of one city dataset: a renamed and re-parsed copy per product vs. views
+# of one typed training frame. Extra products are simulated by copying the
+# numeric columns under new names.
+
+
+def add_products(df, products):
+    numeric = [p for p in PRODUCTS if p != 'weather_description']
+    extra = {}
+    for i in range(products - len(PRODUCTS)):
+        column = numeric[i % len(numeric)]
+        extra[f'{column}_{i}'] = df[column]
+    return pd.concat([df, pd.DataFrame(extra)], axis=1), list(PRODUCTS) + list(extra)
+
+
+def prepare_copies(df, products):
+    for product in products:
+        prepare_product_df(df, product)
+
+
+def prepare_views(df, products):
+    frame = prepare_training_frame(df)
+    for product in products:
+        get_product_frame(frame, product)
+
+
+def measure(prepare, df, products, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        prepare(df, products)
+        timings.append(perf_counter() - started)
+    tracemalloc.start()
+    prepare(df, products)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return float(np.median(timings)), peak
+
+
+def run(city_name, product_counts, repeat):
+    dataset = read_city_dataset(city_name)
+    results = []
+    for products in product_counts:
+        df, names = add_products(dataset, products)
+        for name, prepare in (('copies', prepare_copies), ('frame', prepare_views)):
+            seconds, peak = measure(prepare, df, names, repeat)
+            results.append({
+                'method': name,
+                'products': len(names),
+                'rows': len(df),
+                'dataset_mb': round(df.memory_usage(deep=True).sum() / 2 ** 20, 2),
+                'prepare_ms': round(seconds * 1000, 2),
+                'peak_alloc_mb': round(peak / 2 ** 20, 2)
+            })
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Model input preparation, per product copies vs. one training frame")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--products', nargs='+', type=int, default=[10, 40, 160])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for result in run(args.city, args.products, args.repeat):
+        print(dumps(result))
@@ -0,0 +1,77 @@
+import argparse
+import logging
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from json import dumps
+from os import path
+from statistics import median
+from time import perf_counter
+
+from src.scripts.model_training.model_training import PRODUCTS, read_city_dataset, prepare_product_df
+from src.scripts.model_training.utils.utils import load_sklearn_model
+from src.scripts.tree_model.tree_model import load_tree_model
+
+# Load and batch predict latency of the weather_description tree, pickled
+# sklearn model vs. the memory-mapped .npz export, and the import cost of
+# each serving path measured in a fresh interpreter.
+
+IMPORT_SNIPPETS = {
+    'pickle': 'import sklearn.tree',
+    'npz': 'import src.scripts.tree_model.tree_model'
+}
+
+
+def timed(function, repeats):
+    times = []
+    for _ in range(repeats):
+        started = perf_counter()
+        result = function()
+        times.append(perf_counter() - started)
+    return result, median(times)
+
+
+def measure_import(snippet):
+    code = f'from time import perf_counter; s = perf_counter(); {snippet}; print(perf_counter() - s)'
+    return float(subprocess.check_output([sys.executable, '-c', code]).decode())
+
+
+def run(city_name, rows, repeats):
+    df = prepare_product_df(read_city_dataset(city_name), 'weather_description')
+    x = df.drop(columns=['y', 'ds'])
+    batch = x.sample(rows, replace=True, random_state=0)
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        loaders = {'pickle': load_sklearn_model, 'npz': load_tree_model}
+        predictions = {}
+        for name, load in loaders.items():
+            filename = path.join(workdir, f'weather_description.{"pkl" if name == "pickle" else name}')
+            PRODUCTS['weather_description'](df, filename)
+            model, load_time = timed(lambda: load(filename), repeats)
+            predictions[name], predict_time = timed(lambda: model.predict(batch), repeats)
+            results.append({
+                'format': name,
+                'file_bytes': path.getsize(filename),
+                'import_time_ms': round(measure_import(IMPORT_SNIPPETS[name]) * 1000, 2),
+                'load_time_us': round(load_time * 1e6, 1),
+                'predict_time_us': round(predict_time * 1e6, 1),
+                'rows': rows
+            })
+    assert np.array_equal(predictions['pickle'], predictions['npz']), "predictions differ"
+    return results
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="weather_description tree: pickle vs memory-mapped .npz")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    for result in run(args.city, args.rows, args.repeats):
+        print(dumps(result))
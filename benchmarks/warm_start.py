@@ -0,0 +1,77 @@
+import argparse
+import logging
+import tempfile
+
+from json import dumps
+from os import path
+from time import perf_counter
+
+import numpy as np
+
+from src.scripts.model_training.model_training import (PRODUCTS, read_city_dataset,
+                                                       prepare_product_df)
+from src.scripts.model_training.utils.utils import get_fit_stats
+
+# Compare a cold refit with a warm start from "yesterday's" model, i.e. a model
+# fitted on the same dataset without its last new_hours rows.
+
+def fit_timed(create_model, df, model_filename, warm_start_filename=None):
+    started = perf_counter()
+    model = create_model(df, model_filename, warm_start_filename=warm_start_filename)
+    return model, perf_counter() - started
+
+
+def forecast(model, hours):
+    future = model.make_future_dataframe(periods=hours, freq='h', include_history=False)
+    return model.predict(future)['yhat'].to_numpy()
+
+
+def benchmark_product(df, product, new_hours, forecast_hours, workdir):
+    create_model = PRODUCTS[product]
+    product_df = prepare_product_df(df, product)
+    previous_df = product_df.iloc[:-new_hours]
+
+    previous_filename = path.join(workdir, f'{product}_previous.json')
+    fit_timed(create_model, previous_df, previous_filename)
+
+    cold, cold_time = fit_timed(create_model, product_df, path.join(workdir, f'{product}_cold.json'))
+    warm, warm_time = fit_timed(create_model, product_df, path.join(workdir, f'{product}_warm.json'),
+                                warm_start_filename=previous_filename)
+
+    cold_forecast = forecast(cold, forecast_hours)
+    warm_forecast = forecast(warm, forecast_hours)
+    drift = np.abs(cold_forecast - warm_forecast)
+
+    return {
+        'product': product,
+        'rows': len(product_df),
+        'cold_fit_time': round(cold_time, 3),
+        'warm_fit_time': round(warm_time, 3),
+        'speedup': round(cold_time / warm_time, 2),
+        'cold_iterations': get_fit_stats(cold)['fit_iterations'],
+        'warm_iterations': get_fit_stats(warm)['fit_iterations'],
+        'warm_started': get_fit_stats(warm)['warm_started'],
+        'forecast_drift_mean': round(float(drift.mean()), 4),
+        'forecast_drift_max': round(float(drift.max()), 4),
+        'forecast_drift_relative': round(float(drift.mean() / product_df['y'].std()), 4)
+    }
+
+
+def run(city_name, products, new_hours, forecast_hours):
+    df = read_city_dataset(city_name)
+    with tempfile.TemporaryDirectory() as workdir:
+        return [benchmark_product(df, product, new_hours, forecast_hours, workdir)
+                for product in products]
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description="Fit time and forecast drift of warm vs cold Prophet retraining")
+    parser.add_argument('--city', default='chicago')
+    parser.add_argument('--products', nargs='+', default=['temp', 'pressure', 'wind_speed'])
+    parser.add_argument('--new-hours', type=int, default=24, help="rows added since the previous model")
+    parser.add_argument('--forecast-hours', type=int, default=168)
+    args = parser.parse_args()
+
+    for result in run(args.city, args.products, args.new_hours, args.forecast_hours):
+        print(dumps(result))
@@ -1,8 +1,21 @@
 import flask
 
+from functools import partial, wraps
 from json import loads
 from flask import make_response, jsonify, request
-from ..scripts.model_prediction.model_prediction import predict_hourly_city_weather
+from .conditional import forecast_validators, is_not_modified, parse_since, parse_engine, filter_since
+from .envelope import construct_envelope, construct_overload_envelope, construct_degraded_headers
+from .streaming import STREAM_MEDIA_TYPE, wants_stream, stream_forecast, ndjson_lines
+from ..scripts.admission.admission import (admit, release, admission, retry_after, remember_forecast,
+                                           stale_forecast, get_admission_stats)
+from ..scripts.forecast_resolution.forecast_resolution import parse_resolution, resample_city_forecast
+from ..scripts.metrics.metrics import start_request, finish_request, generate_metrics
+from ..scripts.model_warmup.model_warmup import WARMUP_STATE
+from ..scripts.profiling.profiling import (PROFILE_HEADER, PROFILE_ID_HEADER, start_profile, admin_status,
+                                           list_profiles, read_profile)
+from ..scripts.single_flight.single_flight import coalesced_forecast, SINGLE_FLIGHT_STATS
+from ..scripts.tracing.tracing import (configure_tracing, is_tracing, start_request_span, finish_request_span,
+                                       traced_lines)
 from ..redis.get.get import get_city, get_all_cities, get_number_of_cities
 from flask_cors import CORS
 
@@ -11,33 +24,153 @@ app = flask.Flask(__name__)
 
 CORS(app)
 
+configure_tracing()
+
+
+@app.before_request
+def start_request_metrics():
+    flask.g.request_metrics = start_request()
+
+
+@app.after_request
+def finish_request_metrics(response):
+    if 'request_metrics' in flask.g:
+        finish_request(flask.g.pop('request_metrics'), request.endpoint, response.status_code)
+    return response
+
+
+@app.before_request
+def start_request_profile():
+    profile = start_profile(request.endpoint, request.headers.get(PROFILE_HEADER), request.path,
+                            request.args.items(multi=True))
+    if profile is not None:
+        profile.attach()
+        flask.g.profile = profile
+
+
+@app.after_request
+def finish_request_profile(response):
+    # Streamed bodies are sent, and profiled, after the view returned.
+    if 'profile' in flask.g:
+        profile = flask.g.pop('profile')
+        response.headers[PROFILE_ID_HEADER] = profile.id
+        response.call_on_close(profile.stop)
+    return response
+
+
+
+@app.before_request
+def start_request_trace():
+    if not is_tracing():
+        return
+    view_args = request.view_args or {}
+    flask.g.request_span = start_request_span(request.method, request.url_rule.rule if request.url_rule else None, {
+        'url.path': request.path,
+        'weather.city': view_args.get('city_name'),
+        'weather.prediction_hours': view_args.get('prediction_hours')
+    })
+
+
+@app.after_request
+def finish_request_trace(response):
+    # The span of a streamed response ends once the body is sent.
+    request_span = flask.g.pop('request_span', None)
+    if request_span is not None:
+        response.call_on_close(finish_request_span(request_span, response.status_code))
+    return response
+
+
+@app.teardown_request
+def end_request_trace(error=None):
+    request_span = flask.g.pop('request_span', None)
+    if request_span is not None:
+        finish_request_span(request_span, 500)()
 
 
 def construct_response(data, headers):
-    if_message = ''
-    if "message" in data.keys():
-        if_message = data["message"]
-    response = {
-        'data': data["result"],
-        'meta': data["status"],
-        'message': if_message
-    }
-    status_code = 200 if response['meta'] == "success" else 404
+    response, status_code = construct_envelope(data)
     return make_response(jsonify(response), status_code, headers)
 
 
+def construct_overload_response(endpoint):
+    response, status_code, headers = construct_overload_envelope(retry_after(endpoint))
+    return make_response(jsonify(response), status_code, headers)
+
+
+def admitted(endpoint):
+    # Sheds the requests past the endpoint's admission budget.
+    def decorator(view):
+        @wraps(view)
+        def admitted_view(*args, **kwargs):
+            with admission(endpoint) as is_admitted:
+                if not is_admitted:
+                    return construct_overload_response(endpoint)
+                return view(*args, **kwargs)
+        return admitted_view
+    return decorator
+
+
 @app.route("/predict/<city_name>/<prediction_hours>")
 def predict_hourly_weather(city_name, prediction_hours):
-    json_data = predict_hourly_city_weather(city_name=city_name, prediction_hours=prediction_hours)
     headers = {
         'Content-Type': 'application/json'
     }
+    try:
+        since = parse_since(request.args.get("since"))
+        resolution = parse_resolution(request.args.get("resolution"))
+        engines = parse_engine(request.args.get("engine"))
+    except ValueError as e:
+        return make_response(jsonify({'data': [], 'meta': 'error', 'message': str(e)}), 400, headers)
+
+    # Revalidations are answered from the model version alone. Summaries are
+    # small, they are not streamed.
+    stream = resolution is None and wants_stream(request.args.get("format"), request.headers.get("Accept"))
+    validators = forecast_validators(city_name, prediction_hours, {
+        'engine': engines, 'since': since, 'resolution': resolution, 'media_type': STREAM_MEDIA_TYPE if stream else None
+    })
+    if validators and is_not_modified(validators, request.headers.get("If-None-Match"),
+                                      request.headers.get("If-Modified-Since")):
+        return make_response('', 304, validators)
+
+    ticket = admit("forecast")
+    if ticket is None:
+        stale = stale_forecast(city_name, prediction_hours, engines)
+        if stream or stale is None:
+            return construct_overload_response("forecast")
+        json_data, age = stale
+        json_data = resample_city_forecast(filter_since(json_data, since), city_name, resolution)
+        return construct_response(json_data, dict(headers, **construct_degraded_headers(age)))
+
+    try:
+        if stream:
+            json_data = stream_forecast(city_name, prediction_hours, engines, since)
+            if json_data.get("status") != "success":
+                return construct_response(json_data, headers)
+            headers = dict(validators or {}, **{'Content-Type': STREAM_MEDIA_TYPE})
+            response = flask.Response(traced_lines(ndjson_lines(json_data["result"])), 200, headers)
+            # The stream keeps its slot until it is sent.
+            response.call_on_close(partial(release, ticket))
+            ticket = None
+            return response
+
+        # Identical concurrent forecasts are computed once, the forecasting
+        # stack is imported on the first one.
+        json_data = coalesced_forecast(city_name=city_name, prediction_hours=prediction_hours, engines=engines)
+    finally:
+        if ticket is not None:
+            release(ticket)
+
+    remember_forecast(city_name, engines, json_data)
+    json_data = resample_city_forecast(filter_since(json_data, since), city_name, resolution)
+    if validators and json_data.get("status") == "success":
+        headers.update(validators)
     return construct_response(json_data, headers)
-    
+
 
 
 @app.route("/cities/total/", defaults={"city_name": ""})
 @app.route("/cities/total/<city_name>")
+@admitted("cities")
 def get_total_cities_count(city_name):
     city_data = loads(get_number_of_cities(city_name))
     headers = {
@@ -48,6 +181,7 @@ def get_total_cities_count(city_name):
 
 
 @app.route("/cities/<city_name>")
+@admitted("cities")
 def get_city_info(city_name):
     page = int(request.args.get("page", 1))
     limit = int(request.args.get("limit", 6))
@@ -59,6 +193,7 @@ def get_city_info(city_name):
 
 
 @app.route("/cities/")
+@admitted("cities")
 def get_cities_info():
     page = int(request.args.get("page", 1))
     limit = int(request.args.get("limit", 6))
@@ -68,3 +203,51 @@ def get_cities_info():
     }
     return construct_response(cities_data, headers)
 
+
+@app.route("/healthz")
+def get_health():
+    return make_response(jsonify({'status': 'ok'}), 200)
+
+
+@app.route("/readyz")
+def get_readiness():
+    # Ready once the warmup ran, under a preloading server the workers are
+    # forked from the warmed up master.
+    status_code = 200 if WARMUP_STATE['ready'] else 503
+    return make_response(jsonify(WARMUP_STATE), status_code)
+
+
+@app.route("/statsz")
+def get_stats():
+    return make_response(jsonify({'admission': get_admission_stats(), 'single_flight': SINGLE_FLIGHT_STATS}), 200)
+
+
+@app.route("/metrics")
+def get_metrics():
+    body, content_type = generate_metrics()
+    return make_response(body, 200, {'Content-Type': content_type})
+
+
+def construct_admin_error(status_code):
+    message = 'Unauthorized' if status_code == 401 else 'Not found'
+    return make_response(jsonify({'data': [], 'meta': 'error', 'message': message}), status_code)
+
+
+@app.route("/admin/profiles")
+def get_profiles():
+    status_code = admin_status(request.headers.get("Authorization"))
+    if status_code is not None:
+        return construct_admin_error(status_code)
+    return make_response(jsonify({'profiles': list_profiles()}), 200)
+
+
+@app.route("/admin/profiles/<profile_id>")
+def get_profile(profile_id):
+    # Collapsed stacks, e.g. for flamegraph.pl or speedscope.
+    status_code = admin_status(request.headers.get("Authorization"))
+    if status_code is not None:
+        return construct_admin_error(status_code)
+    stacks = read_profile(profile_id)
+    if stacks is None:
+        return construct_admin_error(404)
+    return make_response(stacks, 200, {'Content-Type': 'text/plain; charset=utf-8'})
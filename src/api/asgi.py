@@ -0,0 +1,353 @@
+import asyncio
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import wraps
+from json import dumps, loads
+from os import getenv, cpu_count
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from .conditional import forecast_validators, is_not_modified, parse_since, parse_engine, filter_since
+from .envelope import construct_envelope, construct_overload_envelope, construct_degraded_headers
+from .streaming import STREAM_MEDIA_TYPE, wants_stream, stream_forecast, ndjson_lines
+from ..redis.get_async.get_async import get_city, get_all_cities, get_number_of_cities, close_redis
+from ..scripts.admission.admission import (admit_async, release, admission_async, retry_after, remember_forecast,
+                                           stale_forecast, get_admission_stats)
+from ..scripts.forecast_resolution.forecast_resolution import parse_resolution, resample_city_forecast
+from ..scripts.metrics.metrics import start_request, finish_request, generate_metrics
+from ..scripts.model_warmup.model_warmup import WARMUP_STATE, warm_up, get_process_warmup, merge_warmup_states
+from ..scripts.profiling.profiling import (PROFILE_HEADER, PROFILE_ID_HEADER, start_profile, admin_status,
+                                           list_profiles, read_profile)
+from ..scripts.single_flight.single_flight import coalesced_forecast, coalesced_forecast_async, SINGLE_FLIGHT_STATS
+from ..scripts.tracing.tracing import (configure_tracing, is_tracing, start_request_span, finish_request_span,
+                                       traced_lines, flush_tracing)
+
+# ASGI variant of app.py, same routes and response envelope:
+#
+#   uvicorn src.api.asgi:app --host 0.0.0.0 --port 4000
+#
+# City lookups await the async Redis client on the event loop. Forecasts are
+# CPU bound, they run in a pool of WEATHER_FORECAST_WORKERS processes (or
+# threads, WEATHER_FORECAST_EXECUTOR=thread), so a slow forecast holds a pool
+# slot while the loop keeps answering city lookups. Forecasts beyond the pool
+# size wait in the pool's queue, identical ones are coalesced (single_flight).
+
+FORECAST_EXECUTOR = getenv('WEATHER_FORECAST_EXECUTOR', 'process')
+FORECAST_WORKERS = int(getenv('WEATHER_FORECAST_WORKERS', 0)) or cpu_count() or 1
+WARMUP_POLL_INTERVAL_S = 0.1
+
+
+def create_forecast_pool(executor=None, workers=None):
+    executor = executor or FORECAST_EXECUTOR
+    workers = workers or FORECAST_WORKERS
+    if executor == 'thread':
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='forecast')
+    if executor == 'process':
+        # Every process warms up before it takes a forecast.
+        return ProcessPoolExecutor(max_workers=workers, initializer=warm_up)
+    raise ValueError(f"Unknown forecast executor '{executor}', expected 'process' or 'thread'")
+
+
+async def warm_up_pool(pool, executor, workers):
+    # The threads share one process and its model caches, every process of a
+    # process pool warms up its own in the pool's initializer. Ready once
+    # every process answered, i.e. finished its warmup.
+    loop = asyncio.get_running_loop()
+    if executor != 'process':
+        await loop.run_in_executor(pool, warm_up)
+        return
+    states = {}
+    while True:
+        for pid, state in await asyncio.gather(*(loop.run_in_executor(pool, get_process_warmup)
+                                                 for _ in range(workers))):
+            states[pid] = state
+        if len(states) >= workers:
+            break
+        await asyncio.sleep(WARMUP_POLL_INTERVAL_S)
+    WARMUP_STATE.update(merge_warmup_states(list(states.values())))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    executor, workers = FORECAST_EXECUTOR, FORECAST_WORKERS
+    pool = create_forecast_pool(executor, workers)
+    app.state.forecast_pool = pool
+    warmup = asyncio.create_task(warm_up_pool(pool, executor, workers))
+    try:
+        yield
+    finally:
+        warmup.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+        await close_redis()
+        flush_tracing()
+
+
+def request_metrics(app):
+    # Latency and Redis round trips per endpoint, as the Flask request hooks.
+    async def metrics_app(scope, receive, send):
+        if scope['type'] != 'http':
+            return await app(scope, receive, send)
+        request, status = start_request(), {'code': 500}
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+        try:
+            await app(scope, receive, send_status)
+        finally:
+            endpoint = scope.get('endpoint')
+            finish_request(request, getattr(endpoint, '__name__', None), status['code'])
+    return metrics_app
+
+
+def request_tracing(app):
+    # A span per request as in app.py, named after its route once routed.
+    async def tracing_app(scope, receive, send):
+        if scope['type'] != 'http' or not is_tracing():
+            return await app(scope, receive, send)
+        request_span = start_request_span(scope['method'], attributes={'url.path': scope['path']})
+        status = {'code': 500}
+
+        async def send_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+        try:
+            await app(scope, receive, send_status)
+        finally:
+            endpoint, path_params = scope.get('endpoint'), scope.get('path_params', {})
+            route = next((route.path for route in scope['app'].routes if getattr(route, 'endpoint', None) is endpoint),
+                         None) if endpoint else None
+            span_end = finish_request_span(request_span, status['code'], route, {
+                'weather.city': path_params.get('city_name'),
+                'weather.prediction_hours': path_params.get('prediction_hours')
+            })
+            span_end()
+    return tracing_app
+
+
+def construct_response(data, headers=None, status_code=None):
+    response, envelope_status_code = construct_envelope(data)
+    # Same body as Flask's jsonify.
+    return Response(dumps(response, sort_keys=True, separators=(',', ':')) + '\n',
+                    status_code or envelope_status_code, headers, media_type='application/json')
+
+
+def construct_overload_response(endpoint):
+    response, status_code, headers = construct_overload_envelope(retry_after(endpoint))
+    return Response(dumps(response, sort_keys=True, separators=(',', ':')) + '\n', status_code, headers,
+                    media_type='application/json')
+
+
+def admitted(endpoint):
+    # Sheds the requests past the endpoint's admission budget.
+    def decorator(route_endpoint):
+        @wraps(route_endpoint)
+        async def admitted_endpoint(request):
+            async with admission_async(endpoint) as is_admitted:
+                if not is_admitted:
+                    return construct_overload_response(endpoint)
+                return await route_endpoint(request)
+        return admitted_endpoint
+    return decorator
+
+
+def profiled(on_loop):
+    # Samples the work the request runs in threads and, on_loop, the event
+    # loop thread for the whole request, interleaved with the tasks of other
+    # requests. Profiled forecasts are computed in a thread of this process
+    # instead of the forecast pool.
+    def decorator(route_endpoint):
+        @wraps(route_endpoint)
+        async def profiled_endpoint(request):
+            profile = start_profile(route_endpoint.__name__, request.headers.get(PROFILE_HEADER), request.url.path,
+                                    request.query_params.multi_items())
+            if profile is None:
+                return await route_endpoint(request)
+            request.state.profile = profile
+            try:
+                if on_loop:
+                    with profile.attached():
+                        response = await route_endpoint(request)
+                else:
+                    response = await route_endpoint(request)
+            except Exception:
+                await run_in_threadpool(profile.stop)
+                raise
+            response.headers[PROFILE_ID_HEADER] = profile.id
+            # Stopped once the response, streamed ones included, is sent.
+            tasks = [response.background] if response.background else []
+            response.background = BackgroundTasks(tasks + [BackgroundTask(profile.stop)])
+            return response
+        return profiled_endpoint
+    return decorator
+
+
+async def run_in_thread(profile, function, *args):
+    if profile is not None:
+        return await run_in_threadpool(profile.run, function, *args)
+    return await run_in_threadpool(function, *args)
+
+
+async def shape_forecast(json_data, city_name, since, resolution):
+    json_data = filter_since(json_data, since)
+    if resolution is not None:
+        # The city's UTC offset is looked up over the sync Redis client once.
+        json_data = await run_in_threadpool(resample_city_forecast, json_data, city_name, resolution)
+    return json_data
+
+
+@profiled(on_loop=False)
+async def predict_hourly_weather(request):
+    city_name, prediction_hours = request.path_params['city_name'], request.path_params['prediction_hours']
+    try:
+        since = parse_since(request.query_params.get("since"))
+        resolution = parse_resolution(request.query_params.get("resolution"))
+        engines = parse_engine(request.query_params.get("engine"))
+    except ValueError as e:
+        return construct_response({'result': [], 'status': 'error', 'message': str(e)}, status_code=400)
+
+    # Revalidations are answered from the model version alone. Summaries are
+    # small, they are not streamed.
+    profile = getattr(request.state, 'profile', None)
+    stream = resolution is None and wants_stream(request.query_params.get("format"), request.headers.get("Accept"))
+    validators = forecast_validators(city_name, prediction_hours, {
+        'engine': engines, 'since': since, 'resolution': resolution, 'media_type': STREAM_MEDIA_TYPE if stream else None
+    })
+    if validators and is_not_modified(validators, request.headers.get("If-None-Match"),
+                                      request.headers.get("If-Modified-Since")):
+        return Response(status_code=304, headers=validators)
+
+    ticket = await admit_async("forecast")
+    if ticket is None:
+        stale = stale_forecast(city_name, prediction_hours, engines)
+        if stream or stale is None:
+            return construct_overload_response("forecast")
+        json_data, age = stale
+        return construct_response(await shape_forecast(json_data, city_name, since, resolution),
+                                  construct_degraded_headers(age))
+
+    try:
+        if stream:
+            # Generators do not cross to the forecast processes, the blocks are
+            # predicted in the threads Starlette iterates sync bodies in. The
+            # stream keeps its slot until it is sent.
+            json_data = await run_in_thread(profile, stream_forecast, city_name, prediction_hours, engines, since)
+            if json_data.get("status") != "success":
+                return construct_response(json_data)
+            lines = traced_lines(ndjson_lines(json_data["result"]))
+            response = StreamingResponse(profile.iterate(lines) if profile else lines, headers=validators,
+                                         media_type=STREAM_MEDIA_TYPE, background=BackgroundTask(release, ticket))
+            ticket = None
+            return response
+
+        if profile is not None:
+            json_data = await run_in_thread(profile, coalesced_forecast, city_name, prediction_hours, engines)
+        else:
+            json_data = await coalesced_forecast_async(city_name, prediction_hours, engines,
+                                                       request.app.state.forecast_pool)
+    finally:
+        if ticket is not None:
+            release(ticket)
+
+    remember_forecast(city_name, engines, json_data)
+    json_data = await shape_forecast(json_data, city_name, since, resolution)
+    headers = validators if validators and json_data.get("status") == "success" else None
+    return construct_response(json_data, headers)
+
+
+@profiled(on_loop=True)
+@admitted("cities")
+async def get_total_cities_count(request):
+    city_data = loads(await get_number_of_cities(request.path_params.get('city_name', '')))
+    return construct_response(city_data)
+
+
+@profiled(on_loop=True)
+@admitted("cities")
+async def get_city_info(request):
+    page = int(request.query_params.get("page", 1))
+    limit = int(request.query_params.get("limit", 6))
+    city_data = loads(await get_city(request.path_params['city_name'], page, limit))
+    return construct_response(city_data)
+
+
+@profiled(on_loop=True)
+@admitted("cities")
+async def get_cities_info(request):
+    page = int(request.query_params.get("page", 1))
+    limit = int(request.query_params.get("limit", 6))
+    cities_data = loads(await get_all_cities(page=page, limit=limit))
+    return construct_response(cities_data)
+
+
+async def get_health(request):
+    return Response(dumps({'status': 'ok'}) + '\n', 200, media_type='application/json')
+
+
+async def get_readiness(request):
+    status_code = 200 if WARMUP_STATE['ready'] else 503
+    return Response(dumps(WARMUP_STATE, sort_keys=True) + '\n', status_code, media_type='application/json')
+
+
+async def get_metrics(request):
+    body, content_type = generate_metrics()
+    return Response(body, 200, headers={'Content-Type': content_type})
+
+
+def construct_admin_error(status_code):
+    message = 'Unauthorized' if status_code == 401 else 'Not found'
+    return construct_response({'result': [], 'status': 'error', 'message': message}, status_code=status_code)
+
+
+async def get_profiles(request):
+    status_code = admin_status(request.headers.get("Authorization"))
+    if status_code is not None:
+        return construct_admin_error(status_code)
+    return Response(dumps({'profiles': list_profiles()}, sort_keys=True) + '\n', 200, media_type='application/json')
+
+
+async def get_profile(request):
+    # Collapsed stacks, e.g. for flamegraph.pl or speedscope.
+    status_code = admin_status(request.headers.get("Authorization"))
+    if status_code is not None:
+        return construct_admin_error(status_code)
+    stacks = read_profile(request.path_params['profile_id'])
+    if stacks is None:
+        return construct_admin_error(404)
+    return Response(stacks, 200, media_type='text/plain')
+
+
+async def get_stats(request):
+    stats = {'admission': get_admission_stats(), 'single_flight': SINGLE_FLIGHT_STATS}
+    return Response(dumps(stats, sort_keys=True) + '\n', 200, media_type='application/json')
+
+
+configure_tracing()
+
+app = Starlette(
+    routes=[
+        Route("/predict/{city_name}/{prediction_hours}", predict_hourly_weather),
+        Route("/cities/total/", get_total_cities_count),
+        Route("/cities/total/{city_name}", get_total_cities_count),
+        Route("/cities/{city_name}", get_city_info),
+        Route("/cities/", get_cities_info),
+        Route("/healthz", get_health),
+        Route("/readyz", get_readiness),
+        Route("/statsz", get_stats),
+        Route("/metrics", get_metrics),
+        Route("/admin/profiles", get_profiles),
+        Route("/admin/profiles/{profile_id}", get_profile)
+    ],
+    middleware=[Middleware(request_tracing), Middleware(request_metrics),
+                Middleware(CORSMiddleware, allow_origins=['*'])],
+    lifespan=lifespan
+)
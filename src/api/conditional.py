@@ -0,0 +1,118 @@
+import hashlib
+import os
+
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from json import dumps, loads
+from os import getenv, path
+
+from ..scripts.model_registry.model_registry import read_current_manifest
+
+# HTTP validators of the forecast responses, shared by the WSGI and ASGI APIs.
+# A forecast only changes when the city's models are republished or the UTC
+# hour turns, so its ETag is a digest of the model version, the hour and the
+# request parameters. They are computed from the published manifests alone:
+# a matching If-None-Match (or If-Modified-Since) is answered with 304 before
+# any model or Redis work.
+#
+# since=<timestamp> (unix seconds or 'YYYY-mm-dd HH:MM:SS') keeps only the
+# hours after it, for clients that already hold the start of the forecast.
+
+# Forecasts are cached by clients until the hour turns, at most this long so
+# a retrain shows up soon.
+PREDICT_MAX_AGE_S = int(getenv('WEATHER_PREDICT_MAX_AGE', 300))
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The ?engine= values, model_prediction.ENGINE_LOADERS and the city's own
+# Prophet models, by name so the routes validate them without importing the
+# forecasting stack.
+FORECAST_ENGINES = ('prophet', 'harmonic')
+
+
+def get_models_version(city_dir):
+    # Published versions carry their id and publish time. Legacy flat model
+    # directories are versioned by their newest modification time, of the
+    # directory (files added or removed) or of a model file, which the legacy
+    # training overwrites in place.
+    manifest = read_current_manifest(city_dir)
+    if manifest is not None:
+        published_at = datetime.strptime(manifest['published_at'], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+        return manifest['version'], published_at
+    try:
+        mtime_ns = os.stat(city_dir).st_mtime_ns
+        with os.scandir(city_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    mtime_ns = max(mtime_ns, entry.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return None, None
+    return f'mtime-{mtime_ns}', datetime.fromtimestamp(mtime_ns // 1_000_000_000, timezone.utc)
+
+
+def forecast_validators(city_name, prediction_hours, params=None, now=None):
+    # params are the request parameters the response depends on, e.g. engine.
+    from ..scripts.model_prediction.model_prediction import MODELS_DIR, GLOBAL_MODEL_PARAMS
+    from ..scripts.model_training.global_model.global_model import GLOBAL_MODEL_NAME
+
+    version, published_at = get_models_version(path.join(MODELS_DIR, city_name))
+    if version is None:
+        return None
+    if GLOBAL_MODEL_PARAMS:
+        global_version, global_published_at = get_models_version(path.join(MODELS_DIR, GLOBAL_MODEL_NAME))
+        if global_version is not None:
+            version, published_at = f'{version}+{global_version}', max(published_at, global_published_at)
+
+    now = now or datetime.now(timezone.utc)
+    hour = now.replace(minute=0, second=0, microsecond=0)
+    content = dumps([city_name, version, hour.isoformat(), str(prediction_hours),
+                     sorted((key, value) for key, value in (params or {}).items() if value is not None)])
+    max_age = min(PREDICT_MAX_AGE_S, max(1, int((hour + timedelta(hours=1) - now).total_seconds())))
+    return {
+        'ETag': f'"{hashlib.sha256(content.encode("UTF-8")).hexdigest()[:32]}"',
+        'Last-Modified': format_datetime(max(hour, published_at), usegmt=True),
+        'Cache-Control': f'public, max-age={max_age}'
+    }
+
+
+def is_not_modified(validators, if_none_match=None, if_modified_since=None):
+    # If-Modified-Since only counts without If-None-Match (RFC 9110 13.1.3).
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in tags or any(tag.removeprefix('W/') == validators['ETag'] for tag in tags)
+    if if_modified_since:
+        try:
+            modified_since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if modified_since.tzinfo is None:
+            modified_since = modified_since.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(validators['Last-Modified']) <= modified_since
+    return False
+
+
+def parse_since(since):
+    if since is None or since == '':
+        return None
+    if since.isdigit():
+        return datetime.fromtimestamp(int(since), timezone.utc).strftime(TIMESTAMP_FORMAT)
+    try:
+        return datetime.fromisoformat(since).strftime(TIMESTAMP_FORMAT)
+    except ValueError:
+        raise ValueError(f"Invalid since '{since}', expected unix seconds or 'YYYY-mm-dd HH:MM:SS'")
+
+
+def parse_engine(engine):
+    if engine is None or engine == '':
+        return None
+    if engine not in FORECAST_ENGINES:
+        raise ValueError(f"Invalid engine '{engine}', expected one of {', '.join(FORECAST_ENGINES)}")
+    return engine
+
+
+def filter_since(data, since):
+    # Rows are ordered by their fixed format timestamps, which compare as
+    # strings.
+    if since is None or data.get('status') != 'success':
+        return data
+    return dict(data, result=[row for row in data['result'] if loads(row)['timestamp'] > since])
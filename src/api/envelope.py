@@ -0,0 +1,32 @@
+# The response envelope shared by the WSGI (app.py) and ASGI (asgi.py) APIs.
+
+def construct_envelope(data):
+    if_message = ''
+    if "message" in data.keys():
+        if_message = data["message"]
+    response = {
+        'data': data["result"],
+        'meta': data["status"],
+        'message': if_message
+    }
+    status_code = 200 if response['meta'] == "success" else 404
+    return response, status_code
+
+
+def construct_overload_envelope(retry_after):
+    # Shed requests, see scripts/admission.
+    response = {
+        'data': [],
+        'meta': 'error',
+        'message': 'Too many requests in progress, retry later'
+    }
+    return response, 503, {'Retry-After': str(retry_after)}
+
+
+def construct_degraded_headers(age):
+    return {
+        'Age': str(age),
+        'Cache-Control': 'no-cache',
+        'Warning': '110 - "Response is Stale"',
+        'X-Forecast-Degraded': 'stale'
+    }
@@ -0,0 +1,80 @@
+import gc
+import logging
+
+from os import getenv, cpu_count
+from time import perf_counter
+
+# Production serving, from the project root:
+#
+#   gunicorn -c src/api/gunicorn.conf.py src.api.app:app
+#
+# The app is imported and warmed up once in the master, the workers are
+# forked afterwards and share its modules and loaded models copy-on-write.
+# The warmup is configured by WEATHER_WARMUP_CITIES and WEATHER_WARMUP_HOURS.
+#
+# WEATHER_WARMUP_MODE=background forks right after the (light) app import
+# instead and warms up every worker in a thread: the city endpoints answer
+# within a fraction of a second of the start, /readyz turns ready after the
+# warmup, at the cost of one copy of the models per worker.
+
+BOOT_STARTED = perf_counter()
+
+bind = f"0.0.0.0:{getenv('WEATHER_API_PORT', '4000')}"
+workers = int(getenv('WEATHER_API_WORKERS', 0)) or 2 * (cpu_count() or 1) + 1
+threads = int(getenv('WEATHER_API_THREADS', 1))
+timeout = int(getenv('WEATHER_API_TIMEOUT', 120))
+preload_app = True
+accesslog = '-'
+
+WARMUP_MODE = getenv('WEATHER_WARMUP_MODE', 'preload')
+
+logging.basicConfig(level=logging.INFO)
+
+
+def on_starting(server):
+    # Runs in the master after the preload and before the first fork.
+    app_loaded = perf_counter()
+    if WARMUP_MODE == 'background':
+        server.log.info(f"Cold start: app loaded in {app_loaded - BOOT_STARTED:.2f} s, warming up in the workers")
+    else:
+        warm_up_master(server, app_loaded)
+
+    # Objects allocated so far are left out of later collections, so the
+    # collector does not write to, and unshare, the pages of the workers.
+    gc.collect()
+    gc.freeze()
+
+
+def warm_up_master(server, app_loaded):
+    from src.scripts.model_warmup.model_warmup import warm_up, time_first_response
+
+    state = warm_up()
+    warmed_up = perf_counter()
+    server.log.info(f"Cold start: app loaded in {app_loaded - BOOT_STARTED:.2f} s, "
+                    f"{len(state['cities'])} cities warmed up in {warmed_up - app_loaded:.2f} s")
+
+    if state['cities']:
+        city_name = state['cities'][0]['city']
+        hours = max(int(h) for h in state['cities'][0]['seconds'])
+        status_code, seconds = time_first_response(server.app.wsgi(), city_name, hours)
+        server.log.info(f"Cold start to first response: {perf_counter() - BOOT_STARTED:.2f} s, "
+                        f"GET /predict/{city_name}/{hours} answered {status_code} in {seconds * 1000:.1f} ms")
+
+
+def post_fork(server, worker):
+    if WARMUP_MODE == 'background':
+        from src.scripts.model_warmup.model_warmup import start_background_warm_up
+        start_background_warm_up()
+
+
+def child_exit(server, worker):
+    # Drops the live gauges of a dead worker from the multiprocess metrics.
+    if getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    # Exports the spans the worker still batches.
+    from src.scripts.tracing.tracing import flush_tracing
+    flush_tracing()
@@ -0,0 +1,30 @@
+import logging
+
+from json import dumps
+
+# NDJSON forecasts, shared by the WSGI (app.py) and ASGI (asgi.py) APIs.
+# /predict/<city>/<hours>?format=ndjson (or Accept: application/x-ndjson)
+# sends one JSON row per line, in blocks as they are predicted, instead of
+# buffering the whole envelope. Streamed forecasts are not coalesced.
+
+STREAM_MEDIA_TYPE = 'application/x-ndjson'
+
+
+def wants_stream(request_format=None, accept=None):
+    return request_format == 'ndjson' or STREAM_MEDIA_TYPE in (accept or '')
+
+
+def stream_forecast(city_name, prediction_hours, engines=None, since=None):
+    from ..scripts.model_prediction.model_prediction import stream_hourly_city_weather
+    return stream_hourly_city_weather(city_name=city_name, prediction_hours=int(prediction_hours),
+                                      engines=engines, since=since)
+
+
+def ndjson_lines(lines):
+    # The status code is sent with the first block, a failure past it ends the
+    # stream with an error row.
+    try:
+        yield from lines
+    except Exception as e:
+        logging.error(f"Forecast stream failed: {e!r}")
+        yield dumps({'status': 'error', 'message': str(e)}) + '\n'
@@ -1,6 +1,9 @@
 from json import dumps, loads
 from redis import Redis
-from ..utils.utils import construct_offsets, construct_result, construct_cities_count
+from ...scripts.metrics.metrics import instrument_redis
+from ...scripts.tracing.tracing import trace_redis, traced
+from ..utils.utils import (construct_offsets, construct_result, construct_cities_count, page_matches,
+                           construct_page_error, construct_city)
 
 hash_table_city_keys = ['country',
                 'zip_code',
@@ -9,7 +12,7 @@ hash_table_city_keys = ['country',
                 'utc_time_difference']
 
 def connect_to_redis(host, port):
-    return Redis(host=host, port=port)
+    return trace_redis(instrument_redis(Redis(host=host, port=port)))
 
 def construct_searchable_city_names(city_name):
     city_name = city_name.replace("_", " ")
@@ -21,6 +24,7 @@ def construct_searchable_city_names(city_name):
     return (prepared_name.strip() + "*", prepared_name.strip())
 
 
+@traced('get_city', {'weather.city': 'city_name', 'weather.page': 'page', 'weather.exact_match': 'exact_match'})
 def get_city(city_name, page=0, limit=None, exact_match=False):
     offsets, start, end = {}, 0, 0
 
@@ -47,25 +51,20 @@ def get_city(city_name, page=0, limit=None, exact_match=False):
                 city_matches = city_matches + temp
             else: 
                 cursor,  city_matches = list(redis_cnt.zscan(name="city_names", cursor=0, match=name))
-        if end >= len(city_matches):
-            if start >= len(city_matches):
-                total_pages = (len(city_matches) // limit) + (len(city_matches) % limit > 0)
-                return construct_result([], f"Invalid pagination parameters: requested page ({page}) exceeds available data (total pages: {total_pages})")
-            city_matches = city_matches[start:]
-        elif (start != end):
-            city_matches = city_matches[start:end] 
-        
-        for city, index in city_matches:
+        page_cities = page_matches(city_matches, start, end)
+        if page_cities is None:
+            return construct_page_error(city_matches, page, limit)
+
+        for city, index in page_cities:
             arr = redis_cnt.hmget(name=city, keys=tuple(hash_table_city_keys))
-            res.append({"name": city.decode("UTF-8")})
-            for i in range(len(hash_table_city_keys)):
-                res[-1][hash_table_city_keys[i]] = arr[i].decode("UTF-8")
+            res.append(construct_city(city, hash_table_city_keys, arr))
         
         return construct_result(res)
 
     except Exception as e:
         return construct_result(res, e)
     
+@traced('get_all_cities', {'weather.page': 'page'})
 def get_all_cities(page, limit):
     offsets, start, end = {}, 0, 0
 
@@ -77,25 +76,21 @@ def get_all_cities(page, limit):
     res = []
     try:
         c, keys = list(r.zscan(name="city_names", cursor=0, match="*"))
-        if end >= len(keys):
-            if start >= len(keys):
-                total_pages = (len(keys) // limit) + (len(keys) % limit > 0)
-                return construct_result([], f"Invalid pagination parameters: requested page ({page}) exceeds available data (total pages: {total_pages})")
-            keys =  keys[start:]
-        elif (start != end): keys = keys[start:end] 
-
-        for key, index in keys:
+        page_keys = page_matches(keys, start, end)
+        if page_keys is None:
+            return construct_page_error(keys, page, limit)
+
+        for key, index in page_keys:
             arr = r.hmget(name=key, keys=tuple(hash_table_city_keys))
-            res.append({"name": key.decode("UTF-8")})
-            for i in range(len(hash_table_city_keys)):
-                res[-1][hash_table_city_keys[i]] = arr[i].decode("UTF-8")
-            
+            res.append(construct_city(key, hash_table_city_keys, arr))
+
         return construct_result(res)
     
     except Exception as e:
         return construct_result(res, e)
 
 
+@traced('get_number_of_cities', {'weather.city': 'city_name'})
 def get_number_of_cities(city_name):
     redis_cnt = connect_to_redis(host="redis", port="6379")
     prepared_names = construct_searchable_city_names(city_name)
@@ -115,6 +110,7 @@ def get_number_of_cities(city_name):
     
 
 
+@traced('check_city_name', {'weather.city': 'city_name'})
 def check_city_name(city_name):
     match = get_city(city_name, 0, 1, exact_match=True)
     match = loads(match)["result"][0]["name"]
@@ -126,6 +122,7 @@ def check_city_name(city_name):
 from datetime import datetime, timezone
 from math import ceil
 
+@traced('match_time_difference', {'weather.city': 'city_name', 'weather.model_last_index': 'model_last_index'})
 def match_time_difference(city_name, model_last_index):
     match = get_city(city_name, 0, 1, exact_match=True)
     match = loads(match)["result"][0]
@@ -0,0 +1,93 @@
+from redis.asyncio import Redis
+from ...scripts.metrics.metrics import instrument_async_redis, redis_round_trip
+from ...scripts.tracing.tracing import trace_async_redis, traced, redis_span
+from ..get.get import construct_searchable_city_names, hash_table_city_keys
+from ..utils.utils import (construct_offsets, construct_result, construct_cities_count, page_matches,
+                           construct_page_error, construct_city)
+
+# Non-blocking versions of the city lookups in get.py for the ASGI API, with
+# the same results. All requests of a process share one client and so one
+# connection pool, the hashes of a page are read in one pipelined round trip.
+
+_redis = None
+
+def connect_to_redis(host="redis", port="6379"):
+    global _redis
+    if _redis is None:
+        _redis = trace_async_redis(instrument_async_redis(Redis(host=host, port=port)))
+    return _redis
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
+
+
+async def scan_city_names(redis_cnt, prepared_names):
+    city_matches = []
+    for name in prepared_names:
+        cursor, temp = await redis_cnt.zscan(name="city_names", cursor=0, match=name)
+        city_matches = city_matches + [el for el in temp if el not in city_matches]
+    return city_matches
+
+async def read_cities(redis_cnt, matches):
+    pipe = redis_cnt.pipeline(transaction=False)
+    for city, index in matches:
+        pipe.hmget(city, hash_table_city_keys)
+    with redis_round_trip('PIPELINE'), redis_span('PIPELINE') as span:
+        span.set_attribute('db.operation.batch.size', len(matches))
+        values = await pipe.execute()
+    return [construct_city(city, hash_table_city_keys, arr) for (city, index), arr in zip(matches, values)]
+
+
+@traced('get_city', {'weather.city': 'city_name', 'weather.page': 'page', 'weather.exact_match': 'exact_match'})
+async def get_city(city_name, page=0, limit=None, exact_match=False):
+    offsets = construct_offsets(page=page, limit=limit)
+    start = int(offsets["start"])
+    end = int(offsets["end"])
+
+    redis_cnt = connect_to_redis()
+    prepared_names = construct_searchable_city_names(city_name)
+    if exact_match: prepared_names = [prepared_names[-1]]
+
+    res = []
+    try:
+        city_matches = await scan_city_names(redis_cnt, prepared_names)
+        page_cities = page_matches(city_matches, start, end)
+        if page_cities is None:
+            return construct_page_error(city_matches, page, limit)
+        res = await read_cities(redis_cnt, page_cities)
+        return construct_result(res)
+
+    except Exception as e:
+        return construct_result(res, e)
+
+@traced('get_all_cities', {'weather.page': 'page'})
+async def get_all_cities(page, limit):
+    offsets = construct_offsets(page=page, limit=limit)
+    start = int(offsets["start"])
+    end = int(offsets["end"])
+
+    redis_cnt = connect_to_redis()
+    res = []
+    try:
+        keys = await scan_city_names(redis_cnt, ["*"])
+        page_keys = page_matches(keys, start, end)
+        if page_keys is None:
+            return construct_page_error(keys, page, limit)
+        res = await read_cities(redis_cnt, page_keys)
+        return construct_result(res)
+
+    except Exception as e:
+        return construct_result(res, e)
+
+@traced('get_number_of_cities', {'weather.city': 'city_name'})
+async def get_number_of_cities(city_name):
+    redis_cnt = connect_to_redis()
+    city_matches = []
+    try:
+        city_matches = await scan_city_names(redis_cnt, construct_searchable_city_names(city_name))
+        return construct_cities_count(len(city_matches))
+    except Exception as e:
+        return construct_cities_count(city_matches, e)
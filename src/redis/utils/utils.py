@@ -26,6 +26,28 @@ def construct_offsets(page, limit):
         handle_error(msg, ValueError(msg))
 
 
+def page_matches(matches, start, end):
+    # The matches between the construct_offsets bounds, None if the page
+    # starts after the last match.
+    if end >= len(matches):
+        if start >= len(matches):
+            return None
+        return matches[start:]
+    elif start != end:
+        return matches[start:end]
+    return matches
+
+def construct_page_error(matches, page, limit):
+    total_pages = (len(matches) // limit) + (len(matches) % limit > 0)
+    return construct_result([], f"Invalid pagination parameters: requested page ({page}) exceeds available data (total pages: {total_pages})")
+
+def construct_city(name, keys, values):
+    city = {"name": name.decode("UTF-8")}
+    for key, value in zip(keys, values):
+        city[key] = value.decode("UTF-8")
+    return city
+
+
 def construct_cities_count(amount, e=''):
     if not isinstance(amount, int):
         raise TypeError("Argument 'amount' must be an integer")
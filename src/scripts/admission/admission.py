@@ -0,0 +1,208 @@
+import asyncio
+import threading
+
+from collections import OrderedDict
+from contextlib import contextmanager, asynccontextmanager
+from math import ceil
+from os import getenv, cpu_count
+from time import monotonic, time
+
+from ..single_flight.single_flight import get_model_version
+
+# Admission control of the API endpoints. Every endpoint has a budget of
+# concurrent requests, a bounded queue of waiting ones and a deadline for the
+# wait: requests finding the queue full or not admitted by the deadline are
+# shed at once, with a Retry-After estimated from the recent service times,
+# instead of piling up until every request times out. Budgets are per
+# process, i.e. per gunicorn worker (with WEATHER_API_THREADS > 1) or per
+# ASGI server, e.g. WEATHER_ADMISSION_FORECAST=<concurrency>,<queue>,<deadline s>
+#
+# A shed forecast is served degraded from the last forecast of the same city,
+# model version and engines the process computed, less the hours elapsed
+# since, if it still covers the horizon and is at most WEATHER_STALE_MAX_AGE
+# seconds old.
+
+ADMISSION_BUDGETS = {
+    'forecast': getenv('WEATHER_ADMISSION_FORECAST', f'{cpu_count() or 1},{2 * (cpu_count() or 1)},10'),
+    'cities': getenv('WEATHER_ADMISSION_CITIES', '64,256,2')
+}
+
+# Weight of the last request in the service time average.
+SERVICE_TIME_WEIGHT = 0.2
+
+STALE_CACHE_SIZE = 128
+STALE_MAX_AGE_S = int(getenv('WEATHER_STALE_MAX_AGE', 3600))
+_stale_forecasts = OrderedDict()
+
+_lock = threading.Lock()
+_budgets = {}
+
+
+def parse_budget(value):
+    concurrency, queue, deadline_s = value.split(',')
+    return {'concurrency': int(concurrency), 'queue': int(queue), 'deadline_s': float(deadline_s)}
+
+
+def get_budget(endpoint):
+    with _lock:
+        if endpoint not in _budgets:
+            budget = parse_budget(ADMISSION_BUDGETS[endpoint])
+            budget.update({
+                'semaphore': threading.BoundedSemaphore(budget['concurrency']),
+                'async_semaphores': {},
+                'stats': {
+                    'active': 0, 'waiting': 0, 'admitted': 0, 'shed_queue_full': 0, 'shed_deadline': 0,
+                    'degraded': 0, 'wait_s_total': 0., 'wait_s_max': 0., 'service_s_average': 0.
+                }
+            })
+            _budgets[endpoint] = budget
+        return _budgets[endpoint]
+
+
+def get_async_semaphore(budget):
+    # asyncio semaphores belong to the loop they first wait on.
+    loop = asyncio.get_running_loop()
+    with _lock:
+        semaphores = budget['async_semaphores']
+        if loop not in semaphores:
+            semaphores.clear()
+            semaphores[loop] = asyncio.Semaphore(budget['concurrency'])
+        return semaphores[loop]
+
+
+def get_admission_stats():
+    return {endpoint: dict(get_budget(endpoint)['stats']) for endpoint in ADMISSION_BUDGETS}
+
+
+def reset_admission(endpoint=None):
+    with _lock:
+        for name in [endpoint] if endpoint else list(_budgets):
+            _budgets.pop(name, None)
+
+
+def retry_after(endpoint):
+    # Seconds until the queue ahead has been served, at least one.
+    budget = get_budget(endpoint)
+    stats = budget['stats']
+    return max(1, ceil(stats['service_s_average'] * (stats['waiting'] + 1) / budget['concurrency']))
+
+
+def enqueue(budget):
+    # Returns whether the request may wait for a slot.
+    with _lock:
+        stats = budget['stats']
+        if stats['active'] + stats['waiting'] >= budget['concurrency'] + budget['queue']:
+            stats['shed_queue_full'] += 1
+            return False
+        stats['waiting'] += 1
+        return True
+
+
+def dequeue(budget, started, admitted):
+    wait_s = monotonic() - started
+    with _lock:
+        stats = budget['stats']
+        stats['waiting'] -= 1
+        stats['wait_s_total'] += wait_s
+        stats['wait_s_max'] = max(stats['wait_s_max'], wait_s)
+        if admitted:
+            stats['active'] += 1
+            stats['admitted'] += 1
+        else:
+            stats['shed_deadline'] += 1
+
+
+def complete(budget, started):
+    service_s = monotonic() - started
+    with _lock:
+        stats = budget['stats']
+        stats['active'] -= 1
+        stats['service_s_average'] += SERVICE_TIME_WEIGHT * (service_s - stats['service_s_average'])
+
+
+def admit(endpoint):
+    # Waits for a slot in the WSGI API's threads. Returns the ticket to
+    # release it with, or None if the request is shed.
+    budget = get_budget(endpoint)
+    if not enqueue(budget):
+        return None
+    started = monotonic()
+    admitted = budget['semaphore'].acquire(timeout=budget['deadline_s'])
+    dequeue(budget, started, admitted)
+    return (budget, budget['semaphore'], monotonic()) if admitted else None
+
+
+async def admit_async(endpoint):
+    # Same for the ASGI API, waiting on the event loop.
+    budget = get_budget(endpoint)
+    semaphore = get_async_semaphore(budget)
+    if not enqueue(budget):
+        return None
+    started = monotonic()
+    try:
+        await asyncio.wait_for(semaphore.acquire(), budget['deadline_s'])
+        admitted = True
+    except asyncio.TimeoutError:
+        admitted = False
+    dequeue(budget, started, admitted)
+    return (budget, semaphore, monotonic()) if admitted else None
+
+
+def release(ticket):
+    budget, semaphore, started = ticket
+    complete(budget, started)
+    semaphore.release()
+
+
+@contextmanager
+def admission(endpoint):
+    # Yields whether the request was admitted.
+    ticket = admit(endpoint)
+    try:
+        yield ticket is not None
+    finally:
+        if ticket is not None:
+            release(ticket)
+
+
+@asynccontextmanager
+async def admission_async(endpoint):
+    ticket = await admit_async(endpoint)
+    try:
+        yield ticket is not None
+    finally:
+        if ticket is not None:
+            release(ticket)
+
+
+def remember_forecast(city_name, engines, result):
+    # Keeps the longest horizon of the latest forecast hour.
+    if result.get('status') != 'success':
+        return
+    key, computed_at = (city_name, get_model_version(city_name), engines), time()
+    with _lock:
+        previous = _stale_forecasts.get(key)
+        if (previous is None or previous[0] // 3600 < computed_at // 3600
+                or len(previous[1]['result']) <= len(result['result'])):
+            _stale_forecasts[key] = (computed_at, result)
+        _stale_forecasts.move_to_end(key)
+        if len(_stale_forecasts) > STALE_CACHE_SIZE:
+            _stale_forecasts.popitem(last=False)
+
+
+def stale_forecast(city_name, prediction_hours, engines=None):
+    # Returns the forecast from the current hour on and its age in seconds,
+    # or None. The first rows of a forecast are the hours of its computation,
+    # they are dropped once past.
+    hours, stats, now = int(prediction_hours), get_budget('forecast')['stats'], time()
+    key = (city_name, get_model_version(city_name), engines)
+    with _lock:
+        cached = _stale_forecasts.get(key)
+        if cached is None or now - cached[0] > STALE_MAX_AGE_S:
+            return None
+        computed_at, result = cached
+        elapsed_hours = int(now // 3600 - computed_at // 3600)
+        if len(result['result']) - elapsed_hours < hours:
+            return None
+        stats['degraded'] += 1
+    return dict(result, result=result['result'][elapsed_hours:elapsed_hours + hours]), int(now - computed_at)
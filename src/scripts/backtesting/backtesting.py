@@ -0,0 +1,248 @@
+import argparse
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from json import dumps
+from os import path, makedirs
+from time import perf_counter
+
+from ..model_training.model_training import (PRODUCTS, ENGINES, TRAINING_WINDOW_DAYS, get_product_frame,
+                                             get_product_config)
+from ..model_training.orchestrator.orchestrator import (list_trainable_cities, limit_worker_threads,
+                                                        worker_thread_env, get_training_frame,
+                                                        PRODUCT_COST_WEIGHTS)
+from ..model_training.utils.utils import handle_error
+from ..model_registry.model_registry import new_version_id, get_engine_model_file, get_model_file
+
+# Rolling origin backtests: for each origin the models are fitted on the rows
+# before it and scored on the following horizon_hours, exactly like a nightly
+# training run followed by a day of serving. Every (city, product, engine,
+# origin) is one job, so the process pool spreads the Prophet fits.
+#
+# weather_description is scored on the observed features of the horizon, it
+# measures the classifier alone and not the errors of the forecasts it is
+# served with.
+
+BACKTESTS_DIR = 'data/backtests'
+PROPHET_ENGINE = 'prophet'
+
+BACKTEST_CONFIG = {
+    'origins': 4,
+    'step_hours': 24 * 7,
+    'horizon_hours': 240,
+    'horizon_buckets': [24, 72, 168, 240]
+}
+
+SECONDS_PER_HOUR = 60 * 60
+
+
+def get_engine_products(engine):
+    if engine == PROPHET_ENGINE:
+        return PRODUCTS
+    if engine not in ENGINES:
+        handle_error(f"Failed to backtest: unknown engine '{engine}'", ValueError)
+    return ENGINES[engine]
+
+
+def rolling_origins(timestamps, origins, step_hours, horizon_hours):
+    # The last origin leaves a full horizon of observations after it.
+    last_origin = int(np.max(timestamps)) - horizon_hours * SECONDS_PER_HOUR + SECONDS_PER_HOUR
+    return [last_origin - k * step_hours * SECONDS_PER_HOUR for k in range(origins - 1, -1, -1)]
+
+
+def bucket_labels(buckets):
+    labels, lower = [], 1
+    for upper in buckets:
+        labels.append(f'{lower}-{upper}h')
+        lower = upper + 1
+    return labels
+
+
+def regression_metrics(y, yhat, lead_hours, buckets):
+    errors = np.asarray(yhat, dtype=np.float64) - np.asarray(y, dtype=np.float64)
+    metrics = {}
+    lower = 1
+    for label, upper in zip(bucket_labels(buckets), buckets):
+        in_bucket = (lead_hours >= lower) & (lead_hours <= upper)
+        lower = upper + 1
+        if in_bucket.any():
+            metrics[label] = {
+                'mae': float(np.abs(errors[in_bucket]).mean()),
+                'rmse': float(np.sqrt((errors[in_bucket] ** 2).mean())),
+                'n': int(in_bucket.sum())
+            }
+    return metrics
+
+
+def classification_metrics(y, yhat):
+    y, yhat = np.asarray(y), np.asarray(yhat)
+    f1_scores = []
+    for label in np.union1d(y, yhat):
+        true_positives = np.sum((yhat == label) & (y == label))
+        predicted, actual = np.sum(yhat == label), np.sum(y == label)
+        f1_scores.append(2 * true_positives / (predicted + actual) if predicted + actual else 0.)
+    return {'accuracy': float(np.mean(y == yhat)), 'f1_macro': float(np.mean(f1_scores)), 'n': int(len(y))}
+
+
+def run_backtest_job(city_name, product, engine, origin, config=BACKTEST_CONFIG, window_days=None, df=None,
+                     model_config=None):
+    record = {'city': city_name, 'product': product, 'engine': engine, 'origin': origin}
+    try:
+        if df is None:
+            # Every origin of a city shares the frame cached by this process.
+            df = get_training_frame(city_name)
+        history = df[df['timestamp'] < origin]
+        if window_days is not None:
+            history = history[history['timestamp'] >= origin - window_days * 24 * SECONDS_PER_HOUR]
+        horizon = df[(df['timestamp'] >= origin)
+                     & (df['timestamp'] < origin + config['horizon_hours'] * SECONDS_PER_HOUR)]
+        if history.empty or horizon.empty:
+            handle_error("Failed to backtest: no rows before or after the origin", ValueError)
+
+        create_model = get_engine_products(engine)[product]
+        if model_config is None and engine == PROPHET_ENGINE:
+            # The config training would use, tuned or the factory default.
+            model_config = get_product_config(product)
+        model_file = get_model_file(product) if engine == PROPHET_ENGINE else get_engine_model_file(engine, product)
+        with tempfile.TemporaryDirectory() as workdir:
+            started = perf_counter()
+            model = create_model(get_product_frame(history, product), path.join(workdir, model_file),
+                                 config=model_config)
+            record['fit_time'] = perf_counter() - started
+
+        actual = get_product_frame(horizon, product)
+        started = perf_counter()
+        if product == 'weather_description':
+            yhat = model.predict(actual.drop(columns=['ds', 'y']))
+        else:
+            yhat = model.predict(actual[['ds']])['yhat'].to_numpy()
+        record['predict_time'] = perf_counter() - started
+
+        if product == 'weather_description':
+            record['metrics'] = classification_metrics(actual['y'].to_numpy(), yhat)
+        else:
+            lead_hours = (horizon['timestamp'].to_numpy() - origin) // SECONDS_PER_HOUR + 1
+            record['metrics'] = regression_metrics(actual['y'].to_numpy(), yhat, lead_hours,
+                                                   config['horizon_buckets'])
+        record['status'] = 'ok'
+    except Exception as e:
+        logging.error(f"Backtest job ({city_name}, {product}, {engine}, {origin}) failed: {e!r}")
+        record['status'] = 'failed'
+        record['error'] = repr(e)
+    return record
+
+
+def build_backtest_jobs(cities, products=None, engines=(PROPHET_ENGINE,), config=BACKTEST_CONFIG):
+    products = list(PRODUCTS) if products is None else products
+    unknown = set(products) - set(PRODUCTS)
+    if unknown:
+        handle_error(f"Failed to build jobs: unknown products {sorted(unknown)}", ValueError)
+
+    jobs = []
+    for city in cities:
+        timestamps = get_training_frame(city)['timestamp'].to_numpy()
+        origins = rolling_origins(timestamps, config['origins'], config['step_hours'], config['horizon_hours'])
+        jobs += [(city, product, engine, origin) for engine in engines for product in products
+                 if product in get_engine_products(engine) for origin in origins]
+    return sorted(jobs, key=lambda job: PRODUCT_COST_WEIGHTS.get(job[1], 1) * (job[2] == PROPHET_ENGINE),
+                  reverse=True)
+
+
+def summarize_backtest(records, buckets=BACKTEST_CONFIG['horizon_buckets']):
+    # One summary per (city, product, engine), metrics averaged over the
+    # origins weighted by the number of scored rows.
+    groups = {}
+    for record in records:
+        if record['status'] == 'ok':
+            groups.setdefault((record['city'], record['product'], record['engine']), []).append(record)
+
+    summaries = []
+    for (city, product, engine), group in sorted(groups.items()):
+        summary = {'city': city, 'product': product, 'engine': engine, 'origins': len(group),
+                   'fit_time_mean': float(np.mean([r['fit_time'] for r in group])),
+                   'predict_time_mean': float(np.mean([r['predict_time'] for r in group]))}
+        if product == 'weather_description':
+            n = sum(r['metrics']['n'] for r in group)
+            for key in ('accuracy', 'f1_macro'):
+                summary[key] = sum(r['metrics'][key] * r['metrics']['n'] for r in group) / n
+        else:
+            summary['horizons'] = {}
+            for label in bucket_labels(buckets):
+                scored = [r['metrics'][label] for r in group if label in r['metrics']]
+                n = sum(m['n'] for m in scored)
+                if n:
+                    summary['horizons'][label] = {
+                        'mae': sum(m['mae'] * m['n'] for m in scored) / n,
+                        'rmse': float(np.sqrt(sum(m['rmse'] ** 2 * m['n'] for m in scored) / n)),
+                        'n': n
+                    }
+        summaries.append(summary)
+    return summaries
+
+
+def run_backtest(cities=None, products=None, engines=(PROPHET_ENGINE,), config=BACKTEST_CONFIG,
+                 window_days=TRAINING_WINDOW_DAYS, max_workers=None, threads_per_worker=1, output=None):
+    cities = list_trainable_cities() if cities is None else cities
+    max_workers = max_workers or os.cpu_count() or 1
+    jobs = build_backtest_jobs(cities, products, engines, config)
+    logging.info(f"Backtest: {len(jobs)} jobs on {max_workers} workers")
+
+    started = perf_counter()
+    if max_workers == 1:
+        records = [run_backtest_job(*job, config, window_days) for job in jobs]
+    else:
+        with worker_thread_env(threads_per_worker), \
+                ProcessPoolExecutor(max_workers=max_workers, initializer=limit_worker_threads,
+                                    initargs=(threads_per_worker,)) as pool:
+            futures = [pool.submit(run_backtest_job, *job, config, window_days) for job in jobs]
+            records = [future.result() for future in as_completed(futures)]
+
+    result = {
+        'config': config,
+        'window_days': window_days,
+        'engines': list(engines),
+        'wall_time': round(perf_counter() - started, 3),
+        'failed': [{k: r[k] for k in ('city', 'product', 'engine', 'origin', 'error')}
+                   for r in records if r['status'] != 'ok'],
+        'summary': summarize_backtest(records, config['horizon_buckets']),
+        'jobs': sorted(records, key=lambda r: (r['city'], r['product'], r['engine'], r['origin']))
+    }
+    if output is not None:
+        makedirs(path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w') as f:
+            f.write(dumps(result, indent=2))
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling origin backtests of the weather models")
+    parser.add_argument('--cities', nargs='+', help="cities to backtest (default: every city with a dataset)")
+    parser.add_argument('--products', nargs='+', choices=list(PRODUCTS), help="products to backtest (default: all)")
+    parser.add_argument('--engines', nargs='+', default=[PROPHET_ENGINE], choices=[PROPHET_ENGINE, *ENGINES])
+    parser.add_argument('--origins', type=int, default=BACKTEST_CONFIG['origins'])
+    parser.add_argument('--step-hours', type=int, default=BACKTEST_CONFIG['step_hours'])
+    parser.add_argument('--horizon-hours', type=int, default=BACKTEST_CONFIG['horizon_hours'])
+    parser.add_argument('--window-days', type=int, default=TRAINING_WINDOW_DAYS,
+                        help="fit on the most recent days before each origin (default: all of them)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--output', default=None, help=f"result file (default: {BACKTESTS_DIR}/<run id>.json)")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    config = dict(BACKTEST_CONFIG, origins=args.origins, step_hours=args.step_hours,
+                  horizon_hours=args.horizon_hours)
+    config['horizon_buckets'] = [b for b in BACKTEST_CONFIG['horizon_buckets'] if b < args.horizon_hours]
+    config['horizon_buckets'].append(args.horizon_hours)
+    output = args.output or f'{BACKTESTS_DIR}/{new_version_id()}.json'
+    result = run_backtest(args.cities, args.products, args.engines, config, args.window_days, args.workers,
+                          args.threads_per_worker, output)
+    print(dumps(result['summary'], indent=2))
+    logging.info(f"Backtest results written to '{output}'")
@@ -0,0 +1,89 @@
+from json import dumps, loads
+
+# Forecasts resampled to coarser resolutions, e.g. daily summaries for week
+# views instead of 168 hourly rows. Rows are labeled in UTC, as the models are
+# trained, and bucketed in the city's local time. Every parameter has its own
+# aggregations, the numeric ones are computed in one groupby pass, the
+# dominant weather_description from the per bucket counts. Summaries carry
+# the local start of their bucket and the number of hours they cover.
+#
+# pandas is imported on first use, the module is imported by the APIs.
+
+RESOLUTION_HOURS = {
+    '3h': 3,
+    '6h': 6,
+    '12h': 12,
+    'daily': 24
+}
+
+PARAM_AGGREGATIONS = {
+    'humidity': ['min', 'max', 'mean'],
+    'pressure': ['mean'],
+    'temp': ['min', 'max', 'mean'],
+    'wind_speed': ['max', 'mean'],
+    'feels_like': ['min', 'max', 'mean'],
+    'sun_horison_angle': ['max'],
+    'precipitation': ['sum'],
+    'wind_direction': ['circular_mean'],
+    'weather_description': ['mode']
+}
+DEFAULT_AGGREGATIONS = ['mean']
+
+
+def parse_resolution(resolution):
+    if resolution is None or resolution in ('', 'hourly'):
+        return None
+    if resolution not in RESOLUTION_HOURS:
+        raise ValueError(f"Invalid resolution '{resolution}', expected one of {['hourly', *RESOLUTION_HOURS]}")
+    return resolution
+
+
+def aggregate_frame(frame, hours, utc_time_difference=0):
+    import numpy as np
+    import pandas as pd
+
+    local = pd.to_datetime(frame['timestamp']) + pd.Timedelta(hours=utc_time_difference)
+    buckets = local.dt.floor(f'{hours}h').rename('bucket')
+
+    columns, named = {}, {'hours': ('timestamp', 'size')}
+    for param in frame.columns.drop(['timestamp', 'weather_description'], errors='ignore'):
+        for aggregation in PARAM_AGGREGATIONS.get(param, DEFAULT_AGGREGATIONS):
+            if aggregation == 'circular_mean':
+                # Directions average on the unit circle, 350 and 10 to 0.
+                radians = np.deg2rad(frame[param].to_numpy(dtype=np.float64))
+                columns[f'{param}_sin'], columns[f'{param}_cos'] = np.sin(radians), np.cos(radians)
+                named[f'{param}_sin'] = (f'{param}_sin', 'mean')
+                named[f'{param}_cos'] = (f'{param}_cos', 'mean')
+            else:
+                named[f'{param}_{aggregation}'] = (param, aggregation)
+
+    summary = frame.assign(**columns).groupby(buckets).agg(**named)
+    for param in [name[:-len('_sin')] for name in columns if name.endswith('_sin')]:
+        angles = np.rad2deg(np.arctan2(summary.pop(f'{param}_sin'), summary.pop(f'{param}_cos')))
+        summary[f'{param}_circular_mean'] = np.mod(angles, 360)
+
+    if 'weather_description' in frame:
+        counts = frame.groupby([buckets, frame['weather_description']]).size().unstack(fill_value=0)
+        summary['weather_description_mode'] = counts.idxmax(axis=1)
+
+    summary = summary.reset_index()
+    summary.insert(0, 'timestamp', summary.pop('bucket').dt.strftime('%Y-%m-%d %H:%M:%S'))
+    return summary
+
+
+def aggregate_forecast(data, resolution, utc_time_difference=0):
+    if resolution is None or data.get('status') != 'success' or not data['result']:
+        return data
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records([loads(row) for row in data['result']])
+    summary = aggregate_frame(frame, RESOLUTION_HOURS[resolution], utc_time_difference)
+    return dict(data, result=[dumps(row) for row in summary.to_dict(orient='records')])
+
+
+def resample_city_forecast(data, city_name, resolution):
+    # The city's UTC offset comes from the cached lookup of the forecasts.
+    if resolution is None or data.get('status') != 'success':
+        return data
+    from ..model_prediction.model_prediction import get_city_location
+    return aggregate_forecast(data, resolution, get_city_location(city_name)[2])
@@ -0,0 +1,66 @@
+import argparse
+import re
+import subprocess
+import sys
+
+from json import dumps
+
+# Import time of a module in a fresh interpreter, from the `-X importtime`
+# trace: per imported module its own and its cumulative cost, and per top
+# level package the cost of the imports it was first pulled in by.
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+# Modules the API process must not import before the first forecast.
+API_MODULE = 'src.api.app'
+API_DEFERRED_PACKAGES = ['pandas', 'prophet', 'cmdstanpy', 'matplotlib', 'sklearn', 'dotenv']
+
+
+def parse_import_times(trace):
+    # Lines are written when an import finishes, the indentation is the
+    # nesting depth, the first column the module's own time in microseconds.
+    records = []
+    for line in trace.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            records.append({'module': module, 'depth': len(indent) // 2, 'self_us': int(self_us),
+                            'cumulative_us': int(cumulative_us)})
+    return records
+
+
+def profile_imports(module, python=sys.executable):
+    result = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ImportError(f"Failed to import {module}: {result.stderr.strip().splitlines()[-1:]}")
+    return parse_import_times(result.stderr)
+
+
+def summarize_imports(records, top=20):
+    packages = {}
+    for record in records:
+        package = record['module'].split('.')[0]
+        packages[package] = packages.get(package, 0) + record['self_us']
+    return {
+        'total_ms': round(sum(r['self_us'] for r in records) / 1000, 1),
+        'modules': len(records),
+        'packages_ms': {package: round(us / 1000, 1) for package, us in
+                        sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]},
+        'slowest_ms': {r['module']: round(r['cumulative_us'] / 1000, 1) for r in
+                       sorted(records, key=lambda r: r['cumulative_us'], reverse=True)[:top]}
+    }
+
+
+def imported_packages(records, packages):
+    imported = {r['module'].split('.')[0] for r in records}
+    return [package for package in packages if package in imported]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import time report of a module in a fresh interpreter")
+    parser.add_argument('module', nargs='?', default=API_MODULE)
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    records = profile_imports(args.module)
+    print(dumps(summarize_imports(records, args.top), indent=2))
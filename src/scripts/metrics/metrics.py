@@ -0,0 +1,181 @@
+import threading
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import getenv
+from time import perf_counter
+
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, ProcessCollector, REGISTRY,
+                               CONTENT_TYPE_LATEST, generate_latest)
+from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+
+from ..tracing.tracing import start_span
+
+# Prometheus metrics of the APIs, served on /metrics: latency histograms of
+# the forecast stages (city check, model loading, predictions per parameter,
+# the weather_description classifier, serialization), of the requests and of
+# every Redis round trip, the round trips per request, the model cache, the
+# admission and single-flight counters and, from the process collector, RSS.
+#
+# Label cardinality is bounded: the first WEATHER_METRICS_CITY_LABELS known
+# cities a process forecasts get their own city label, the others share
+# 'other', and parameters are the fixed forecast targets. The check_city stage
+# runs before the city is known to exist, it has no city label, so typos and
+# probes do not take up the labels. Observations cost a few
+# microseconds per stage. Every stage is also a trace span (scripts/tracing).
+#
+# Every process keeps its own metrics. With PROMETHEUS_MULTIPROC_DIR set, the
+# gunicorn workers and the ASGI forecast processes write them to files there
+# and /metrics aggregates all of them.
+
+CITY_LABELS = int(getenv('WEATHER_METRICS_CITY_LABELS', 32))
+OTHER_CITY = 'other'
+
+STAGE_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5, 5., 10., 30.)
+REDIS_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .5)
+ROUND_TRIP_BUCKETS = (0, 1, 2, 3, 4, 6, 8, 12, 16, 32, 64)
+
+STAGE_SECONDS = Histogram('weather_forecast_stage_seconds', "Time spent in a forecast stage",
+                          ['stage', 'city', 'param'], buckets=STAGE_BUCKETS)
+REQUEST_SECONDS = Histogram('weather_request_seconds', "Request latency", ['endpoint', 'status'],
+                            buckets=STAGE_BUCKETS)
+REDIS_SECONDS = Histogram('weather_redis_command_seconds', "Redis round trip latency", ['command'],
+                          buckets=REDIS_BUCKETS)
+REDIS_ROUND_TRIPS = Histogram('weather_redis_round_trips_per_request', "Redis round trips of a request",
+                              ['endpoint'], buckets=ROUND_TRIP_BUCKETS)
+MODEL_CACHE_LOOKUPS = Counter('weather_model_cache_lookups', "Model cache lookups", ['result'])
+MODEL_CACHE_ENTRIES = Gauge('weather_model_cache_entries', "Models in the model cache", multiprocess_mode='liveall')
+
+_city_labels = set()
+_city_labels_lock = threading.Lock()
+
+# Redis round trips of the request in progress, per thread and task.
+_request_round_trips = ContextVar('request_round_trips', default=None)
+
+
+def city_label(city_name):
+    # Only for cities checked by check_city_name.
+    city_name = city_name.lower()
+    if city_name in _city_labels:
+        return city_name
+    with _city_labels_lock:
+        if len(_city_labels) < CITY_LABELS:
+            _city_labels.add(city_name)
+            return city_name
+    return OTHER_CITY
+
+
+@contextmanager
+def stage_timer(stage, city_name='', param=''):
+    # Yields the stage's span, for attributes known in the stage.
+    started = perf_counter()
+    try:
+        with start_span(stage, {'weather.city': city_name, 'weather.param': param}) as span:
+            yield span
+    finally:
+        STAGE_SECONDS.labels(stage, city_label(city_name) if city_name else '', param).observe(perf_counter() - started)
+
+
+@contextmanager
+def redis_round_trip(command):
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        REDIS_SECONDS.labels(command).observe(perf_counter() - started)
+        round_trips = _request_round_trips.get()
+        if round_trips is not None:
+            round_trips[0] += 1
+
+
+def redis_command_name(args):
+    command = args[0] if args else 'unknown'
+    return (command.decode() if isinstance(command, bytes) else str(command)).split(' ')[0].upper()
+
+
+def instrument_redis(redis_cnt):
+    # Times the commands of a client, the round trips of its pipelines are
+    # timed where they are executed.
+    execute_command = redis_cnt.execute_command
+
+    def timed_execute_command(*args, **options):
+        with redis_round_trip(redis_command_name(args)):
+            return execute_command(*args, **options)
+    redis_cnt.execute_command = timed_execute_command
+    return redis_cnt
+
+
+def instrument_async_redis(redis_cnt):
+    execute_command = redis_cnt.execute_command
+
+    async def timed_execute_command(*args, **options):
+        with redis_round_trip(redis_command_name(args)):
+            return await execute_command(*args, **options)
+    redis_cnt.execute_command = timed_execute_command
+    return redis_cnt
+
+
+def start_request():
+    return _request_round_trips.set([0]), perf_counter()
+
+
+def finish_request(request, endpoint, status_code):
+    token, started = request
+    REQUEST_SECONDS.labels(endpoint or 'unknown', str(status_code)).observe(perf_counter() - started)
+    round_trips = _request_round_trips.get()
+    if endpoint and round_trips is not None:
+        REDIS_ROUND_TRIPS.labels(endpoint).observe(round_trips[0])
+    _request_round_trips.reset(token)
+
+
+def count_model_cache_lookup(result, entries=None):
+    MODEL_CACHE_LOOKUPS.labels(result).inc()
+    if entries is not None:
+        MODEL_CACHE_ENTRIES.set(entries)
+
+
+class ApiStatsCollector:
+    # The admission and single-flight counters of the serving process.
+    def describe(self):
+        # Registered without collecting, which imports the API modules.
+        return []
+
+    def collect(self):
+        from ..admission.admission import get_admission_stats
+        from ..single_flight.single_flight import SINGLE_FLIGHT_STATS
+
+        gauges = {name: GaugeMetricFamily(f'weather_admission_{name}', f"Admission {name} requests", labels=['endpoint'])
+                  for name in ['active', 'waiting']}
+        counters = {name: CounterMetricFamily(f'weather_admission_{name}', f"Admission {name} requests",
+                                              labels=['endpoint'])
+                    for name in ['admitted', 'shed_queue_full', 'shed_deadline', 'degraded']}
+        wait = CounterMetricFamily('weather_admission_wait_seconds', "Time spent waiting for admission",
+                                   labels=['endpoint'])
+        for endpoint, stats in get_admission_stats().items():
+            for name, family in {**gauges, **counters}.items():
+                family.add_metric([endpoint], stats[name])
+            wait.add_metric([endpoint], stats['wait_s_total'])
+        yield from gauges.values()
+        yield from counters.values()
+        yield wait
+
+        single_flight = CounterMetricFamily('weather_single_flight_forecasts', "Single flight forecasts",
+                                            labels=['outcome'])
+        for name, value in SINGLE_FLIGHT_STATS.items():
+            single_flight.add_metric([name], value)
+        yield single_flight
+
+
+REGISTRY.register(ApiStatsCollector())
+
+
+def generate_metrics():
+    # Returns the exposition body and its content type.
+    if getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        ProcessCollector(registry=registry)
+        registry.register(ApiStatsCollector())
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,226 @@
+import argparse
+import logging
+import math
+import mmap
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+from json import dumps, loads
+from os import path, listdir
+
+from ..tree_model.tree_model import (TreeModel, tree_model_arrays, read_npz_arrays,
+    TREE_MODEL_EXTENSION)
+
+# All models of a city in one read-only file that every API worker maps into
+# memory, so the parameter arrays live once in the page cache instead of once
+# per deserialized model per worker:
+#
+#   header   magic, format version, table of contents length, data offset
+#   toc      JSON, per product its kind, scalars and array offsets/dtypes/shapes
+#   data     the arrays, each starting on an ARRAY_ALIGN boundary
+#
+# Prophet models are reduced to what a point forecast needs: the piecewise
+# linear trend and the Fourier seasonality coefficients.
+
+MODEL_PACK_FILENAME = 'models.pack'
+MODEL_PACK_MAGIC = b'WTHRPACK'
+MODEL_PACK_FORMAT_VERSION = 1
+MODEL_PACK_HEADER = struct.Struct('<8sHHIQ')
+ARRAY_ALIGN = 64
+
+NANOSECONDS_PER_SECOND = 10 ** 9
+SECONDS_PER_DAY = 60 * 60 * 24
+
+
+class PackedProphetModel:
+    def __init__(self, arrays, start, t_scale, y_scale, floor, k, m, last_ds):
+        self.changepoints_t = arrays['changepoints_t']
+        self.rate_steps = arrays['rate_steps']
+        self.offset_steps = arrays['offset_steps']
+        self.frequencies = arrays['frequencies']
+        self.beta_sin = arrays['beta_sin']
+        self.beta_cos = arrays['beta_cos']
+        self.multiplicative = arrays['multiplicative']
+        self.start, self.t_scale = start, t_scale
+        self.y_scale, self.floor = y_scale, floor
+        self.k, self.m = k, m
+        self.last_ds = pd.Timestamp(last_ds)
+
+    def make_future_dataframe(self, periods, freq='h', include_history=False):
+        # The pack keeps no training history, only future dates are returned.
+        dates = pd.date_range(start=self.last_ds, periods=periods + 1, freq=freq)
+        return pd.DataFrame({'ds': dates[dates > self.last_ds][:periods]})
+
+    def predict(self, df):
+        ds = pd.to_datetime(df['ds']).reset_index(drop=True)
+        nanoseconds = ds.to_numpy(dtype=np.int64)
+
+        # Same piecewise linear trend as Prophet, with the changepoint sums
+        # precomputed as steps.
+        t = (nanoseconds - self.start) / self.t_scale
+        steps = np.searchsorted(self.changepoints_t, t, side='right')
+        trend = ((self.k + self.rate_steps[steps]) * t + self.m + self.offset_steps[steps]) * self.y_scale
+        trend += self.floor
+
+        days = (nanoseconds // NANOSECONDS_PER_SECOND) / SECONDS_PER_DAY
+        angles = np.multiply.outer(days, self.frequencies)
+        terms = np.sin(angles) * self.beta_sin + np.cos(angles) * self.beta_cos
+        multiplicative_terms = terms @ self.multiplicative
+        additive_terms = (terms @ (1 - self.multiplicative)) * self.y_scale
+
+        return pd.DataFrame({
+            'ds': ds,
+            'trend': trend,
+            'additive_terms': additive_terms,
+            'multiplicative_terms': multiplicative_terms,
+            'yhat': trend * (1 + multiplicative_terms) + additive_terms
+        })
+
+
+def prophet_pack_entry(model):
+    if (model.growth != 'linear' or model.extra_regressors or model.holidays is not None
+            or model.country_holidays is not None
+            or any(props['condition_name'] is not None for props in model.seasonalities.values())):
+        return None
+
+    deltas = np.nanmean(model.params['delta'], axis=0)
+    beta = np.nanmean(model.params['beta'], axis=0)
+    changepoints_t = np.asarray(model.changepoints_t, dtype=np.float64)
+
+    frequencies, multiplicative = [], []
+    for props in model.seasonalities.values():
+        for order in range(1, props['fourier_order'] + 1):
+            frequencies.append(2 * np.pi * order / props['period'])
+            multiplicative.append(float(props['mode'] == 'multiplicative'))
+
+    scalars = {
+        'start': int(model.start.value),
+        't_scale': int(model.t_scale.value),
+        'y_scale': float(model.y_scale),
+        'floor': float(model.y_min) if model.scaling == 'minmax' else 0.,
+        'k': float(np.nanmean(model.params['k'])),
+        'm': float(np.nanmean(model.params['m'])),
+        'last_ds': str(model.history_dates.max())
+    }
+    arrays = {
+        'changepoints_t': changepoints_t,
+        'rate_steps': np.concatenate([[0.], np.cumsum(deltas)]),
+        'offset_steps': np.concatenate([[0.], np.cumsum(-changepoints_t * deltas)]),
+        'frequencies': np.array(frequencies, dtype=np.float64),
+        'beta_sin': np.ascontiguousarray(beta[0::2], dtype=np.float64),
+        'beta_cos': np.ascontiguousarray(beta[1::2], dtype=np.float64),
+        'multiplicative': np.array(multiplicative, dtype=np.float64)
+    }
+    return 'prophet', scalars, arrays
+
+
+def tree_pack_entry(arrays):
+    return 'tree', {}, {name: array for name, array in arrays.items() if name != 'format_version'}
+
+
+def read_model_file(filename):
+    from ..model_training.utils.utils import load_prophet_model, load_sklearn_model
+
+    if filename.endswith(TREE_MODEL_EXTENSION):
+        return tree_pack_entry(read_npz_arrays(filename, mmap_file=False))
+    if filename.endswith('.pkl'):
+        return tree_pack_entry(tree_model_arrays(load_sklearn_model(filename)))
+    return prophet_pack_entry(load_prophet_model(filename))
+
+
+def write_model_pack(filename, entries, metadata=None):
+    toc = dict(metadata or {})
+    toc['products'] = {}
+    blobs, size = [], 0
+    for product, (kind, scalars, arrays) in entries.items():
+        layout = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            size += -size % ARRAY_ALIGN
+            layout[name] = [size, array.dtype.str, list(array.shape)]
+            blobs.append((size, array))
+            size += array.nbytes
+        toc['products'][product] = {'kind': kind, 'scalars': scalars, 'arrays': layout}
+
+    toc_bytes = dumps(toc, sort_keys=True).encode('UTF-8')
+    data_offset = MODEL_PACK_HEADER.size + len(toc_bytes)
+    data_offset += -data_offset % ARRAY_ALIGN
+
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_filename, 'wb') as f:
+        f.write(MODEL_PACK_HEADER.pack(MODEL_PACK_MAGIC, MODEL_PACK_FORMAT_VERSION, 0, len(toc_bytes), data_offset))
+        f.write(toc_bytes)
+        for offset, array in blobs:
+            f.seek(data_offset + offset)
+            f.write(array.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+    return sorted(toc['products'])
+
+
+def build_model_pack(models_dir, products, filename=None):
+    # products maps product names to model files inside models_dir. Models
+    # the pack cannot represent are left out and keep being served from
+    # their own files.
+    entries = {}
+    for product, model_file in products.items():
+        entry = read_model_file(path.join(models_dir, model_file))
+        if entry is None:
+            logging.info(f"Model '{model_file}' is not supported by the model pack, skipped")
+            continue
+        entries[product] = entry
+    if filename is None:
+        filename = path.join(models_dir, MODEL_PACK_FILENAME)
+    return write_model_pack(filename, entries)
+
+
+def load_model_pack(filename):
+    try:
+        with open(filename, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, PermissionError) as e:
+        logging.error(f"Failed to open model pack '{filename}': {e}")
+        raise e
+
+    magic, version, _, toc_length, data_offset = MODEL_PACK_HEADER.unpack_from(buffer, 0)
+    if magic != MODEL_PACK_MAGIC or version != MODEL_PACK_FORMAT_VERSION:
+        logging.error(f"Failed to load '{filename}': not a model pack of format version {MODEL_PACK_FORMAT_VERSION}")
+        raise ValueError("Unsupported model pack")
+    toc = loads(buffer[MODEL_PACK_HEADER.size:MODEL_PACK_HEADER.size + toc_length])
+
+    models = {}
+    for product, entry in toc['products'].items():
+        arrays = {name: np.frombuffer(buffer, dtype=np.dtype(dtype), count=math.prod(shape),
+                                      offset=data_offset + offset).reshape(shape)
+                  for name, (offset, dtype, shape) in entry['arrays'].items()}
+        if entry['kind'] == 'tree':
+            models[product] = TreeModel(arrays)
+        else:
+            models[product] = PackedProphetModel(arrays, **entry['scalars'])
+    return models
+
+
+def convert_city_models(models_dir):
+    products = {}
+    for filename in sorted(listdir(models_dir)):
+        product, extension = path.splitext(filename)
+        if extension in ('.json', '.pkl', TREE_MODEL_EXTENSION) and filename != 'manifest.json':
+            # A converted .npz tree wins over the pickle it was converted from.
+            if products.get(product, '').endswith(TREE_MODEL_EXTENSION):
+                continue
+            products[product] = filename
+    return build_model_pack(models_dir, products)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Pack the model files of city directories into one model pack each")
+    parser.add_argument('models_dirs', nargs='+', help="directories with <product>.json|.pkl|.npz model files")
+    args = parser.parse_args()
+
+    for models_dir in args.models_dirs:
+        logging.info(f"Packed {convert_city_models(models_dir)} into '{path.join(models_dir, MODEL_PACK_FILENAME)}'")
@@ -2,8 +2,14 @@ import pandas as pd
 from os import path
 from csv import reader
 from dotenv import load_dotenv, dotenv_values
-from sklearn.tree import DecisionTreeClassifier
 from ..model_training.utils.utils import load_prophet_model, load_sklearn_model, handle_error
+from ..tree_model.tree_model import load_tree_model, TREE_MODEL_EXTENSION
+from ..model_pack.model_pack import load_model_pack, MODEL_PACK_FILENAME
+from ..model_registry.model_registry import read_current_manifest, get_engine_model_file
+from ..model_training.global_model.global_model import load_global_model, GLOBAL_MODEL_NAME
+from ..model_training.harmonic.harmonic import load_harmonic_model, HARMONIC_ENGINE
+from ..metrics.metrics import stage_timer, count_model_cache_lookup
+from ..tracing.tracing import start_span
 from json import loads, dumps
 from ...redis.get.get import get_city, check_city_name, match_time_difference, construct_searchable_city_names
 
@@ -23,14 +29,22 @@ TARGET_PARAMETERS = [
     'weather_description'
 ]
 
-def predict_hourly_city_weather(city_name, prediction_hours, target_params=TARGET_PARAMETERS):
+def predict_hourly_city_weather(city_name, prediction_hours, target_params=TARGET_PARAMETERS,
+                                global_params=None, engines=None):
 
     if len(set(target_params) - set(TARGET_PARAMETERS)) > 0:
         handle_error("Failed to make predictions: invalid target parameters provided", ValueError)
+    engines = resolve_engines(engines, target_params)
 
-    if check_city_name(city_name):
+    # Cities are labelled once known, see metrics.city_label.
+    with stage_timer('check_city') as span:
+        span.set_attribute('weather.city', city_name)
+        known_city = check_city_name(city_name)
+    if known_city:
         result = False
-        models_and_time_diff = open_weather_models(city_name, prediction_hours, target_params=target_params)
+        with stage_timer('open_models', city_name):
+            models_and_time_diff = open_weather_models(city_name, prediction_hours, target_params=target_params,
+                                                       global_params=global_params, engines=engines)
         models = models_and_time_diff['models']
         new_prediction_hours = int(models_and_time_diff['prediction_hours'])
         
@@ -38,8 +52,10 @@ def predict_hourly_city_weather(city_name, prediction_hours, target_params=TARGE
             m = models[param]
             try:
                 if param != 'weather_description':
-                    future = m.make_future_dataframe(periods=new_prediction_hours, freq='h')
-                    forecast = m.predict(future)
+                    with stage_timer('predict', city_name, param) as span:
+                        future = m.make_future_dataframe(periods=new_prediction_hours, freq='h')
+                        forecast = m.predict(future)
+                        span.set_attribute('weather.rows', len(future))
 
                     forecast = pd.DataFrame(data=forecast)
 
@@ -55,43 +71,259 @@ def predict_hourly_city_weather(city_name, prediction_hours, target_params=TARGE
                         result = pd.merge(result, forecast, on='timestamp', how='left')
                 else:
                     if isinstance(result, pd.DataFrame):
-                        weather_description = m.predict(result[target_params[:-1]])
+                        with stage_timer('classify', city_name, param) as span:
+                            weather_description = m.predict(result[target_params[:-1]])
+                            span.set_attribute('weather.rows', len(result))
                         result['weather_description'] = weather_description
                         
             except Exception as e:
                 handle_error("Failed to make predictions, error occured: ", e)
             
-        result["timestamp"] = pd.to_datetime(result["timestamp"], unit="s")
-        data_list = result[-int(prediction_hours):].to_dict(orient='records')
-        for row in data_list:
-            row["timestamp"] = row["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-        json_objects = [dumps(row) for row in data_list]
+        with stage_timer('serialize', city_name):
+            result["timestamp"] = pd.to_datetime(result["timestamp"], unit="s")
+            data_list = result[-int(prediction_hours):].to_dict(orient='records')
+            for row in data_list:
+                row["timestamp"] = row["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
+            json_objects = [dumps(row) for row in data_list]
         
         return {"result": json_objects, "status": "success"}
     else: return {"result": [], "status": "error", "message": f"No data found for {city_name}"}
     
 
 from time import mktime, time
+from collections import OrderedDict
+from os import getenv
+from threading import Lock
 
-def open_weather_models(city_name, prediction_hours, target_params=TARGET_PARAMETERS):
+MODELS_DIR = getenv('WEATHER_MODELS_DIR', '/weather/data/models/')
+
+# Parameters forecast by the global multi-city model instead of the city's
+# own models, e.g. WEATHER_GLOBAL_MODEL_PARAMS=temp,humidity
+GLOBAL_MODEL_PARAMS = frozenset(p for p in getenv('WEATHER_GLOBAL_MODEL_PARAMS', '').split(',') if p)
+
+# Forecasting engine per parameter instead of the city's Prophet models,
+# e.g. WEATHER_PARAM_ENGINES=temp=harmonic,humidity=harmonic
+ENGINE_LOADERS = {
+    HARMONIC_ENGINE: load_harmonic_model
+}
+PARAM_ENGINES = dict(item.split('=', 1) for item in getenv('WEATHER_PARAM_ENGINES', '').split(',') if '=' in item)
+
+# Published model versions never change on disk, so models loaded from a
+# version directory are cached by path. Legacy flat files are not cached.
+MODEL_CACHE_SIZE = 512
+_model_cache = OrderedDict()
+_model_cache_lock = Lock()
+
+# Locations and UTC offsets of the cities, from the Redis catalog, which may
+# be reseeded: entries expire after WEATHER_CITY_LOCATION_TTL seconds.
+CITY_LOCATION_TTL_S = int(getenv('WEATHER_CITY_LOCATION_TTL', 300))
+CITY_LOCATION_CACHE_SIZE = 4096
+_city_locations = OrderedDict()
+_city_locations_lock = Lock()
+
+def load_cached(filepath, load, cacheable=False):
+    with start_span('load_model', {'weather.model_file': filepath}) as span:
+        if cacheable:
+            with _model_cache_lock:
+                if filepath in _model_cache:
+                    _model_cache.move_to_end(filepath)
+                    count_model_cache_lookup('hit')
+                    span.set_attribute('weather.cache_hit', True)
+                    return _model_cache[filepath]
+
+        model = load(filepath)
+
+        if cacheable:
+            with _model_cache_lock:
+                _model_cache[filepath] = model
+                if len(_model_cache) > MODEL_CACHE_SIZE:
+                    _model_cache.popitem(last=False)
+                count_model_cache_lookup('miss', len(_model_cache))
+            span.set_attribute('weather.cache_hit', False)
+        else:
+            count_model_cache_lookup('uncached')
+        return model
+
+def read_weather_model(filepath, param):
+    if filepath.endswith(TREE_MODEL_EXTENSION):
+        return load_tree_model(filepath)
+    elif param == 'weather_description':
+        # Pickles published before the .npz export, needs sklearn installed.
+        return load_sklearn_model(filepath)
+    return load_prophet_model(filepath)
+
+def load_weather_model(filepath, param, cacheable=False):
+    return load_cached(filepath, lambda filepath: read_weather_model(filepath, param), cacheable)
+
+def resolve_engines(engines, params):
+    # engines maps parameters to engine names, a single name applies to every
+    # parameter of the request. 'prophet' selects the city's own models.
+    if engines is None:
+        engines = PARAM_ENGINES
+    elif isinstance(engines, str):
+        engines = {param: engines for param in params if param != 'weather_description'}
+    invalid = set(engines.values()) - set(ENGINE_LOADERS) - {'prophet'}
+    if invalid:
+        handle_error(f"Failed to make predictions: unknown engines {sorted(invalid)}", ValueError)
+    return {param: engine for param, engine in engines.items() if engine in ENGINE_LOADERS}
+
+def load_engine_model(filepath, engine, cacheable=False):
+    return load_cached(filepath, ENGINE_LOADERS[engine], cacheable)
+
+def get_city_location(city_name):
+    with _city_locations_lock:
+        cached = _city_locations.get(city_name)
+        if cached is not None and cached[0] > time():
+            return cached[1]
+    city = loads(get_city(city_name, 0, 1, exact_match=True))["result"][0]
+    location = float(city["lat"]), float(city["lon"]), float(city["utc_time_difference"])
+    with _city_locations_lock:
+        _city_locations[city_name] = (time() + CITY_LOCATION_TTL_S, location)
+        _city_locations.move_to_end(city_name)
+        if len(_city_locations) > CITY_LOCATION_CACHE_SIZE:
+            _city_locations.popitem(last=False)
+    return location
+
+def open_global_models(city_name, params):
     res = {}
+    manifest = read_current_manifest(path.join(MODELS_DIR, GLOBAL_MODEL_NAME))
+    if manifest is None:
+        return res
+    for param in params:
+        entry = manifest['products'].get(param)
+        if entry is not None:
+            global_model = load_cached(path.join(manifest['version_dir'], entry['file']), load_global_model,
+                                       cacheable=True)
+            res[param] = global_model.city_model(param, city_name, get_city_location(city_name))
+    return res
+
+def open_weather_models(city_name, prediction_hours, target_params=TARGET_PARAMETERS, global_params=None,
+                        engines=None):
+    global_params = GLOBAL_MODEL_PARAMS if global_params is None else global_params
+    engines = resolve_engines(engines, target_params)
+    res = open_global_models(city_name, [p for p in target_params if p in global_params])
     model_last_index = None
-    for param in target_params:
-        filepath = path.join('/weather/data/models/', city_name, param)
-        if param == 'weather_description':
-            filepath += '.pkl'
-        else:
-            filepath += '.json'
-        if path.isfile(filepath):
+    for model in res.values():
+        model_last_index = model.last_ds.strftime('%Y-%m-%d %H:%M:%S')
+    # Parameters without a global model fall back to the city's own models.
+    target_params = [p for p in target_params if p not in res]
+    manifest = read_current_manifest(path.join(MODELS_DIR, city_name))
+    if manifest is not None:
+        # Every model of the request comes from the same published version.
+        pack = manifest.get('pack')
+        packed = load_cached(path.join(manifest['version_dir'], pack['file']), load_model_pack,
+                             cacheable=True) if pack else {}
+        engine_entries = manifest.get('engines', {})
+        for param in target_params:
+            entry = manifest['products'].get(param)
+            engine_entry = engine_entries.get(engines.get(param), {}).get(param)
+            if engine_entry is not None:
+                res[param] = load_engine_model(path.join(manifest['version_dir'], engine_entry['file']),
+                                               engines[param], cacheable=True)
+                model_last_index = engine_entry['last_ds']
+            elif entry is not None:
+                if param in packed:
+                    res[param] = packed[param]
+                else:
+                    res[param] = load_weather_model(path.join(manifest['version_dir'], entry['file']),
+                                                    param, cacheable=True)
+                if param != 'weather_description':
+                    model_last_index = entry['last_ds']
+    else:
+        pack_filepath = path.join(MODELS_DIR, city_name, MODEL_PACK_FILENAME)
+        packed = load_model_pack(pack_filepath) if path.isfile(pack_filepath) else {}
+        for param in target_params:
+            if param in engines:
+                filepath = path.join(MODELS_DIR, city_name, get_engine_model_file(engines[param], param))
+                if path.isfile(filepath):
+                    res[param] = load_engine_model(filepath, engines[param])
+                    model_last_index = res[param].last_ds.strftime('%Y-%m-%d %H:%M:%S')
+                    continue
+            if param in packed:
+                res[param] = packed[param]
+                if param != 'weather_description':
+                    model_last_index = packed[param].last_ds.strftime('%Y-%m-%d %H:%M:%S')
+                continue
+            filepath = path.join(MODELS_DIR, city_name, param)
             if param == 'weather_description':
-                res[param] = load_sklearn_model(filepath)
+                filepath += TREE_MODEL_EXTENSION if path.isfile(filepath + TREE_MODEL_EXTENSION) else '.pkl'
             else:
-                res[param] = load_prophet_model(filepath)
-                model_last_index = res[param].history.tail(1)['ds'].iloc[0].strftime('%Y-%m-%d %H:%M:%S')
+                filepath += '.json'
+            if path.isfile(filepath):
+                res[param] = load_weather_model(filepath, param)
+                if param != 'weather_description':
+                    model_last_index = res[param].history.tail(1)['ds'].iloc[0].strftime('%Y-%m-%d %H:%M:%S')
 
     prediction_hours =  match_time_difference(city_name=city_name, 
                                              model_last_index=model_last_index) + int(prediction_hours) 
     return {'models': res, 'prediction_hours': prediction_hours}
 
 
+# Hours per block of a streamed forecast. Every block is predicted and
+# serialized on its own, memory is bounded by the block instead of the horizon.
+STREAM_BLOCK_HOURS = int(getenv('WEATHER_STREAM_BLOCK_HOURS', 168))
+
+def forecast_timestamps(models, target_params, new_prediction_hours, prediction_hours):
+    # The hours predict_hourly_city_weather returns, the last prediction_hours
+    # of the first parameter's future.
+    first = models[next(param for param in target_params if param != 'weather_description')]
+    future = first.make_future_dataframe(periods=new_prediction_hours, freq='h')
+    return pd.to_datetime(future['ds'])[-prediction_hours:].reset_index(drop=True)
+
+def predict_forecast_block(models, target_params, timestamps, city_name=''):
+    block = pd.DataFrame({'timestamp': timestamps})
+    for param in target_params:
+        try:
+            if param != 'weather_description':
+                with stage_timer('predict', city_name, param) as span:
+                    block[param] = models[param].predict(pd.DataFrame({'ds': timestamps}))['yhat'].to_numpy()
+                    span.set_attribute('weather.rows', len(timestamps))
+            else:
+                with stage_timer('classify', city_name, param) as span:
+                    block['weather_description'] = models[param].predict(block[target_params[:-1]])
+                    span.set_attribute('weather.rows', len(timestamps))
+        except Exception as e:
+            handle_error("Failed to make predictions, error occured: ", e)
+    return block
+
+def generate_forecast_lines(models, target_params, timestamps, block_hours, city_name=''):
+    for start in range(0, len(timestamps), block_hours):
+        block = predict_forecast_block(models, target_params, timestamps[start:start + block_hours], city_name)
+        with stage_timer('serialize', city_name):
+            data_list = block.to_dict(orient='records')
+            for row in data_list:
+                row["timestamp"] = row["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
+            lines = ''.join(dumps(row) + '\n' for row in data_list)
+        yield lines
+
+def stream_hourly_city_weather(city_name, prediction_hours, target_params=TARGET_PARAMETERS,
+                               global_params=None, engines=None, since=None, block_hours=None):
+    # Same rows as predict_hourly_city_weather, as a generator of NDJSON
+    # blocks. The models are opened before it returns, so unknown cities and
+    # missing models fail before the first byte is sent.
+    if len(set(target_params) - set(TARGET_PARAMETERS)) > 0:
+        handle_error("Failed to make predictions: invalid target parameters provided", ValueError)
+    engines = resolve_engines(engines, target_params)
+
+    # Cities are labelled once known, see metrics.city_label.
+    with stage_timer('check_city') as span:
+        span.set_attribute('weather.city', city_name)
+        known_city = check_city_name(city_name)
+    if not known_city:
+        return {"result": [], "status": "error", "message": f"No data found for {city_name}"}
+
+    with stage_timer('open_models', city_name):
+        models_and_time_diff = open_weather_models(city_name, prediction_hours, target_params=target_params,
+                                                   global_params=global_params, engines=engines)
+    models = models_and_time_diff['models']
+    missing = [param for param in target_params if param not in models]
+    if missing:
+        handle_error(f"Failed to make predictions: no models for {missing}", FileNotFoundError)
 
+    timestamps = forecast_timestamps(models, target_params, int(models_and_time_diff['prediction_hours']),
+                                     int(prediction_hours))
+    if since is not None:
+        timestamps = timestamps[timestamps > pd.Timestamp(since)].reset_index(drop=True)
+    return {"result": generate_forecast_lines(models, target_params, timestamps, block_hours or STREAM_BLOCK_HOURS,
+                                              city_name),
+            "status": "success"}
@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import os
+import shutil
+
+from datetime import datetime, timezone
+from json import dumps, loads, JSONDecodeError
+from os import path, makedirs, listdir
+
+# Models of a city live in immutable version directories:
+#
+#   <models_dir>/<city>/versions/<version>/<product>.json|.npz
+#   <models_dir>/<city>/versions/<version>/<product>.<engine>.npz
+#   <models_dir>/<city>/versions/<version>/manifest.json
+#   <models_dir>/<city>/CURRENT          <- name of the published version
+#
+# A version is written completely before CURRENT is swapped to it with an
+# atomic rename, so readers never see a half-written model set.
+
+CURRENT_POINTER = 'CURRENT'
+VERSIONS_DIR = 'versions'
+MANIFEST_FILENAME = 'manifest.json'
+KEEP_VERSIONS = 5
+
+MODEL_EXTENSIONS = {
+    'weather_description': '.npz'
+}
+
+_manifest_cache = {}
+
+
+def get_model_file(product):
+    return product + MODEL_EXTENSIONS.get(product, '.json')
+
+
+def get_engine_model_file(engine, product):
+    return f'{product}.{engine}.npz'
+
+
+def get_version_dir(city_dir, version):
+    return path.join(city_dir, VERSIONS_DIR, version)
+
+
+def create_version(city_dir, version):
+    version_dir = get_version_dir(city_dir, version)
+    makedirs(version_dir, exist_ok=True)
+    return version_dir
+
+
+def new_version_id():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+
+
+def describe_model_file(filename):
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return {'file': path.basename(filename), 'bytes': path.getsize(filename), 'sha256': sha.hexdigest()}
+
+
+def write_file_atomically(filename, content):
+    tmp_filename = f'{filename}.{os.getpid()}.tmp'
+    with open(tmp_filename, 'w') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_filename, filename)
+
+
+def get_current_version(city_dir):
+    manifest = read_current_manifest(city_dir)
+    return manifest['version'] if manifest else None
+
+
+def read_current_manifest(city_dir):
+    pointer = path.join(city_dir, CURRENT_POINTER)
+    try:
+        stat = os.stat(pointer)
+    except FileNotFoundError:
+        return None
+
+    # The pointer is replaced, never rewritten in place, so its inode
+    # changes on every publish and a stat is enough to validate the cache.
+    key = (stat.st_ino, stat.st_mtime_ns)
+    cached = _manifest_cache.get(city_dir)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    with open(pointer, 'r') as f:
+        version = f.read().strip()
+    version_dir = get_version_dir(city_dir, version)
+    try:
+        with open(path.join(version_dir, MANIFEST_FILENAME), 'r') as f:
+            manifest = loads(f.read())
+    except (FileNotFoundError, JSONDecodeError) as e:
+        logging.error(f"Failed to read manifest of published version '{version_dir}': {e}")
+        raise e
+
+    manifest['version'] = version
+    manifest['version_dir'] = version_dir
+    _manifest_cache[city_dir] = (key, manifest)
+    return manifest
+
+
+def carry_over_model(source_dir, target_dir, filename):
+    source, target = path.join(source_dir, filename), path.join(target_dir, filename)
+    if path.exists(target):
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def carry_over_models(city_dir, version, products):
+    version_dir = get_version_dir(city_dir, version)
+    current = read_current_manifest(city_dir)
+
+    products = dict(products)
+    if current is not None and current['version'] != version:
+        # Products that were not retrained keep serving the previous model.
+        for product, entry in current['products'].items():
+            if product not in products:
+                carry_over_model(current['version_dir'], version_dir, entry['file'])
+                products[product] = entry
+    return products
+
+
+def publish_version(city_dir, version, products, metadata=None):
+    version_dir = get_version_dir(city_dir, version)
+    products = carry_over_models(city_dir, version, products)
+
+    manifest = dict(metadata or {})
+    manifest.update({
+        'published_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'products': products
+    })
+    write_file_atomically(path.join(version_dir, MANIFEST_FILENAME), dumps(manifest, indent=2, sort_keys=True))
+    write_file_atomically(path.join(city_dir, CURRENT_POINTER), version)
+    prune_versions(city_dir)
+    return manifest
+
+
+def prune_versions(city_dir, keep=KEEP_VERSIONS):
+    versions_dir = path.join(city_dir, VERSIONS_DIR)
+    current = get_current_version(city_dir)
+    if current is None:
+        return
+    # Only versions older than the published one, newer ones may be staging.
+    # Keep a few previous versions, requests pinned to them may still be loading.
+    versions = sorted(v for v in listdir(versions_dir) if v < current)
+    for version in versions[:max(len(versions) - (keep - 1), 0)]:
+        shutil.rmtree(path.join(versions_dir, version), ignore_errors=True)
@@ -0,0 +1,79 @@
+import hashlib
+
+import pandas as pd
+
+from json import dumps
+
+from ..utils.utils import handle_error
+
+FINGERPRINT_KEYS = ['rows',
+                    'first_timestamp',
+                    'last_timestamp',
+                    'content_hash',
+                    'hyperparameters_hash',
+                    'code_version']
+
+RETRAIN_POLICIES = ['full', 'warm', 'auto']
+
+# With the 'auto' policy a warm start is used while the appended rows stay
+# below this fraction of the previous training set, larger updates refit fully.
+AUTO_WARM_MAX_NEW_ROWS_FRACTION = 0.1
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_rows(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def hash_config(config):
+    return digest(dumps(config, sort_keys=True, default=str).encode('UTF-8'))
+
+
+def hash_files(filenames):
+    sha = hashlib.sha256()
+    for filename in sorted(set(filenames)):
+        with open(filename, 'rb') as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def compute_fingerprint(df, timestamp_column, hyperparameters, code_files):
+    return {
+        'rows': len(df),
+        'first_timestamp': str(df[timestamp_column].iloc[0]) if len(df) else None,
+        'last_timestamp': str(df[timestamp_column].iloc[-1]) if len(df) else None,
+        'content_hash': digest(hash_rows(df).tobytes()),
+        'hyperparameters_hash': hash_config(hyperparameters),
+        'code_version': hash_files(code_files)
+    }
+
+
+def compute_prefix_hash(df, rows):
+    if rows > len(df):
+        return None
+    return digest(hash_rows(df.iloc[:rows]).tobytes())
+
+
+def plan_retraining(previous, current, prefix_hash=None, policy='auto',
+                    max_new_rows_fraction=AUTO_WARM_MAX_NEW_ROWS_FRACTION):
+    if policy not in RETRAIN_POLICIES:
+        handle_error(f"Failed to plan retraining: policy must be one of {RETRAIN_POLICIES}", ValueError)
+    if previous is None:
+        return 'full'
+    if all(previous.get(key) == current[key] for key in FINGERPRINT_KEYS):
+        return 'skip'
+
+    only_appended = (previous['hyperparameters_hash'] == current['hyperparameters_hash']
+                     and previous['code_version'] == current['code_version']
+                     and current['rows'] > previous['rows']
+                     and prefix_hash == previous['content_hash'])
+    if not only_appended or policy == 'full':
+        return 'full'
+    if policy == 'warm':
+        return 'warm'
+
+    new_rows_fraction = (current['rows'] - previous['rows']) / max(previous['rows'], 1)
+    return 'warm' if new_rows_fraction <= max_new_rows_fraction else 'full'
@@ -0,0 +1,191 @@
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from os import path
+
+from ..ridge.ridge import harmonic_features, normal_equations, solve_ridge, SECONDS_PER_DAY, SECONDS_PER_YEAR
+from ..utils.utils import handle_error
+from ...tree_model.tree_model import write_aligned_npz, read_npz_arrays
+from ...model_registry.model_registry import (create_version, new_version_id, describe_model_file,
+    publish_version)
+
+# One model per parameter for all cities instead of one Prophet model per
+# city and parameter. The parameters share a single multi-output ridge
+# regression on daily (local time) and yearly harmonics, each interacting
+# with the city's latitude, longitude and UTC offset. Fitting accumulates the
+# normal equations city by city, so the training set is never held in memory
+# at once, and serving loads one small file whatever the number of cities.
+#
+# The regression describes the climate of a place. To carry the current
+# weather into the first forecast hours, the mean residual of each city's
+# last bias_hours is stored and added with an exponential decay.
+
+CITIES_CATALOG_FILENAME = 'data/cities/cities.csv'
+GLOBAL_MODEL_NAME = '_global'
+GLOBAL_MODEL_FILE = 'global_model.npz'
+GLOBAL_MODEL_FORMAT_VERSION = 1
+
+GLOBAL_MODEL_CONFIG = {
+    'alpha': 1.0,
+    'day_order': 3,
+    'year_order': 2,
+    'bias_hours': 72,
+    'bias_half_life_hours': 24.
+}
+
+SECONDS_PER_HOUR = 60 * 60
+
+
+class GlobalModel:
+    def __init__(self, arrays):
+        self.coef = arrays['coef']
+        self.products = list(arrays['products'])
+        self.cities = {city: i for i, city in enumerate(arrays['cities'])}
+        self.bias = arrays['bias']
+        self.last_timestamp = arrays['last_timestamp']
+        self.config = {'day_order': int(arrays['day_order'][0]),
+                       'year_order': int(arrays['year_order'][0]),
+                       'bias_half_life_hours': float(arrays['bias_half_life_hours'][0])}
+
+    def city_model(self, product, city_name, location):
+        if product not in self.products:
+            handle_error(f"Failed to open global model: product '{product}' is not in the global model", ValueError)
+        column = self.products.index(product)
+        city = self.cities.get(city_name.lower())
+        if city is None:
+            # Cities without training data are forecast from their location only.
+            return GlobalCityModel(self.coef[:, column], 0., int(self.last_timestamp.max()), location, self.config)
+        return GlobalCityModel(self.coef[:, column], float(self.bias[city, column]),
+                               int(self.last_timestamp[city]), location, self.config)
+
+
+class GlobalCityModel:
+    def __init__(self, coef, bias, last_timestamp, location, config):
+        self.coef = coef
+        self.bias = bias
+        self.last_timestamp = last_timestamp
+        self.location = location
+        self.config = config
+        self.last_ds = pd.Timestamp(last_timestamp, unit='s')
+
+    def make_future_dataframe(self, periods, freq='h', include_history=False):
+        # Like a packed model, only future dates are returned.
+        dates = pd.date_range(start=self.last_ds, periods=periods + 1, freq=freq)
+        return pd.DataFrame({'ds': dates[dates > self.last_ds][:periods]})
+
+    def predict(self, df):
+        ds = pd.to_datetime(df['ds']).reset_index(drop=True)
+        seconds = ds.to_numpy(dtype=np.int64) // 10 ** 9
+        hours = np.maximum(seconds - self.last_timestamp, 0) / SECONDS_PER_HOUR
+        decay = 0.5 ** (hours / self.config['bias_half_life_hours'])
+        yhat = global_features(seconds, self.location, self.config) @ self.coef + self.bias * decay
+        return pd.DataFrame({'ds': ds, 'yhat': yhat})
+
+
+def read_city_catalog(filename=CITIES_CATALOG_FILENAME):
+    catalog = pd.read_csv(filename)
+    return {row.name.lower(): (float(row.lat), float(row.lon), float(row.utc_time_difference))
+            for row in catalog.itertuples()}
+
+
+def location_features(location):
+    lat, lon, utc_offset = location
+    return np.array([1., lat / 90, lon / 180, utc_offset / 12])
+
+
+def global_features(timestamps, location, config):
+    seconds = np.asarray(timestamps, dtype=np.float64)
+    time_features = np.column_stack([
+        np.ones(len(seconds)),
+        harmonic_features(seconds + location[2] * SECONDS_PER_HOUR, SECONDS_PER_DAY, config['day_order']),
+        harmonic_features(seconds, SECONDS_PER_YEAR, config['year_order'])
+    ])
+    # Column 0 is the intercept, the product of both constant terms.
+    return (time_features[:, :, None] * location_features(location)).reshape(len(seconds), -1)
+
+
+def train_global_model(cities, products, window_days=None, config=GLOBAL_MODEL_CONFIG, catalog=None):
+    from ..model_training import load_training_dataset
+
+    catalog = read_city_catalog() if catalog is None else catalog
+    XtX, Xty, recent = 0., 0., []
+    for city in cities:
+        if city.lower() not in catalog:
+            logging.warning(f"Global model skips {city}: not in the cities catalog")
+            continue
+        df = load_training_dataset(city, window_days)
+        df = df[np.isfinite(df[products].to_numpy(dtype=np.float64)).all(axis=1)]
+        if df.empty:
+            continue
+        X = global_features(df['timestamp'].to_numpy(), catalog[city.lower()], config)
+        Y = df[products].to_numpy(dtype=np.float64)
+        city_XtX, city_Xty = normal_equations(X, Y)
+        XtX, Xty = XtX + city_XtX, Xty + city_Xty
+
+        last_timestamp = int(df['timestamp'].max())
+        tail = df['timestamp'].to_numpy() > last_timestamp - config['bias_hours'] * SECONDS_PER_HOUR
+        recent.append((city.lower(), X[tail], Y[tail], last_timestamp))
+
+    if not recent:
+        handle_error("Failed to train global model: no city with training data", ValueError)
+    coef = solve_ridge(XtX, Xty, alpha=config['alpha'])
+    return {
+        'format_version': np.array([GLOBAL_MODEL_FORMAT_VERSION], dtype=np.int32),
+        'coef': coef,
+        'products': np.array(products, dtype=str),
+        'cities': np.array([city for city, _, _, _ in recent], dtype=str),
+        'bias': np.array([(Y - X @ coef).mean(axis=0) for _, X, Y, _ in recent]),
+        'last_timestamp': np.array([last_timestamp for _, _, _, last_timestamp in recent], dtype=np.int64),
+        'day_order': np.array([config['day_order']], dtype=np.int32),
+        'year_order': np.array([config['year_order']], dtype=np.int32),
+        'bias_half_life_hours': np.array([config['bias_half_life_hours']], dtype=np.float64)
+    }
+
+
+def load_global_model(filename):
+    arrays = read_npz_arrays(filename)
+    if int(arrays['format_version'][0]) != GLOBAL_MODEL_FORMAT_VERSION:
+        handle_error(f"Failed to load '{filename}': unsupported global model format", ValueError)
+    return GlobalModel(arrays)
+
+
+def get_global_models_dir(models_dir):
+    return path.join(models_dir, GLOBAL_MODEL_NAME)
+
+
+def publish_global_model(models_dir, arrays, version=None, metadata=None):
+    global_dir = get_global_models_dir(models_dir)
+    version = version or new_version_id()
+    filename = path.join(create_version(global_dir, version), GLOBAL_MODEL_FILE)
+    write_aligned_npz(filename, arrays)
+
+    entry = describe_model_file(filename)
+    entry['last_ds'] = pd.Timestamp(int(arrays['last_timestamp'].max()), unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    return publish_version(global_dir, version, {product: entry for product in arrays['products']}, metadata)
+
+
+def train_and_publish_global_model(cities=None, products=None, window_days=None, config=GLOBAL_MODEL_CONFIG):
+    from ..model_training import PRODUCTS, CITIES_WEATHER_MODELS_DIR
+    from ..orchestrator.orchestrator import list_trainable_cities
+
+    cities = list_trainable_cities() if cities is None else cities
+    products = [p for p in PRODUCTS if p != 'weather_description'] if products is None else products
+    arrays = train_global_model(cities, products, window_days, config)
+    return publish_global_model(CITIES_WEATHER_MODELS_DIR, arrays,
+                                metadata={'config': config, 'window_days': window_days,
+                                          'cities': len(arrays['cities'])})
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Train and publish the global multi-city model")
+    parser.add_argument('--cities', nargs='+', help="cities to train on, every city with a dataset by default")
+    parser.add_argument('--products', nargs='+', help="parameters to model, every numeric product by default")
+    parser.add_argument('--window-days', type=int, default=None)
+    args = parser.parse_args()
+
+    manifest = train_and_publish_global_model(args.cities, args.products, args.window_days)
+    logging.info(f"Published global model for {manifest['cities']} cities: {sorted(manifest['products'])}")
@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+
+from ..ridge.ridge import harmonic_features, fit_ridge, SECONDS_PER_DAY, SECONDS_PER_YEAR
+from ..utils.utils import handle_error
+from ...tree_model.tree_model import write_aligned_npz, read_npz_arrays
+
+# Low latency engine next to the Prophet models: a ridge regression on a
+# linear trend and daily/yearly harmonics, fitted in closed form. The first
+# harmonics are the day_sin/day_cos and year_sin/year_cos columns of the
+# prepared datasets, anchored at the first training timestamp. A forecast is
+# one feature matrix times the coefficient vector.
+
+HARMONIC_ENGINE = 'harmonic'
+HARMONIC_MODEL_FORMAT_VERSION = 1
+
+HARMONIC_MODEL_CONFIG = {
+    'alpha': 1.0,
+    'day_order': 3,
+    'year_order': 2
+}
+
+
+class HarmonicModel:
+    def __init__(self, arrays):
+        self.coef = arrays['coef']
+        self.start = int(arrays['start'][0])
+        self.t_scale = float(arrays['t_scale'][0])
+        self.day_order = int(arrays['day_order'][0])
+        self.year_order = int(arrays['year_order'][0])
+        self.last_timestamp = int(arrays['last_timestamp'][0])
+        self.last_ds = pd.Timestamp(self.last_timestamp, unit='s')
+
+    def make_future_dataframe(self, periods, freq='h', include_history=False):
+        # No training history is kept, only future dates are returned.
+        dates = pd.date_range(start=self.last_ds, periods=periods + 1, freq=freq)
+        return pd.DataFrame({'ds': dates[dates > self.last_ds][:periods]})
+
+    def predict(self, df):
+        ds = pd.to_datetime(df['ds']).reset_index(drop=True)
+        seconds = ds.to_numpy(dtype=np.int64) // 10 ** 9
+        X = harmonic_design_matrix(seconds, self.start, self.t_scale, self.day_order, self.year_order)
+        return pd.DataFrame({'ds': ds, 'yhat': X @ self.coef})
+
+
+def harmonic_design_matrix(seconds, start, t_scale, day_order, year_order):
+    elapsed = np.asarray(seconds, dtype=np.float64) - start
+    return np.column_stack([
+        np.ones(len(elapsed)),
+        elapsed / t_scale,
+        harmonic_features(elapsed, SECONDS_PER_DAY, day_order),
+        harmonic_features(elapsed, SECONDS_PER_YEAR, year_order)
+    ])
+
+
+def fit_harmonic_model(df, config=HARMONIC_MODEL_CONFIG):
+    df = df[np.isfinite(df['y'].to_numpy(dtype=np.float64))]
+    if df.empty:
+        handle_error("Failed to fit harmonic model: no finite target values", ValueError)
+    seconds = pd.to_datetime(df['ds']).to_numpy(dtype=np.int64) // 10 ** 9
+    start, last = int(seconds.min()), int(seconds.max())
+    t_scale = float(max(last - start, SECONDS_PER_DAY))
+
+    X = harmonic_design_matrix(seconds, start, t_scale, config['day_order'], config['year_order'])
+    return {
+        'format_version': np.array([HARMONIC_MODEL_FORMAT_VERSION], dtype=np.int32),
+        'coef': fit_ridge(X, df['y'].to_numpy(dtype=np.float64), alpha=config['alpha']),
+        'start': np.array([start], dtype=np.int64),
+        't_scale': np.array([t_scale], dtype=np.float64),
+        'day_order': np.array([config['day_order']], dtype=np.int32),
+        'year_order': np.array([config['year_order']], dtype=np.int32),
+        'last_timestamp': np.array([last], dtype=np.int64)
+    }
+
+
+def create_harmonic_model(df, model_filename, warm_start_filename=None, slim=False, config=None):
+    # Same signature as the Prophet factories. The closed form fit has
+    # nothing to warm start and the model is always slim.
+    if not isinstance(df, pd.DataFrame):
+        handle_error("df argument must be the instance of pd.DataFrame", ValueError)
+    if 'ds' not in df.columns or 'y' not in df.columns:
+        handle_error("df argument must have columns ds and y", AttributeError)
+    arrays = fit_harmonic_model(df, config or HARMONIC_MODEL_CONFIG)
+    write_aligned_npz(model_filename, arrays)
+    return HarmonicModel(arrays)
+
+
+def load_harmonic_model(filename):
+    arrays = read_npz_arrays(filename)
+    if int(arrays['format_version'][0]) != HARMONIC_MODEL_FORMAT_VERSION:
+        handle_error(f"Failed to load '{filename}': unsupported harmonic model format", ValueError)
+    return HarmonicModel(arrays)
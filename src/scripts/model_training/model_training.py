@@ -1,34 +1,60 @@
+import logging
+
+import numpy as np
 import pandas as pd
 
-from prophet import Prophet
+from .utils.utils import save_prophet_model, build_prophet_model, fit_prophet_model, handle_error 
+from .wind_speed.wind_speed import create_wind_speed_model, WIND_SPEED_MODEL_CONFIG
+from .pressure.pressure import create_pressure_model, PRESSURE_MODEL_CONFIG
+from .weather_description.weather_description import (create_weather_description_model,
+    WEATHER_DESCRIPTION_MODEL_CONFIG, WEATHER_DESCRIPTION_FEATURES)
 
-from .utils.utils import save_prophet_model, handle_error 
-from .wind_speed.wind_speed import create_wind_speed_model
-from .pressure.pressure import create_pressure_model
-from .weather_description.weather_description import create_weather_description_model
+from .harmonic.harmonic import create_harmonic_model, HARMONIC_ENGINE
+from .fingerprint.fingerprint import compute_fingerprint, compute_prefix_hash, plan_retraining
+from ..model_registry.model_registry import (get_model_file, create_version, new_version_id,
+    describe_model_file, read_current_manifest, carry_over_models, publish_version, get_version_dir,
+    get_engine_model_file)
+from ..model_pack.model_pack import build_model_pack, MODEL_PACK_FILENAME
 
+from inspect import getsourcefile
 from os.path import isdir, isfile, exists
-from os import mkdir
+from json import loads, JSONDecodeError
 
 CITIES_WEATHER_DATA_DIR = 'data/datasets'
 CITIES_WEATHER_MODELS_DIR = 'data/models'
 
-def create_basic_prophet_model(df, model_filename):
+# Per product configs chosen by the hyperparameter search, see
+# src/scripts/tuning. Products without one use the factory's MODEL_CONFIGS.
+TUNED_MODEL_CONFIGS_FILENAME = 'data/model_configs.json'
+
+# Rolling training window in days, None trains on the whole dataset. The
+# window start is snapped to TRAINING_WINDOW_ALIGNMENT_DAYS so it stays put
+# between nightly runs and models can still be warm started.
+TRAINING_WINDOW_DAYS = None
+TRAINING_WINDOW_ALIGNMENT_DAYS = 7
+
+BASIC_PROPHET_MODEL_CONFIG = {
+    'model': {
+        'yearly_seasonality': False,
+        'weekly_seasonality': False
+    },
+    'seasonalities': [
+        {'name': 'monthly', 'period': 30.5, 'fourier_order': 5}
+    ]
+}
+
+def create_basic_prophet_model(df, model_filename, warm_start_filename=None, slim=False, config=None):
     if not isinstance(df, pd.DataFrame):
         handle_error("df argument must be the instance of pd.DataFrame", ValueError)
     if 'ds' not in df.columns or 'y' not in df.columns:
         handle_error("df argument must have columns ds and y", AttributeError)
     try:
-        model = Prophet(
-        yearly_seasonality=False,  
-        weekly_seasonality=False  
-        )
-        model.add_seasonality(name='monthly', period=30.5, fourier_order=5)  
-        
-        model.fit(df)
-        save_prophet_model(model, model_filename)
+        model = build_prophet_model(config or BASIC_PROPHET_MODEL_CONFIG)
+        fit_prophet_model(model, df, warm_start_filename)
+        save_prophet_model(model, model_filename, slim=slim)
+        return model
     except Exception as e:
-        handle_error("Failed to create and save model, exception occured: ", Exception)
+        handle_error("Failed to create and save model, exception occured: ", e)
 
 
 
@@ -45,35 +71,226 @@ PRODUCTS = {
     'weather_description': create_weather_description_model
 }
 
+# Alternative engines, trained for every published version next to PRODUCTS.
+ENGINES = {
+    HARMONIC_ENGINE: {product: create_harmonic_model for product in PRODUCTS if product != 'weather_description'}
+}
+
+MODEL_CONFIGS = {
+    create_basic_prophet_model: BASIC_PROPHET_MODEL_CONFIG,
+    create_pressure_model: PRESSURE_MODEL_CONFIG,
+    create_wind_speed_model: WIND_SPEED_MODEL_CONFIG,
+    create_weather_description_model: WEATHER_DESCRIPTION_MODEL_CONFIG
+}
+
+
+def read_tuned_model_configs(filename=None):
+    filename = filename or TUNED_MODEL_CONFIGS_FILENAME
+    if not isfile(filename):
+        return {}
+    try:
+        with open(filename, 'r') as f:
+            return {product: tuned['config'] for product, tuned in loads(f.read())['products'].items()}
+    except (JSONDecodeError, KeyError, TypeError) as e:
+        logging.error(f"Ignoring tuned model configs '{filename}': {e!r}")
+        return {}
+
+
+def get_product_config(product):
+    tuned = read_tuned_model_configs().get(product)
+    return tuned if tuned is not None else MODEL_CONFIGS[PRODUCTS[product]]
+
 
-def create_products_models(city_name):
-    df = None
+def read_city_dataset(city_name):
     filename = f'{CITIES_WEATHER_DATA_DIR}/{city_name}/{city_name}.csv'
     if exists(CITIES_WEATHER_DATA_DIR):
         if exists(filename):
-            df = pd.read_csv(f'{CITIES_WEATHER_DATA_DIR}/{city_name}/{city_name}.csv')
+            return pd.read_csv(filename)
         else:
             handle_error("Failed to read: data file for provided city does not exist", FileNotFoundError)
     else: 
         handle_error("Failed to read: directory for cities data does not exist", FileNotFoundError)
 
-    for product, create_model in PRODUCTS.items():
-        df_columns = df.columns
-        if product in df_columns:
-            if "timestamp" in df_columns:
-                df = df.rename(columns={'timestamp': 'ds', product: 'y'})
-                df['ds'] = pd.to_datetime(df['ds'], unit='s')
-            else:
-                handle_error("Failed to transform: Derired column timestamp is not in df", AttributeError)
+
+def apply_training_window(df, window_days=None, alignment_days=TRAINING_WINDOW_ALIGNMENT_DAYS):
+    if window_days is None:
+        return df
+    if window_days <= 0:
+        handle_error("Failed to apply window: window_days must be a positive number of days", ValueError)
+    seconds_per_day = 60 * 60 * 24
+    start = df['timestamp'].max() - window_days * seconds_per_day
+    start -= start % (alignment_days * seconds_per_day)
+    return df[df['timestamp'] >= start]
+
+
+def load_training_dataset(city_name, window_days=None):
+    return apply_training_window(read_city_dataset(city_name), window_days)
+
+
+def prepare_product_df(df, product):
+    df_columns = df.columns
+    if product in df_columns:
+        if "timestamp" in df_columns:
+            df = df.rename(columns={'timestamp': 'ds', product: 'y'})
+            df['ds'] = pd.to_datetime(df['ds'], unit='s')
+        else:
+            handle_error("Failed to transform: Derired column timestamp is not in df", AttributeError)
+    else:
+        error_str = "Derired column: '" + product + "' is not in provided df"
+        handle_error(error_str, AttributeError)
+    return df
+
+
+def prepare_training_frame(df):
+    # One typed frame shared by every product: timestamps are parsed once
+    # into 'ds' and numeric columns are downcast to float32. Each model then
+    # gets views of its columns instead of a renamed copy of the dataset.
+    if 'timestamp' not in df.columns:
+        handle_error("Failed to transform: Derired column timestamp is not in df", AttributeError)
+    columns = {'timestamp': df['timestamp'].to_numpy(dtype=np.int64),
+               'ds': pd.to_datetime(df['timestamp'].to_numpy(), unit='s')}
+    for column in df.columns:
+        if column in columns:
+            continue
+        if pd.api.types.is_numeric_dtype(df[column]):
+            columns[column] = df[column].to_numpy(dtype=np.float32)
         else:
-            error_str = "Derired column: '" + product + "' is not in provided df"
-            handle_error(error_str, AttributeError)
+            columns[column] = df[column].to_numpy()
+    return pd.DataFrame(columns, copy=False)
+
+
+def load_training_frame(city_name, window_days=None):
+    return prepare_training_frame(load_training_dataset(city_name, window_days))
+
+
+def get_product_frame(frame, product):
+    if product not in frame.columns:
+        handle_error(f"Derired column: '{product}' is not in provided df", AttributeError)
+    if product == 'weather_description':
+        # The classifier gets its features projected out of the frame.
+        return pd.DataFrame({'ds': frame['ds'], **{c: frame[c] for c in WEATHER_DESCRIPTION_FEATURES},
+                             'y': frame[product]}, copy=False)
+    return pd.DataFrame({'ds': frame['ds'], 'y': frame[product]}, copy=False)
+
 
-        filename = f'{CITIES_WEATHER_MODELS_DIR}/{city_name}/{product}.json'
+def get_city_models_dir(city_name):
+    return f'{CITIES_WEATHER_MODELS_DIR}/{city_name}'
 
-        if product == 'weather_description':
-            filename = f'{CITIES_WEATHER_MODELS_DIR}/{city_name}/{product}.pkl'
-    
-        create_model(df, filename)
 
+def get_model_filename(version_dir, product):
+    return f'{version_dir}/{get_model_file(product)}'
+
+
+def get_published_model_filename(city_name, product):
+    manifest = read_current_manifest(get_city_models_dir(city_name))
+    if manifest is None or product not in manifest['products']:
+        return None
+    filename = f"{manifest['version_dir']}/{manifest['products'][product]['file']}"
+    return filename if isfile(filename) else None
+
+
+def get_product_columns(df, product):
+    if product == 'weather_description':
+        return ['timestamp', *WEATHER_DESCRIPTION_FEATURES, product]
+    return ['timestamp', product]
+
+
+def get_product_fingerprint(df, product):
+    create_model = PRODUCTS[product]
+    return compute_fingerprint(df[get_product_columns(df, product)], 'timestamp',
+                               hyperparameters=get_product_config(product),
+                               code_files=[getsourcefile(create_model), getsourcefile(fit_prophet_model)])
+
+
+def plan_product_model(city_name, product, df, policy='auto'):
+    current = get_product_fingerprint(df, product)
+    manifest = read_current_manifest(get_city_models_dir(city_name))
+    entry = manifest['products'].get(product) if manifest else None
+    if entry is None or get_published_model_filename(city_name, product) is None:
+        return 'full', current
+
+    previous = entry['fingerprint']
+    prefix_hash = compute_prefix_hash(df[get_product_columns(df, product)], previous['rows'])
+    return plan_retraining(previous, current, prefix_hash, policy), current
+
+
+def describe_product_model(model_filename, df, fingerprint, stats=None):
+    entry = describe_model_file(model_filename)
+    entry['last_ds'] = pd.to_datetime(df['timestamp'].max(), unit='s').strftime('%Y-%m-%d %H:%M:%S')
+    entry['fingerprint'] = fingerprint
+    entry['training'] = stats or {}
+    return entry
+
+
+def create_product_model(city_name, product, version_dir, df=None, warm_start=False, window_days=None,
+                         slim=False):
+    if product not in PRODUCTS:
+        handle_error(f"Failed to create model: unknown product '{product}'", ValueError)
+    if df is None:
+        df = load_training_frame(city_name, window_days)
+
+    warm_start_filename = get_published_model_filename(city_name, product) if warm_start else None
+    return PRODUCTS[product](get_product_frame(df, product), get_model_filename(version_dir, product),
+                             warm_start_filename=warm_start_filename, slim=slim, config=get_product_config(product))
+
+
+def create_engine_models(df, version_dir):
+    engines = {}
+    for engine, products in ENGINES.items():
+        engines[engine] = {}
+        for product, create_model in products.items():
+            model_filename = f'{version_dir}/{get_engine_model_file(engine, product)}'
+            create_model(get_product_frame(df, product), model_filename)
+            engines[engine][product] = describe_product_model(model_filename, df, None)
+    return engines
+
+
+def publish_city_models(city_name, version, entries, metadata=None, df=None):
+    city_dir = get_city_models_dir(city_name)
+    entries = carry_over_models(city_dir, version, entries)
+    metadata = dict(metadata or {})
+    metadata['city'] = city_name
+    try:
+        # Fitted in milliseconds, so always retrained on the whole window.
+        if df is None:
+            df = load_training_frame(city_name, metadata.get('window_days'))
+        metadata['engines'] = create_engine_models(df, get_version_dir(city_dir, version))
+    except Exception as e:
+        logging.error(f"Failed to create the engine models of {city_name} version {version}: {e!r}")
+    try:
+        packed = build_model_pack(get_version_dir(city_dir, version),
+                                  {product: entry['file'] for product, entry in entries.items()})
+        metadata['pack'] = {'file': MODEL_PACK_FILENAME, 'products': packed}
+    except Exception as e:
+        # Serving falls back to the individual model files without a pack.
+        logging.error(f"Failed to build the model pack of {city_name} version {version}: {e!r}")
+    return publish_version(city_dir, version, entries, metadata)
+
+
+def create_products_models(city_name, warm_start=False, policy=None, window_days=TRAINING_WINDOW_DAYS,
+                           slim=False):
+    df = load_training_frame(city_name, window_days)
+    version = new_version_id()
+    version_dir = create_version(get_city_models_dir(city_name), version)
+
+    plans = {}
+    for product in PRODUCTS:
+        if policy is None:
+            plans[product] = ('warm' if warm_start else 'full', get_product_fingerprint(df, product))
+        else:
+            plans[product] = plan_product_model(city_name, product, df, policy)
+
+    entries = {}
+    for product, create_model in PRODUCTS.items():
+        mode, fingerprint = plans[product]
+        if mode == 'skip':
+            continue
+        model_filename = get_model_filename(version_dir, product)
+        warm_start_filename = get_published_model_filename(city_name, product) if mode == 'warm' else None
+        create_model(get_product_frame(df, product), model_filename, warm_start_filename=warm_start_filename,
+                     slim=slim,
+                     config=get_product_config(product))
+        entries[product] = describe_product_model(model_filename, df, fingerprint, {'mode': mode})
 
+    if entries:
+        publish_city_models(city_name, version, entries, {'window_days': window_days, 'slim': slim}, df=df)
@@ -0,0 +1,302 @@
+import argparse
+import logging
+import os
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from json import dumps, loads
+from os import listdir, makedirs, path
+from time import perf_counter
+
+from ..model_training import (PRODUCTS, CITIES_WEATHER_DATA_DIR, CITIES_WEATHER_MODELS_DIR,
+                              TRAINING_WINDOW_DAYS, create_product_model, load_training_frame,
+                              get_product_fingerprint, plan_product_model, get_city_models_dir,
+                              get_model_filename, describe_product_model, publish_city_models)
+from ..fingerprint.fingerprint import RETRAIN_POLICIES
+from ...model_registry.model_registry import create_version, get_current_version, new_version_id
+from ..utils.utils import get_fit_stats, handle_error
+
+TRAINING_RUNS_DIR = f'{CITIES_WEATHER_MODELS_DIR}/training_runs'
+
+THREAD_LIMIT_ENV_VARS = ['OMP_NUM_THREADS',
+                         'OPENBLAS_NUM_THREADS',
+                         'MKL_NUM_THREADS',
+                         'VECLIB_MAXIMUM_THREADS',
+                         'NUMEXPR_NUM_THREADS',
+                         'STAN_NUM_THREADS']
+
+# Relative fit cost of each product, used to start the slowest jobs first
+# so the pool does not end up waiting on a single long fit.
+PRODUCT_COST_WEIGHTS = {
+    'pressure': 5,
+    'wind_speed': 5,
+    'weather_description': 0
+}
+
+# Training frames already parsed by this process. Every job of a city needs
+# the same frame, so a pool process reads a city dataset once per run
+# instead of once per product; the frames planned by the parent are
+# inherited by the forked workers. Entries are keyed by dataset mtime so a
+# refreshed dataset is read again.
+TRAINING_FRAME_CACHE_SIZE = 32
+_training_frames = OrderedDict()
+
+
+def get_training_frame(city_name, window_days=None):
+    key = (city_name, window_days)
+    try:
+        mtime = os.stat(path.join(CITIES_WEATHER_DATA_DIR, city_name, city_name + '.csv')).st_mtime_ns
+    except OSError:
+        # Let the loader report the missing dataset.
+        return load_training_frame(city_name, window_days)
+    cached = _training_frames.get(key)
+    if cached is not None and cached[0] == mtime:
+        _training_frames.move_to_end(key)
+        return cached[1]
+    df = load_training_frame(city_name, window_days)
+    _training_frames[key] = (mtime, df)
+    _training_frames.move_to_end(key)
+    while len(_training_frames) > TRAINING_FRAME_CACHE_SIZE:
+        _training_frames.popitem(last=False)
+    return df
+
+
+def list_trainable_cities():
+    if not path.isdir(CITIES_WEATHER_DATA_DIR):
+        handle_error("Failed to list cities: directory for cities data does not exist", FileNotFoundError)
+    return sorted(city for city in listdir(CITIES_WEATHER_DATA_DIR)
+                  if path.isfile(path.join(CITIES_WEATHER_DATA_DIR, city, city + '.csv')))
+
+
+def build_training_jobs(cities, products=None, completed=frozenset()):
+    products = list(PRODUCTS) if products is None else products
+    unknown = set(products) - set(PRODUCTS)
+    if unknown:
+        handle_error(f"Failed to build jobs: unknown products {sorted(unknown)}", ValueError)
+
+    jobs = [(city, product) for city in cities for product in products
+            if (city, product) not in completed]
+    return sorted(jobs, key=lambda job: PRODUCT_COST_WEIGHTS.get(job[1], 1), reverse=True)
+
+
+def plan_training_jobs(jobs, policy=None, warm_start=False, window_days=None):
+    if policy is None:
+        return [(city, product, 'warm' if warm_start else 'full') for city, product in jobs], []
+
+    city_products = {}
+    for city, product in jobs:
+        city_products.setdefault(city, []).append(product)
+
+    modes = {}
+    for city, products in city_products.items():
+        try:
+            df = get_training_frame(city, window_days)
+        except FileNotFoundError:
+            # Leave it to the job to fail and report the missing dataset.
+            modes.update({(city, product): 'full' for product in products})
+            continue
+        for product in products:
+            modes[(city, product)] = plan_product_model(city, product, df, policy)[0]
+
+    planned = [(city, product, modes[(city, product)]) for city, product in jobs
+               if modes[(city, product)] != 'skip']
+    skipped = [(city, product) for city, product in jobs if modes[(city, product)] == 'skip']
+    return planned, skipped
+
+
+def limit_worker_threads(threads_per_worker):
+    for var in THREAD_LIMIT_ENV_VARS:
+        os.environ[var] = str(threads_per_worker)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=threads_per_worker)
+    except ImportError:
+        pass
+
+
+@contextmanager
+def worker_thread_env(threads_per_worker):
+    # Children inherit the environment, so BLAS/Stan pick up the limits
+    # even when they are imported before the initializer runs. The
+    # parent's own settings are restored once the pool is done.
+    previous = {var: os.environ.get(var) for var in THREAD_LIMIT_ENV_VARS}
+    os.environ.update({var: str(threads_per_worker) for var in THREAD_LIMIT_ENV_VARS})
+    try:
+        yield
+    finally:
+        for var, value in previous.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+TRAINING_STATS_KEYS = ['mode', 'wall_time', 'fit_iterations', 'fit_algorithm', 'converged', 'warm_started']
+
+
+def run_training_job(city_name, product, version, mode='full', window_days=None, slim=False):
+    record = {'city': city_name, 'product': product, 'version': version, 'mode': mode, 'pid': os.getpid()}
+    started = perf_counter()
+    try:
+        version_dir = create_version(get_city_models_dir(city_name), version)
+        df = get_training_frame(city_name, window_days)
+        fingerprint = get_product_fingerprint(df, product)
+        model = create_product_model(city_name, product, version_dir, df=df, warm_start=mode == 'warm',
+                                     slim=slim)
+        record.update(get_fit_stats(model))
+        record['wall_time'] = round(perf_counter() - started, 3)
+        stats = {key: record[key] for key in TRAINING_STATS_KEYS if key in record}
+        record['entry'] = describe_product_model(get_model_filename(version_dir, product), df,
+                                                 fingerprint, stats)
+        record['status'] = 'ok'
+    except Exception as e:
+        logging.error(f"Training job ({city_name}, {product}) failed: {e!r}")
+        record['status'] = 'failed'
+        record['error'] = repr(e)
+    record['wall_time'] = round(perf_counter() - started, 3)
+    record['finished_at'] = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    return record
+
+
+def get_run_log_filename(run_id):
+    return f'{TRAINING_RUNS_DIR}/{run_id}.jsonl'
+
+
+def latest_run_id():
+    if not path.isdir(TRAINING_RUNS_DIR):
+        return None
+    runs = sorted(f[:-len('.jsonl')] for f in listdir(TRAINING_RUNS_DIR) if f.endswith('.jsonl'))
+    return runs[-1] if runs else None
+
+
+def read_completed_jobs(run_id):
+    completed = {}
+    filename = get_run_log_filename(run_id)
+    if not path.isfile(filename):
+        return completed
+    with open(filename, 'r') as f:
+        for line in f:
+            try:
+                record = loads(line)
+            except ValueError:
+                # A run killed mid-write leaves a truncated last line.
+                continue
+            if record.get('status') == 'ok':
+                completed[(record['city'], record['product'])] = record
+    return completed
+
+
+def publish_run(run_id, city_name, records, window_days, slim):
+    entries = {r['product']: r['entry'] for r in records if r['status'] == 'ok'}
+    if not entries:
+        logging.error(f"Nothing to publish for {city_name}: every training job failed")
+        return
+    publish_city_models(city_name, run_id, entries, {'run_id': run_id, 'window_days': window_days,
+                                                      'slim': slim})
+    logging.info(f"Published {city_name} version {run_id} with {len(entries)} new models")
+
+
+def train_all_cities(cities=None, products=None, max_workers=None, threads_per_worker=1,
+                     run_id=None, resume=False, warm_start=False, policy=None,
+                     window_days=TRAINING_WINDOW_DAYS, slim=False):
+    cities = list_trainable_cities() if cities is None else cities
+    max_workers = max_workers or os.cpu_count() or 1
+
+    if resume:
+        run_id = run_id or latest_run_id()
+        if run_id is None:
+            handle_error("Failed to resume: no previous training run found", FileNotFoundError)
+    run_id = run_id or new_version_id()
+
+    completed = read_completed_jobs(run_id) if resume else {}
+    jobs, skipped = plan_training_jobs(build_training_jobs(cities, products, completed), policy, warm_start,
+                                       window_days)
+    logging.info(f"Training run {run_id}: {len(jobs)} jobs ({len(completed)} already done, "
+                 f"{len(skipped)} unchanged) on {max_workers} workers x {threads_per_worker} threads")
+
+    makedirs(TRAINING_RUNS_DIR, exist_ok=True)
+
+    # A city is published once all of its jobs are done. Only this process
+    # publishes, so parallel jobs of one city never race on the manifest.
+    pending = {}
+    city_records = {}
+    for city, product, mode in jobs:
+        pending[city] = pending.get(city, 0) + 1
+    for (city, product), record in completed.items():
+        city_records.setdefault(city, []).append(record)
+
+    records = []
+    started = perf_counter()
+    with open(get_run_log_filename(run_id), 'a') as run_log, worker_thread_env(threads_per_worker), \
+            ProcessPoolExecutor(max_workers=max_workers, initializer=limit_worker_threads,
+                                initargs=(threads_per_worker,)) as pool:
+        futures = [pool.submit(run_training_job, city, product, run_id, mode, window_days, slim)
+                   for city, product, mode in jobs]
+        for future in as_completed(futures):
+            record = future.result()
+            run_log.write(dumps(record) + '\n')
+            run_log.flush()
+            records.append(record)
+            logging.info(dumps({k: v for k, v in record.items() if k != 'entry'}))
+
+            city = record['city']
+            city_records.setdefault(city, []).append(record)
+            pending[city] -= 1
+            if pending[city] == 0:
+                publish_run(run_id, city, city_records[city], window_days, slim)
+
+    # Cities finished by an interrupted run that stopped before publishing.
+    for city, records_of_city in city_records.items():
+        if city not in pending and get_current_version(get_city_models_dir(city)) != run_id:
+            publish_run(run_id, city, records_of_city, window_days, slim)
+
+    summary = summarize_run(run_id, records, perf_counter() - started, max_workers)
+    summary['skipped'] = len(skipped)
+    return summary
+
+
+def summarize_run(run_id, records, wall_time, max_workers):
+    job_time = sum(r['wall_time'] for r in records)
+    iterations = [r['fit_iterations'] for r in records if r.get('fit_iterations') is not None]
+    return {
+        'run_id': run_id,
+        'jobs': len(records),
+        'warm': sum(r.get('mode') == 'warm' for r in records),
+        'failed': [(r['city'], r['product']) for r in records if r['status'] != 'ok'],
+        'wall_time': round(wall_time, 3),
+        'job_time': round(job_time, 3),
+        'speedup': round(job_time / wall_time, 2) if wall_time > 0 else None,
+        'workers': max_workers,
+        'fit_iterations_total': sum(iterations),
+        'fit_iterations_max': max(iterations, default=None)
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train weather models for every (city, product) pair in parallel")
+    parser.add_argument('--cities', nargs='+', help="cities to train (default: every city with a dataset)")
+    parser.add_argument('--products', nargs='+', choices=list(PRODUCTS), help="products to train (default: all)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument('--threads-per-worker', type=int, default=1, help="BLAS/Stan threads per worker")
+    parser.add_argument('--run-id', default=None, help="identifier of the run log")
+    parser.add_argument('--resume', action='store_true', help="skip jobs already finished by the run")
+    parser.add_argument('--warm-start', action='store_true', help="initialize fits from the previously saved models")
+    parser.add_argument('--policy', choices=RETRAIN_POLICIES, default=None,
+                        help="skip unchanged models and pick warm or full fits for appended data "
+                             "(default: retrain everything)")
+    parser.add_argument('--window-days', type=int, default=TRAINING_WINDOW_DAYS,
+                        help="train on a rolling window of the most recent days (default: whole dataset)")
+    parser.add_argument('--slim', action='store_true', help="save Prophet models without their training history")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    summary = train_all_cities(cities=args.cities, products=args.products, max_workers=args.workers,
+                               threads_per_worker=args.threads_per_worker, run_id=args.run_id,
+                               resume=args.resume, warm_start=args.warm_start, policy=args.policy,
+                               window_days=args.window_days, slim=args.slim)
+    print(dumps(summary, indent=2))
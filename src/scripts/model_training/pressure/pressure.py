@@ -1,21 +1,26 @@
-from prophet import Prophet
 import pandas as pd
 
-from ..utils.utils import save_prophet_model, handle_error 
+from ..utils.utils import save_prophet_model, build_prophet_model, fit_prophet_model, handle_error 
 
-def create_pressure_model(df, model_filename):
+PRESSURE_MODEL_CONFIG = {
+    'model': {
+        'yearly_seasonality': False,
+        'weekly_seasonality': False
+    },
+    'seasonalities': [
+        {'name': 'monthly', 'period': 30, 'fourier_order': 25}
+    ]
+}
+
+def create_pressure_model(df, model_filename, warm_start_filename=None, slim=False, config=None):
     if not isinstance(df, pd.DataFrame):
         handle_error("df argument must be the instance of pd.DataFrame", ValueError)
     if 'ds' not in df.columns or 'y' not in df.columns:
         handle_error("df argument must have columns ds and y", AttributeError)
     try:
-        model = Prophet(
-        yearly_seasonality=False,  
-        weekly_seasonality=False  
-        )
-        model.add_seasonality(name='monthly', period=30, fourier_order=25)  
-        
-        model.fit(df)
-        save_prophet_model(model, model_filename)
+        model = build_prophet_model(config or PRESSURE_MODEL_CONFIG)
+        fit_prophet_model(model, df, warm_start_filename)
+        save_prophet_model(model, model_filename, slim=slim)
+        return model
     except Exception as e:
         handle_error("Failed to create and save model, exception occured: ", AttributeError)
@@ -0,0 +1,29 @@
+import numpy as np
+
+SECONDS_PER_DAY = 60 * 60 * 24
+SECONDS_PER_YEAR = 365.2425 * SECONDS_PER_DAY
+
+
+def harmonic_features(seconds, period, order):
+    # Columns sin(k * phase), cos(k * phase) for k = 1..order, the same
+    # cyclical encoding as the day_sin/day_cos and year_sin/year_cos columns.
+    phase = np.multiply.outer(np.asarray(seconds, dtype=np.float64) * (2 * np.pi / period),
+                              np.arange(1, order + 1))
+    features = np.empty((phase.shape[0], 2 * order))
+    features[:, 0::2] = np.sin(phase)
+    features[:, 1::2] = np.cos(phase)
+    return features
+
+
+def normal_equations(X, y):
+    return X.T @ X, X.T @ y
+
+
+def solve_ridge(XtX, Xty, alpha=1.0, unpenalized=(0,)):
+    penalty = np.full(XtX.shape[0], float(alpha))
+    penalty[list(unpenalized)] = 0.
+    return np.linalg.solve(XtX + np.diag(penalty), Xty)
+
+
+def fit_ridge(X, y, alpha=1.0, unpenalized=(0,)):
+    return solve_ridge(*normal_equations(X, y), alpha=alpha, unpenalized=unpenalized)
@@ -1,25 +1,108 @@
-from prophet.serialize import model_to_json, model_from_json
 from pickle import dump, load, dumps, UnpicklingError
 
 from os import path, makedirs
-from json import JSONDecodeError
+from json import JSONDecodeError, dumps as json_dumps, loads as json_loads
 
 import logging
+import re
 
-def save_prophet_model(model, filename):
+# Prophet pulls in cmdstanpy and matplotlib, it is imported on first use so
+# that importing these helpers, e.g. by the API, stays cheap.
+
+SLIM_MODEL_FORMAT_VERSION = 1
+
+def save_prophet_model(model, filename, slim=False):
+    from prophet.serialize import model_to_json
     try:
+        model_json = json_dumps(model_to_slim_dict(model)) if slim else model_to_json(model)
         with open_file(filename, 'w') as fout:
-            fout.write(model_to_json(model))
+            fout.write(model_json)
     except (ValueError, AttributeError) as e:
         handle_error("Failed to convert Prophet model to json:", e)
+
+def model_to_slim_dict(model):
+    from prophet.serialize import model_to_dict
+    model_dict = model_to_dict(model)
+    # Forecasting only needs the last training timestamp out of the history,
+    # and the fitted 'trend' vector is one value per training row.
+    model_dict['history'] = model.history.tail(1).to_json(orient='table', index=False)
+    model_dict['history_dates'] = model.history_dates.tail(1).to_json(orient='split', date_format='iso')
+    model_dict['params'] = {k: v for k, v in model_dict['params'].items() if k != 'trend'}
+    model_dict['__slim_format'] = SLIM_MODEL_FORMAT_VERSION
+    return model_dict
+
+def load_slim_prophet_model(filename):
+    from prophet.serialize import model_from_dict
+    try:
+        with open_file(filename, 'r') as fin:
+            model_dict = json_loads(fin.read())
+    except JSONDecodeError as e:
+        handle_error("Failed to decode Prophet model from json:", e)
+    if '__slim_format' not in model_dict:
+        handle_error(f"Failed to load '{filename}': not a slim Prophet model", ValueError)
+    return model_from_dict(model_dict)
         
 def load_prophet_model(filename):
+    from prophet.serialize import model_from_json
     try:
         with open_file(filename, 'r') as fin:
             return model_from_json(fin.read())
     except JSONDecodeError as e:
         handle_error("Failed to decode Prophet model from json:", e)
 
+def build_prophet_model(config):
+    from prophet import Prophet
+    model = Prophet(**config['model'])
+    for seasonality in config['seasonalities']:
+        model.add_seasonality(**seasonality)
+    return model
+
+WARM_START_CONFIG_ATTRIBUTES = ['growth',
+                               'n_changepoints',
+                               'changepoint_range',
+                               'yearly_seasonality',
+                               'weekly_seasonality',
+                               'daily_seasonality',
+                               'seasonality_mode',
+                               'seasonality_prior_scale',
+                               'changepoint_prior_scale']
+
+def warm_start_params(model):
+    params = {}
+    for name in ['k', 'm', 'sigma_obs']:
+        params[name] = float(model.params[name][0][0])
+    for name in ['delta', 'beta']:
+        params[name] = model.params[name][0]
+    return params
+
+def check_warm_start_compatibility(previous, model, df):
+    for attribute in WARM_START_CONFIG_ATTRIBUTES:
+        if getattr(previous, attribute) != getattr(model, attribute):
+            return f"'{attribute}' changed"
+    # Added or removed seasonalities and regressors change the length of beta.
+    for attribute, kind in [('seasonalities', 'seasonality'), ('extra_regressors', 'regressor')]:
+        previous_components, components = getattr(previous, attribute), getattr(model, attribute)
+        if previous_components != components:
+            name = next(name for name in sorted(set(previous_components) | set(components))
+                        if previous_components.get(name) != components.get(name))
+            return f"{kind} '{name}' changed"
+    # Parameters are fitted on time scaled from the first training timestamp,
+    # so they only carry over while the window keeps its start and grows forward.
+    if previous.start != df['ds'].min():
+        return "training window start changed"
+    if previous.history_dates.max() > df['ds'].max():
+        return "training window shrank"
+    return None
+
+def fit_prophet_model(model, df, warm_start_filename=None):
+    if warm_start_filename and path.isfile(warm_start_filename):
+        previous = load_prophet_model(warm_start_filename)
+        reason = check_warm_start_compatibility(previous, model, df)
+        if reason is None:
+            return model.fit(df, init=warm_start_params(previous))
+        logging.info(f"Cold fit instead of warm start from '{warm_start_filename}': {reason}")
+    return model.fit(df)
+
 def save_sklearn_model(model, filename):
     if hasattr(model, 'classes_') and hasattr(model, 'tree_'):
         try:
@@ -46,3 +129,33 @@ def open_file(filename, mode):
 def handle_error(message, error):
     logging.error(message)
     raise error
+
+
+ITERATION_LINE_PATTERN = re.compile(r'^\s*(?:Iteration\s+)?(\d+)[.\s]')
+
+def get_fit_stats(model):
+    stats = {'fit_iterations': None, 'fit_algorithm': None, 'converged': None}
+    if hasattr(model, 'tree_'):
+        stats['fit_algorithm'] = 'cart'
+        stats['tree_node_count'] = int(model.tree_.node_count)
+        stats['tree_depth'] = int(model.tree_.max_depth)
+        return stats
+
+    stan_fit = getattr(model, 'stan_fit', None)
+    if stan_fit is None:
+        return stats
+    stats['warm_started'] = 'init' in getattr(model, 'fit_kwargs', {})
+    try:
+        stats['converged'] = bool(stan_fit.converged)
+        stats['fit_algorithm'] = stan_fit.runset._args.method_args.algorithm
+        iterations = 0
+        for stdout_file in stan_fit.runset.stdout_files:
+            with open(stdout_file, 'r') as f:
+                for line in f:
+                    match = ITERATION_LINE_PATTERN.match(line)
+                    if match:
+                        iterations = max(iterations, int(match.group(1)))
+        stats['fit_iterations'] = iterations
+    except (AttributeError, OSError) as e:
+        logging.warning(f"Failed to collect fit stats: {e}")
+    return stats
@@ -4,6 +4,7 @@ from sklearn.tree import DecisionTreeClassifier
 
 from src.scripts.model_training.utils.utils import save_sklearn_model
 from src.scripts.model_training.utils.utils import handle_error
+from src.scripts.tree_model.tree_model import export_tree_model, TREE_MODEL_EXTENSION
 
 
 PRODUCT_KEYS =  ['ds',
@@ -18,7 +19,15 @@ PRODUCT_KEYS =  ['ds',
     'wind_direction',
     'y']
 
-def create_weather_description_model(df, model_filename):
+# The classifier is served with the forecasts of the API's target parameters,
+# clouds_percentage is not one of them.
+WEATHER_DESCRIPTION_FEATURES = [key for key in PRODUCT_KEYS if key not in ('ds', 'y', 'clouds_percentage')]
+
+WEATHER_DESCRIPTION_MODEL_CONFIG = {
+    'random_state': 0
+}
+
+def create_weather_description_model(df, model_filename, warm_start_filename=None, slim=False, config=None):
     if not isinstance(df, pd.DataFrame):
         handle_error("Failed to convert: df argument must be the instance of pd.DataFrame", ValueError)
     
@@ -29,16 +38,23 @@ def create_weather_description_model(df, model_filename):
     
     
     x, y = None, None
-    if all(x in df_columns for x in PRODUCT_KEYS):
-        x = df.drop(columns=["y", "ds"])
+    if all(x in df_columns for x in ['ds', *WEATHER_DESCRIPTION_FEATURES, 'y']):
+        x = df[WEATHER_DESCRIPTION_FEATURES]
         y = df['y']
     else:
-        err_str = "Failed to convert: Columns: " + " ".join(PRODUCT_KEYS) + " and 'y' must be in df"
+        err_str = "Failed to convert: Columns: ds " + " ".join(WEATHER_DESCRIPTION_FEATURES) + " and 'y' must be in df"
         handle_error(err_str, AttributeError)
     
-    model = DecisionTreeClassifier(random_state=0)
+    # A decision tree has no optimizer state to resume, it is always refit
+    # from scratch and warm_start_filename is ignored. It also keeps no
+    # training history, so slim does not apply either.
+    model = DecisionTreeClassifier(**(config or WEATHER_DESCRIPTION_MODEL_CONFIG))
 
     model.fit(x, y)
-    save_sklearn_model(model, model_filename)
+    if model_filename.endswith(TREE_MODEL_EXTENSION):
+        export_tree_model(model, model_filename)
+    else:
+        save_sklearn_model(model, model_filename)
+    return model
 
 
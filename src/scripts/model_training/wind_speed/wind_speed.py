@@ -1,17 +1,24 @@
-from prophet import Prophet
-from ..utils.utils import save_prophet_model 
-def create_wind_speed_model(df, model_filename):
+from ..utils.utils import save_prophet_model, build_prophet_model, fit_prophet_model 
 
-    model = Prophet(
-    yearly_seasonality=False,  
-    weekly_seasonality=False,
-    interval_width=0.95  
-    )
-    model.add_seasonality(name='monthly', period=60, fourier_order=25)  
+WIND_SPEED_MODEL_CONFIG = {
+    'model': {
+        'yearly_seasonality': False,
+        'weekly_seasonality': False,
+        'interval_width': 0.95
+    },
+    'seasonalities': [
+        {'name': 'monthly', 'period': 60, 'fourier_order': 25}
+    ]
+}
 
-    model.fit(df)
+def create_wind_speed_model(df, model_filename, warm_start_filename=None, slim=False, config=None):
 
-    save_prophet_model(model, model_filename)
+    model = build_prophet_model(config or WIND_SPEED_MODEL_CONFIG)
+
+    fit_prophet_model(model, df, warm_start_filename)
+
+    save_prophet_model(model, model_filename, slim=slim)
+    return model
 
     # future = model.make_future_dataframe(periods=prediction_hours, freq='H')
 
@@ -0,0 +1,117 @@
+import logging
+
+from os import getenv, getpid, listdir, path
+from threading import Thread
+from time import perf_counter
+
+# Forecast paths run once before the server takes traffic, so the first
+# request of a city does not pay for the imports, the city lookups and the
+# model loads. Under a preforking server this runs in the master after the
+# app is preloaded and the workers share the loaded models copy-on-write.
+#
+# WEATHER_WARMUP_CITIES=chicago,boston limits the warmup to these cities
+# (default: every city with published models), WEATHER_WARMUP_HOURS=24,240
+# the forecast lengths requested per city, an empty value skips the warmup.
+#
+# This module is imported by the API for the readiness state, the forecasting
+# stack is only imported once a warmup runs.
+
+WARMUP_CITIES = [c for c in getenv('WEATHER_WARMUP_CITIES', '').split(',') if c] or None
+WARMUP_HOURS = [int(h) for h in getenv('WEATHER_WARMUP_HOURS', '24').split(',') if h]
+
+# Directories next to the city model directories, the global model's starts
+# with an underscore.
+NON_CITY_MODEL_DIRS = {'training_runs'}
+
+WARMUP_STATE = {
+    'ready': False,
+    'cities': [],
+    'failed': [],
+    'duration': None
+}
+
+
+def list_model_cities(models_dir=None):
+    if models_dir is None:
+        from ..model_prediction.model_prediction import MODELS_DIR
+        models_dir = MODELS_DIR
+    if not path.isdir(models_dir):
+        return []
+    return sorted(name for name in listdir(models_dir)
+                  if path.isdir(path.join(models_dir, name)) and not name.startswith(('_', '.'))
+                  and name not in NON_CITY_MODEL_DIRS)
+
+
+def warm_up_city(city_name, hours):
+    from ..model_prediction.model_prediction import predict_hourly_city_weather
+    timings = {}
+    for prediction_hours in hours:
+        started = perf_counter()
+        result = predict_hourly_city_weather(city_name, prediction_hours)
+        if result['status'] != 'success':
+            raise ValueError(result.get('message', f"No forecast for {city_name}"))
+        timings[str(prediction_hours)] = round(perf_counter() - started, 4)
+    return timings
+
+
+def warm_up(cities=None, hours=None):
+    cities = cities if cities is not None else WARMUP_CITIES if WARMUP_CITIES is not None else list_model_cities()
+    hours = WARMUP_HOURS if hours is None else hours
+
+    WARMUP_STATE.update(ready=False, cities=[], failed=[], duration=None)
+    started = perf_counter()
+    for city_name in cities if hours else []:
+        try:
+            WARMUP_STATE['cities'].append({'city': city_name, 'seconds': warm_up_city(city_name, hours)})
+        except Exception as e:
+            logging.error(f"Warmup of {city_name} failed: {e!r}")
+            WARMUP_STATE['failed'].append({'city': city_name, 'error': repr(e)})
+    WARMUP_STATE['duration'] = round(perf_counter() - started, 3)
+    WARMUP_STATE['ready'] = True
+    logging.info(f"Warmed up {len(WARMUP_STATE['cities'])} cities in {WARMUP_STATE['duration']} s, "
+                 f"{len(WARMUP_STATE['failed'])} failed")
+    return WARMUP_STATE
+
+
+def get_process_warmup():
+    # The warmup of a forecast pool process, see asgi.warm_up_pool.
+    return getpid(), dict(WARMUP_STATE)
+
+
+def merge_warmup_states(states):
+    # One state of the warmups of several processes: ready once all of them
+    # are, a city failed if it failed in any.
+    failed = {}
+    for state in states:
+        for failure in state['failed']:
+            failed.setdefault(failure['city'], failure)
+    cities = {}
+    for state in states:
+        for city in state['cities']:
+            if city['city'] not in failed:
+                cities.setdefault(city['city'], city)
+    durations = [state['duration'] for state in states if state['duration'] is not None]
+    return {
+        'ready': bool(states) and all(state['ready'] for state in states),
+        'cities': list(cities.values()),
+        'failed': list(failed.values()),
+        'duration': max(durations) if durations else None,
+        'processes': len(states)
+    }
+
+
+def start_background_warm_up(cities=None, hours=None):
+    # For servers that fork before the warmup, or none at all: requests are
+    # served while the forecast paths warm up and /readyz turns ready after.
+    thread = Thread(target=warm_up, args=(cities, hours), name='warmup', daemon=True)
+    thread.start()
+    return thread
+
+
+def time_first_response(app, city_name, prediction_hours):
+    # One request through the whole WSGI stack, the latency a client sees
+    # once a worker takes traffic.
+    with app.test_client() as client:
+        started = perf_counter()
+        response = client.get(f'/predict/{city_name}/{prediction_hours}')
+        return response.status_code, perf_counter() - started
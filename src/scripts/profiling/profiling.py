@@ -0,0 +1,218 @@
+import hmac
+import itertools
+import logging
+import sys
+import threading
+import uuid
+
+from contextlib import contextmanager
+from json import dumps, loads
+from os import getenv, makedirs, path, remove, listdir
+from time import perf_counter, time
+from urllib.parse import urlencode
+
+# Opt-in profiles of single API requests, for slow forecasts in production.
+#
+# A request is profiled when it carries WEATHER_PROFILE_TOKEN in the
+# X-Weather-Profile header, or as one in WEATHER_PROFILE_SAMPLE_RATE requests
+# (0, the default, samples none). The token is never read from the query
+# string, which the access logs record. Without a token and a sample rate
+# nothing is profiled and the admin endpoints answer 404, the only cost left
+# is the check of these two settings.
+#
+# A sampler thread takes the stacks of the threads serving the request every
+# WEATHER_PROFILE_INTERVAL_MS, i.e. wall clock time spent in the route,
+# predict_hourly_city_weather, the models and the Redis helpers. The stacks are
+# saved in the collapsed format of flamegraph.pl, inferno and speedscope, to
+# the last WEATHER_PROFILE_RING profiles in WEATHER_PROFILE_DIR, and served by
+# /admin/profiles/<id> to requests authenticated with the same token.
+
+PROFILE_TOKEN = getenv('WEATHER_PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = int(getenv('WEATHER_PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(getenv('WEATHER_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = getenv('WEATHER_PROFILE_DIR', path.join('/tmp', 'weather-profiles'))
+PROFILE_RING = int(getenv('WEATHER_PROFILE_RING', 50))
+
+PROFILE_HEADER = 'X-Weather-Profile'
+PROFILE_ID_HEADER = 'X-Weather-Profile-Id'
+
+# Endpoints of the operators, never profiled.
+UNPROFILED_ENDPOINTS = {'get_health', 'get_readiness', 'get_stats', 'get_metrics', 'get_profiles', 'get_profile'}
+
+_requests = itertools.count(1)
+_ring_lock = threading.Lock()
+
+
+class Profile:
+    def __init__(self, endpoint, request_path, trigger):
+        self.id = uuid.uuid4().hex[:16]
+        self.endpoint = endpoint
+        self.path = request_path
+        self.trigger = trigger
+        self.started = time()
+        self.threads = set()
+        self.stacks = {}
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._started = perf_counter()
+        self._sampler = threading.Thread(target=self._sample, name=f'profile-{self.id}', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        interval = PROFILE_INTERVAL_MS / 1000
+        while not self._stopped.wait(interval):
+            frames = sys._current_frames()
+            for ident in list(self.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = collapse_stack(frame)
+                    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                    self.samples += 1
+
+    def attach(self):
+        # Samples the current thread until the profile stops.
+        self.threads.add(threading.get_ident())
+
+    @contextmanager
+    def attached(self):
+        # Samples the current thread while in the block.
+        ident = threading.get_ident()
+        self.threads.add(ident)
+        try:
+            yield self
+        finally:
+            self.threads.discard(ident)
+
+    def run(self, function, *args, **kwargs):
+        with self.attached():
+            return function(*args, **kwargs)
+
+    def iterate(self, iterable):
+        # Streamed bodies may be iterated in a different thread per block.
+        iterator = iter(iterable)
+        while True:
+            with self.attached():
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._sampler.join()
+        self.duration = perf_counter() - self._started
+        try:
+            save_profile(self)
+        except OSError as e:
+            logging.error(f"Profile {self.id} of {self.path} could not be saved: {e!r}")
+
+    def metadata(self):
+        return {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'path': self.path,
+            'trigger': self.trigger,
+            'started': self.started,
+            'duration_s': round(self.duration, 6),
+            'samples': self.samples,
+            'interval_ms': PROFILE_INTERVAL_MS
+        }
+
+
+def collapse_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def is_authorized(token):
+    return bool(PROFILE_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+
+def bearer_token(authorization):
+    scheme, _, token = (authorization or '').partition(' ')
+    return token.strip() if scheme.lower() == 'bearer' else None
+
+
+def admin_status(authorization):
+    # The error status of an admin request, None once authorized.
+    if not PROFILE_TOKEN:
+        return 404
+    if not is_authorized(bearer_token(authorization)):
+        return 401
+    return None
+
+
+def profiled_path(request_path, query_params):
+    # The request path and its query, without a stray ?profile= token.
+    query = urlencode([(name, value) for name, value in query_params if name != 'profile'])
+    return f"{request_path}?{query}" if query else request_path
+
+
+def start_profile(endpoint, token, request_path, query_params=()):
+    # Returns the Profile of a request to profile, or None.
+    if not (PROFILE_TOKEN or PROFILE_SAMPLE_RATE) or endpoint in UNPROFILED_ENDPOINTS:
+        return None
+    if token is not None and is_authorized(token):
+        return Profile(endpoint, profiled_path(request_path, query_params), 'requested')
+    if PROFILE_SAMPLE_RATE and next(_requests) % PROFILE_SAMPLE_RATE == 0:
+        return Profile(endpoint, profiled_path(request_path, query_params), 'sampled')
+    return None
+
+
+def profile_filepaths(profile_id, profile_dir=None):
+    profile_dir = profile_dir or PROFILE_DIR
+    return path.join(profile_dir, f"{profile_id}.folded"), path.join(profile_dir, f"{profile_id}.json")
+
+
+def save_profile(profile, profile_dir=None):
+    # Keeps the last PROFILE_RING profiles, oldest first out.
+    profile_dir = profile_dir or PROFILE_DIR
+    makedirs(profile_dir, exist_ok=True)
+    stacks_filepath, metadata_filepath = profile_filepaths(profile.id, profile_dir)
+    with open(stacks_filepath, 'w') as file:
+        file.writelines(f"{stack} {count}\n" for stack, count in sorted(profile.stacks.items()))
+    with open(metadata_filepath, 'w') as file:
+        file.write(dumps(profile.metadata()))
+
+    with _ring_lock:
+        for metadata in list_profiles(profile_dir)[PROFILE_RING:]:
+            for filepath in profile_filepaths(metadata['id'], profile_dir):
+                try:
+                    remove(filepath)
+                except FileNotFoundError:
+                    pass
+
+
+def list_profiles(profile_dir=None):
+    # The saved profiles, newest first.
+    profile_dir = profile_dir or PROFILE_DIR
+    if not path.isdir(profile_dir):
+        return []
+    profiles = []
+    for filename in listdir(profile_dir):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(path.join(profile_dir, filename)) as file:
+                profiles.append(loads(file.read()))
+        except (OSError, ValueError):
+            continue
+    return sorted(profiles, key=lambda metadata: metadata['started'], reverse=True)
+
+
+def read_profile(profile_id, profile_dir=None):
+    # The collapsed stacks of a profile, None for unknown ids.
+    if not profile_id.isalnum():
+        return None
+    try:
+        with open(profile_filepaths(profile_id, profile_dir)[0]) as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
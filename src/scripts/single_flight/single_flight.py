@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import uuid
+
+from concurrent.futures import Future
+from json import dumps, loads
+from os import getenv, path
+from threading import Lock
+from time import time, sleep
+
+from redis.exceptions import RedisError
+
+from ..model_registry.model_registry import read_current_manifest
+from ..tracing.tracing import inject_context, run_in_context
+from ...redis.get.get import connect_to_redis
+
+# Identical concurrent forecasts are computed once. Requests with the same
+# key, i.e. the same city, published model version, UTC hour and engines,
+# wait on the computation in flight and slice their horizon out of its result.
+# A forecast of N hours is the first N rows of any longer forecast of the same
+# key, so horizons are rounded up to HORIZON_BUCKETS and a request joins any
+# computation in flight with a horizon at least as long as its own.
+#
+# WEATHER_SINGLE_FLIGHT=process (default) coalesces within the process, across
+# its threads and, for the ASGI API, across its event loop tasks. =redis
+# additionally coalesces the computations of all workers on a Redis lock: the
+# first worker computes and leaves the result for REDIS_RESULT_TTL_S, the
+# others poll for it. Across workers only equal rounded horizons are shared.
+# =off disables coalescing.
+
+SINGLE_FLIGHT_MODE = getenv('WEATHER_SINGLE_FLIGHT', 'process')
+
+HORIZON_BUCKETS = [24, 48, 72, 120, 168, 240]
+
+REDIS_LOCK_TTL_S = 120
+REDIS_RESULT_TTL_S = 30
+REDIS_POLL_INTERVAL_S = 0.05
+REDIS_KEY_PREFIX = 'single_flight'
+
+SINGLE_FLIGHT_STATS = {
+    'requests': 0,
+    'computed': 0,
+    'coalesced': 0,
+    'coalesced_redis': 0
+}
+
+_in_flight = {}
+_in_flight_lock = Lock()
+
+
+def normalize_horizon(hours):
+    for bucket in HORIZON_BUCKETS:
+        if hours <= bucket:
+            return bucket if hours > 0 else hours
+    return hours
+
+
+def get_model_version(city_name):
+    from ..model_prediction.model_prediction import MODELS_DIR
+    manifest = read_current_manifest(path.join(MODELS_DIR, city_name))
+    return manifest['version'] if manifest is not None else None
+
+
+def forecast_key(city_name, engines=None, hour=None):
+    hour = int(time() // 3600) if hour is None else hour
+    engines = engines if isinstance(engines, str) or engines is None else sorted(engines.items())
+    return dumps([city_name, get_model_version(city_name), hour, engines])
+
+
+def count(name, amount=1):
+    with _in_flight_lock:
+        SINGLE_FLIGHT_STATS[name] += amount
+
+
+def join_or_lead(key, hours):
+    # Returns the future of the computation to wait on, its horizon and
+    # whether the caller leads it, i.e. has to compute and finish it.
+    with _in_flight_lock:
+        SINGLE_FLIGHT_STATS['requests'] += 1
+        for horizon, future in _in_flight.get(key, []):
+            if horizon >= hours:
+                SINGLE_FLIGHT_STATS['coalesced'] += 1
+                return future, horizon, False
+        future, horizon = Future(), normalize_horizon(hours)
+        _in_flight.setdefault(key, []).append((horizon, future))
+        SINGLE_FLIGHT_STATS['computed'] += 1
+        return future, horizon, True
+
+
+def finish(key, horizon, future, result=None, error=None):
+    with _in_flight_lock:
+        flights = [flight for flight in _in_flight.get(key, []) if flight[1] is not future]
+        if flights:
+            _in_flight[key] = flights
+        else:
+            _in_flight.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def slice_forecast(result, hours):
+    if result.get('status') != 'success':
+        return result
+    return dict(result, result=result['result'][:hours])
+
+
+def share_redis_result(redis_cnt, result_key, result):
+    try:
+        redis_cnt.set(result_key, dumps(result), ex=REDIS_RESULT_TTL_S)
+    except RedisError as e:
+        logging.warning(f"Single flight failed to share the result over Redis: {e!r}")
+
+
+def release_redis_lock(redis_cnt, lock_key, token):
+    try:
+        if redis_cnt.get(lock_key) == token:
+            redis_cnt.delete(lock_key)
+    except RedisError as e:
+        logging.warning(f"Single flight failed to release '{lock_key}', it expires in {REDIS_LOCK_TTL_S} s: {e!r}")
+
+
+def redis_single_flight(key, compute, redis_cnt=None):
+    # Redis being unavailable degrades to computing in process.
+    redis_cnt = redis_cnt or connect_to_redis(host="redis", port="6379")
+    lock_key, result_key = f'{REDIS_KEY_PREFIX}:lock:{key}', f'{REDIS_KEY_PREFIX}:result:{key}'
+    token = uuid.uuid4().hex.encode()
+    deadline = time() + REDIS_LOCK_TTL_S
+    while time() < deadline:
+        try:
+            cached = redis_cnt.get(result_key)
+            acquired = cached is None and redis_cnt.set(lock_key, token, nx=True, ex=REDIS_LOCK_TTL_S)
+        except RedisError as e:
+            logging.warning(f"Single flight over Redis failed, computing in process: {e!r}")
+            return compute()
+        if cached is not None:
+            count('coalesced_redis')
+            return loads(cached)
+        if acquired:
+            # The result is shared before the lock is released, so a waiter
+            # always finds one of the two.
+            try:
+                result = compute()
+                share_redis_result(redis_cnt, result_key, result)
+                return result
+            finally:
+                release_redis_lock(redis_cnt, lock_key, token)
+        sleep(REDIS_POLL_INTERVAL_S)
+    logging.warning(f"Single flight: no result for {key} within {REDIS_LOCK_TTL_S} s, computing it")
+    return compute()
+
+
+def compute_forecast(key, city_name, prediction_hours, engines=None, mode=None):
+    # Also runs in the forecast processes of the ASGI API, so it is a module
+    # level function and imports the forecasting stack on first use.
+    from ..model_prediction.model_prediction import predict_hourly_city_weather
+
+    def compute():
+        return predict_hourly_city_weather(city_name=city_name, prediction_hours=prediction_hours, engines=engines)
+
+    if (mode or SINGLE_FLIGHT_MODE) == 'redis':
+        return redis_single_flight(f'{key}:{prediction_hours}', compute)
+    return compute()
+
+
+def coalesced_forecast(city_name, prediction_hours, engines=None):
+    hours = int(prediction_hours)
+    if SINGLE_FLIGHT_MODE == 'off':
+        return compute_forecast(None, city_name, hours, engines, 'off')
+
+    key = forecast_key(city_name, engines)
+    future, horizon, leader = join_or_lead(key, hours)
+    if leader:
+        try:
+            finish(key, horizon, future, result=compute_forecast(key, city_name, horizon, engines))
+        except BaseException as e:
+            finish(key, horizon, future, error=e)
+    return slice_forecast(future.result(), hours)
+
+
+async def coalesced_forecast_async(city_name, prediction_hours, engines, pool):
+    # Leaders submit the computation to the pool, waiters await its future
+    # without blocking the event loop.
+    hours = int(prediction_hours)
+    if SINGLE_FLIGHT_MODE == 'off':
+        return await asyncio.wrap_future(pool.submit(run_in_context, inject_context(), compute_forecast, None,
+                                                     city_name, hours, engines, 'off'))
+
+    key = forecast_key(city_name, engines)
+    future, horizon, leader = join_or_lead(key, hours)
+    if leader:
+        def done(pool_future):
+            try:
+                finish(key, horizon, future, result=pool_future.result())
+            except BaseException as e:
+                finish(key, horizon, future, error=e)
+        # The computation continues the leader's trace in the forecast process.
+        pool.submit(run_in_context, inject_context(), compute_forecast, key, city_name, horizon, engines,
+                    SINGLE_FLIGHT_MODE).add_done_callback(done)
+    return slice_forecast(await asyncio.wrap_future(future), hours)
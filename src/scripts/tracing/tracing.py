@@ -0,0 +1,344 @@
+import inspect
+import logging
+
+from contextlib import nullcontext
+from functools import partial, wraps
+from json import dumps
+from os import getenv
+from threading import Lock
+from urllib.request import Request, urlopen
+
+# Trace spans of the APIs, in OpenTelemetry: one per request, Redis command,
+# Redis helper (get_city, check_city_name...), model load and forecast stage
+# (check_city, open_models, predict and classify per parameter, serialize),
+# with the city, parameter, rows predicted and model cache hits as attributes.
+#
+# WEATHER_TRACE_EXPORTER=file appends the spans to WEATHER_TRACE_FILE, =otlp
+# posts them to the collector at OTEL_EXPORTER_OTLP_TRACES_ENDPOINT, both in
+# the OTLP/JSON encoding: one ExportTraceServiceRequest per line in the file,
+# as the collector's file exporter writes them. Tracing is off by default,
+# opentelemetry is then not imported and spans cost one function call.
+#
+# Logged errors, e.g. from handle_error, name the trace and span they were
+# raised in, and the exceptions are recorded on the spans.
+
+TRACE_EXPORTER = getenv('WEATHER_TRACE_EXPORTER', '')
+TRACE_FILE = getenv('WEATHER_TRACE_FILE', 'traces.jsonl')
+TRACE_ENDPOINT = getenv('OTEL_EXPORTER_OTLP_TRACES_ENDPOINT',
+                        getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318').rstrip('/') + '/v1/traces')
+SERVICE_NAME = getenv('OTEL_SERVICE_NAME', 'weather-api')
+
+TRACER_NAME = 'weather'
+
+_tracer = None
+_provider = None
+_configure_lock = Lock()
+
+
+class NoSpan:
+    # Stands in for the spans while tracing is off.
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def is_recording(self):
+        return False
+
+
+NO_SPAN = NoSpan()
+
+
+def encode_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [encode_value(item) for item in value]}}
+    return {'stringValue': str(value)}
+
+
+def encode_attributes(attributes):
+    return [{'key': key, 'value': encode_value(value)} for key, value in (attributes or {}).items()]
+
+
+def encode_span(span):
+    encoded = {
+        'traceId': format(span.context.trace_id, '032x'),
+        'spanId': format(span.context.span_id, '016x'),
+        'name': span.name,
+        # OTLP kinds start at 1 for internal spans, SpanKind at 0.
+        'kind': span.kind.value + 1,
+        'startTimeUnixNano': str(span.start_time),
+        'endTimeUnixNano': str(span.end_time),
+        'attributes': encode_attributes(span.attributes),
+        'events': [{'timeUnixNano': str(event.timestamp), 'name': event.name,
+                    'attributes': encode_attributes(event.attributes)} for event in span.events],
+        'status': {'code': span.status.status_code.value, 'message': span.status.description or ''}
+    }
+    if span.parent is not None:
+        encoded['parentSpanId'] = format(span.parent.span_id, '016x')
+    return encoded
+
+
+def encode_spans(spans):
+    # An ExportTraceServiceRequest of the spans, grouped by resource and scope.
+    resources = {}
+    for span in spans:
+        resource = resources.setdefault(id(span.resource), (span.resource, {}))
+        scope = span.instrumentation_scope
+        resource[1].setdefault((scope.name, scope.version), []).append(encode_span(span))
+    return {'resourceSpans': [
+        {'resource': {'attributes': encode_attributes(resource.attributes)},
+         'scopeSpans': [{'scope': {'name': name, 'version': version or ''}, 'spans': encoded}
+                        for (name, version), encoded in scopes.items()]}
+        for resource, scopes in resources.values()
+    ]}
+
+
+def write_spans(filepath, payload):
+    with open(filepath, 'a') as file:
+        file.write(payload + '\n')
+
+
+def post_spans(endpoint, payload, timeout=10):
+    request = Request(endpoint, data=payload.encode(), headers={'Content-Type': 'application/json'})
+    with urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def create_exporter(exporter=None):
+    # An OTLP/JSON SpanExporter writing to the file or posting to the collector.
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+    exporter = exporter or TRACE_EXPORTER
+    if exporter == 'file':
+        send = partial(write_spans, TRACE_FILE)
+    elif exporter == 'otlp':
+        send = partial(post_spans, TRACE_ENDPOINT)
+    else:
+        raise ValueError(f"Unknown trace exporter '{exporter}', expected 'file' or 'otlp'")
+
+    class OtlpJsonExporter(SpanExporter):
+        def export(self, spans):
+            try:
+                send(dumps(encode_spans(spans), separators=(',', ':')))
+            except Exception as e:
+                logging.warning(f"Failed to export {len(spans)} spans: {e!r}")
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+
+    return OtlpJsonExporter()
+
+
+def configure_tracing(exporter=None, span_processor=None):
+    # Starts tracing with the exporter, or the configured one. Returns whether
+    # tracing is on.
+    global _tracer, _provider
+    if span_processor is None and not (exporter or TRACE_EXPORTER):
+        return _tracer is not None
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    with _configure_lock:
+        provider = TracerProvider(resource=Resource.create({'service.name': SERVICE_NAME}))
+        provider.add_span_processor(span_processor or BatchSpanProcessor(create_exporter(exporter)))
+        logging.getLogger().addFilter(LOG_FILTER)
+        _provider, _tracer = provider, provider.get_tracer(TRACER_NAME)
+    return True
+
+
+def flush_tracing(timeout_ms=5000):
+    # Exports the spans still batched, e.g. before a worker exits.
+    if _provider is not None:
+        _provider.force_flush(timeout_ms)
+
+
+def is_tracing():
+    return _tracer is not None
+
+
+def start_span(name, attributes=None, kind=None):
+    # A context manager of a child span of the current one, the span records
+    # the exceptions raised in it.
+    if _tracer is None:
+        return nullcontext(NO_SPAN)
+    attributes = {key: value for key, value in (attributes or {}).items() if value is not None and value != ''}
+    if kind is None:
+        return _tracer.start_as_current_span(name, attributes=attributes)
+    from opentelemetry.trace import SpanKind
+    return _tracer.start_as_current_span(name, kind=getattr(SpanKind, kind), attributes=attributes)
+
+
+def traced(name, arguments=None):
+    # Decorates a function with a span, arguments maps span attributes to the
+    # names of the function arguments they record.
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        def span(args, kwargs):
+            bound = signature.bind_partial(*args, **kwargs).arguments
+            return start_span(name, {attribute: bound[argument] for attribute, argument in (arguments or {}).items()
+                                     if argument in bound})
+
+        if inspect.iscoroutinefunction(function):
+            @wraps(function)
+            async def traced_coroutine(*args, **kwargs):
+                if _tracer is None:
+                    return await function(*args, **kwargs)
+                with span(args, kwargs):
+                    return await function(*args, **kwargs)
+            return traced_coroutine
+
+        @wraps(function)
+        def traced_function(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with span(args, kwargs):
+                return function(*args, **kwargs)
+        return traced_function
+    return decorator
+
+
+def redis_span(command):
+    return start_span(f"redis {command}", {'db.system': 'redis', 'db.operation.name': command}, 'CLIENT')
+
+
+def trace_redis(redis_cnt):
+    from ..metrics.metrics import redis_command_name
+
+    execute_command = redis_cnt.execute_command
+
+    def traced_execute_command(*args, **options):
+        if _tracer is None:
+            return execute_command(*args, **options)
+        with redis_span(redis_command_name(args)):
+            return execute_command(*args, **options)
+    redis_cnt.execute_command = traced_execute_command
+    return redis_cnt
+
+
+def trace_async_redis(redis_cnt):
+    from ..metrics.metrics import redis_command_name
+
+    execute_command = redis_cnt.execute_command
+
+    async def traced_execute_command(*args, **options):
+        if _tracer is None:
+            return await execute_command(*args, **options)
+        with redis_span(redis_command_name(args)):
+            return await execute_command(*args, **options)
+    redis_cnt.execute_command = traced_execute_command
+    return redis_cnt
+
+
+def start_request_span(method, route=None, attributes=None):
+    # Starts the span of a request and makes it current, returns it with the
+    # token to detach it, or None while tracing is off.
+    if _tracer is None:
+        return None
+    from opentelemetry import context, trace
+
+    attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+    span = _tracer.start_span(f"{method} {route}" if route else method, kind=trace.SpanKind.SERVER,
+                              attributes=dict(attributes, **{'http.request.method': method}))
+    if route:
+        span.set_attribute('http.route', route)
+    return span, context.attach(trace.set_span_in_context(span))
+
+
+def finish_request_span(request_span, status_code, route=None, attributes=None):
+    # Detaches the span of a request and returns the function ending it, the
+    # span of a streamed response ends once the body is sent.
+    from opentelemetry import context
+    from opentelemetry.trace import Status, StatusCode
+
+    span, token = request_span
+    span.set_attributes({key: value for key, value in (attributes or {}).items() if value is not None})
+    if route:
+        span.update_name(f"{span.name} {route}")
+        span.set_attribute('http.route', route)
+    span.set_attribute('http.response.status_code', status_code)
+    if status_code >= 500:
+        span.set_status(Status(StatusCode.ERROR))
+    context.detach(token)
+    return span.end
+
+
+def traced_lines(lines):
+    # Iterates lines in the trace context they were created in, streamed
+    # bodies are sent after their route returned.
+    if _tracer is None:
+        return lines
+    from opentelemetry import context
+
+    def iterate(ctx):
+        iterator = iter(lines)
+        while True:
+            token = context.attach(ctx)
+            try:
+                line = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                context.detach(token)
+            yield line
+    return iterate(context.get_current())
+
+
+def inject_context():
+    # The trace context as W3C headers, to continue it in another process.
+    if _tracer is None:
+        return None
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+    carrier = {}
+    TraceContextTextMapPropagator().inject(carrier)
+    return carrier
+
+
+def run_in_context(carrier, function, *args, **kwargs):
+    # Runs function in the trace context of inject_context, e.g. in the
+    # forecast processes.
+    if not carrier or _tracer is None:
+        return function(*args, **kwargs)
+    from opentelemetry import context
+    from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
+
+    token = context.attach(TraceContextTextMapPropagator().extract(carrier))
+    try:
+        return function(*args, **kwargs)
+    finally:
+        context.detach(token)
+
+
+def current_trace_ids():
+    # The ids of the current span, None outside of spans.
+    if _tracer is None:
+        return None
+    from opentelemetry import trace
+
+    span_context = trace.get_current_span().get_span_context()
+    if not span_context.is_valid:
+        return None
+    return format(span_context.trace_id, '032x'), format(span_context.span_id, '016x')
+
+
+class TraceContextFilter(logging.Filter):
+    # Appends the trace and span ids to the records logged inside spans.
+    def filter(self, record):
+        ids = current_trace_ids()
+        record.trace_id, record.span_id = ids or ('', '')
+        if ids and not getattr(record, 'trace_context', False):
+            record.msg = f"{record.msg} [trace_id={ids[0]} span_id={ids[1]}]"
+            record.trace_context = True
+        return True
+
+
+LOG_FILTER = TraceContextFilter()
@@ -0,0 +1,193 @@
+import argparse
+import logging
+import math
+import mmap
+import re
+import struct
+import zipfile
+
+import numpy as np
+
+from numpy.lib import format as npy_format
+
+# A fitted DecisionTreeClassifier flattened into plain arrays, stored as an
+# uncompressed .npz so the arrays can be memory-mapped straight out of the
+# archive. Serving only needs numpy, neither sklearn nor pickle.
+
+TREE_MODEL_EXTENSION = '.npz'
+TREE_MODEL_FORMAT_VERSION = 1
+TREE_LEAF = -1
+
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+ZIP_PADDING_FIELD = struct.Struct('<HH')
+ZIP_PADDING_FIELD_ID = 0xD935
+NPY_PREFIX = struct.Struct('<6s2BH')
+NPY_HEADER_PATTERN = re.compile(r"\{'descr': '([^']+)', 'fortran_order': (True|False), 'shape': \(([\d, ]*)\), \}")
+
+
+class TreeModel:
+    def __init__(self, arrays):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children = arrays['children']
+        self.leaf_class = arrays['leaf_class']
+        self.max_depth = int(arrays['max_depth'][0])
+        self.classes_ = arrays['classes']
+        self.feature_names_in_ = arrays['feature_names']
+
+    def apply(self, X):
+        X = self.feature_matrix(X)
+        rows = X.shape[1]
+        values = X.ravel()
+        offsets = np.arange(rows, dtype=np.intp)
+        node = np.zeros(rows, dtype=np.intp)
+        # Every row takes one step per tree level. Leaves point back to
+        # themselves with an infinite threshold, so finished rows stay put.
+        for _ in range(self.max_depth):
+            index = self.feature[node] * rows
+            index += offsets
+            go_right = values[index] > self.threshold[node]
+            node = self.children[2 * node + go_right]
+        return node
+
+    def predict(self, X):
+        return self.classes_[self.leaf_class[self.apply(X)]]
+
+    def feature_matrix(self, X):
+        # Feature major float32 matrix, sklearn also compares float32
+        # features against the float64 thresholds.
+        if hasattr(X, 'columns'):
+            missing = [name for name in self.feature_names_in_ if name not in X.columns]
+            if missing:
+                logging.error(f"Failed to predict: features {missing} are missing from the input")
+                raise ValueError(f"Missing features: {missing}")
+            matrix = np.empty((len(self.feature_names_in_), len(X)), dtype=np.float32)
+            for i, name in enumerate(self.feature_names_in_):
+                matrix[i] = X[name].to_numpy()
+        else:
+            X = np.asarray(X)
+            if X.ndim != 2 or X.shape[1] != len(self.feature_names_in_):
+                logging.error(f"Failed to predict: expected {len(self.feature_names_in_)} features, "
+                              f"got shape {X.shape}")
+                raise ValueError("Invalid input shape")
+            matrix = np.ascontiguousarray(X.T, dtype=np.float32)
+        if np.isnan(matrix).any():
+            logging.error("Failed to predict: input contains NaN")
+            raise ValueError("Input contains NaN")
+        return matrix
+
+
+def tree_model_arrays(model):
+    if not hasattr(model, 'tree_') or not hasattr(model, 'feature_names_in_'):
+        logging.error("Failed to export: model must be a DecisionTreeClassifier fitted on a DataFrame")
+        raise AttributeError("Model is not fitted")
+    if model.n_outputs_ != 1:
+        logging.error("Failed to export: only single output trees are supported")
+        raise ValueError("Multi-output tree")
+
+    tree = model.tree_
+    leaves = tree.children_left == TREE_LEAF
+    nodes = np.arange(tree.node_count)
+    children = np.column_stack([np.where(leaves, nodes, tree.children_left),
+                                np.where(leaves, nodes, tree.children_right)])
+    classes = np.asarray(model.classes_)
+    if classes.dtype == object:
+        classes = classes.astype(str)
+    return {
+        'format_version': np.array([TREE_MODEL_FORMAT_VERSION], dtype=np.int32),
+        'max_depth': np.array([tree.max_depth], dtype=np.int32),
+        'feature': np.where(leaves, 0, tree.feature).astype(np.int64),
+        'threshold': np.where(leaves, np.inf, tree.threshold).astype(np.float64),
+        'children': children.ravel().astype(np.int64),
+        'leaf_class': np.argmax(tree.value[:, 0, :], axis=1).astype(np.int64),
+        'classes': classes,
+        'feature_names': np.asarray(model.feature_names_in_).astype(str)
+    }
+
+
+def export_tree_model(model, filename):
+    write_aligned_npz(filename, tree_model_arrays(model))
+
+
+def write_aligned_npz(filename, arrays):
+    # Same layout as np.savez, but every member is padded through a zip extra
+    # field so its array data starts on an ARRAY_ALIGN boundary of the file.
+    # Memory-mapped views of unaligned data take numpy's slow copying paths.
+    with open(filename, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as archive:
+        for name, array in arrays.items():
+            info = zipfile.ZipInfo(name + '.npy')
+            member_offset = f.tell() + ZIP_LOCAL_HEADER.size + len(info.filename) + ZIP_PADDING_FIELD.size
+            padding = -member_offset % npy_format.ARRAY_ALIGN
+            info.extra = ZIP_PADDING_FIELD.pack(ZIP_PADDING_FIELD_ID, padding) + bytes(padding)
+            with archive.open(info, 'w') as member:
+                npy_format.write_array(member, array, allow_pickle=False)
+
+
+def read_npz_arrays(filename, mmap_file=True):
+    if not mmap_file:
+        with np.load(filename, allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+
+    arrays = {}
+    with open(filename, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for info in zipfile.ZipFile(f).infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                logging.error(f"Failed to map '{filename}': member '{info.filename}' is compressed")
+                raise ValueError("Compressed tree model")
+            header = ZIP_LOCAL_HEADER.unpack_from(buffer, info.header_offset)
+            offset, shape, fortran_order, dtype = read_npy_header(
+                buffer, info.header_offset + ZIP_LOCAL_HEADER.size + header[-2] + header[-1])
+            if dtype.hasobject:
+                logging.error(f"Failed to map '{filename}': member '{info.filename}' holds objects")
+                raise ValueError("Object array in tree model")
+            array = np.frombuffer(buffer, dtype=dtype, count=math.prod(shape), offset=offset)
+            arrays[info.filename[:-len('.npy')]] = array.reshape(shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+def read_npy_header(buffer, offset):
+    # The headers np.savez writes are a fixed dict literal, matching them is
+    # much cheaper than the literal_eval numpy does for arbitrary headers.
+    magic, major, _, header_length = NPY_PREFIX.unpack_from(buffer, offset)
+    if magic != npy_format.MAGIC_PREFIX or major != 1:
+        logging.error(f"Failed to map tree model: unsupported npy header at offset {offset}")
+        raise ValueError("Unsupported npy header")
+    start = offset + NPY_PREFIX.size
+    match = NPY_HEADER_PATTERN.match(buffer[start:start + header_length].decode('latin1'))
+    if match is None:
+        logging.error(f"Failed to map tree model: unexpected npy header at offset {offset}")
+        raise ValueError("Unsupported npy header")
+    shape = tuple(int(size) for size in match.group(3).split(',') if size.strip())
+    return start + header_length, shape, match.group(2) == 'True', np.dtype(match.group(1))
+
+
+def load_tree_model(filename, mmap_file=True):
+    try:
+        arrays = read_npz_arrays(filename, mmap_file)
+    except (FileNotFoundError, PermissionError, zipfile.BadZipFile) as e:
+        logging.error(f"Failed to load tree model '{filename}': {e}")
+        raise e
+    if int(arrays['format_version'][0]) != TREE_MODEL_FORMAT_VERSION:
+        logging.error(f"Failed to load '{filename}': unsupported format version {arrays['format_version'][0]}")
+        raise ValueError("Unsupported tree model format")
+    return TreeModel(arrays)
+
+
+def convert_sklearn_model(pickle_filename, filename=None):
+    from ..model_training.utils.utils import load_sklearn_model
+
+    if filename is None:
+        filename = pickle_filename.rsplit('.', 1)[0] + TREE_MODEL_EXTENSION
+    export_tree_model(load_sklearn_model(pickle_filename), filename)
+    return filename
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Convert pickled weather_description trees to .npz tree models")
+    parser.add_argument('filenames', nargs='+', help="pickled DecisionTreeClassifier files")
+    args = parser.parse_args()
+
+    for pickle_filename in args.filenames:
+        logging.info(f"Converted '{pickle_filename}' to '{convert_sklearn_model(pickle_filename)}'")
@@ -0,0 +1,273 @@
+import argparse
+import copy
+import hashlib
+import itertools
+import logging
+import os
+import random
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from json import dumps, loads
+from os import path, makedirs
+from time import perf_counter
+
+from ..backtesting.backtesting import run_backtest_job, rolling_origins, BACKTEST_CONFIG, PROPHET_ENGINE
+from ..model_training.model_training import (PRODUCTS, MODEL_CONFIGS, TUNED_MODEL_CONFIGS_FILENAME,
+                                             TRAINING_WINDOW_DAYS)
+from ..model_training.orchestrator.orchestrator import (list_trainable_cities, limit_worker_threads,
+                                                        worker_thread_env, get_training_frame)
+from ..model_training.utils.utils import handle_error
+from ..model_registry.model_registry import write_file_atomically
+
+# Searches the seasonality and changepoint settings of the Prophet products.
+# A trial is one (product, config) pair scored by the rolling origin backtest
+# over all cities. Trials run in worker processes until the wall-clock budget
+# is spent, the trials still running then are waited for. Scored trials are
+# cached on disk by their inputs, so a search can be extended or resumed.
+#
+# Per product the trials that no other trial beats on MAE, fit time and
+# predict time together form the Pareto front. Out of the front, the cheapest
+# config whose MAE is within `tolerance` of the best MAE is written to
+# TUNED_MODEL_CONFIGS_FILENAME, which the training factories read.
+
+TUNING_TRIALS_DIR = 'data/tuning/trials'
+
+SEARCH_SPACE = {
+    'period': [30, 30.5, 60],
+    'fourier_order': [3, 5, 10, 15, 25],
+    'changepoint_prior_scale': [0.01, 0.05, 0.5],
+    'n_changepoints': [10, 25]
+}
+
+TUNING_BACKTEST_CONFIG = dict(BACKTEST_CONFIG, origins=2)
+
+PARETO_OBJECTIVES = ['mae', 'fit_time', 'predict_time']
+
+
+def build_config(base_config, period, fourier_order, changepoint_prior_scale, n_changepoints):
+    config = copy.deepcopy(base_config)
+    config['model']['changepoint_prior_scale'] = changepoint_prior_scale
+    config['model']['n_changepoints'] = n_changepoints
+    config['seasonalities'][0]['period'] = period
+    config['seasonalities'][0]['fourier_order'] = fourier_order
+    return config
+
+
+def candidate_configs(base_config, trials, space=SEARCH_SPACE, seed=0):
+    # The current config always competes, the rest is sampled from the grid.
+    grid = list(itertools.product(*(space[name] for name in ('period', 'fourier_order',
+                                                             'changepoint_prior_scale', 'n_changepoints'))))
+    random.Random(seed).shuffle(grid)
+    configs = [base_config]
+    for values in grid:
+        if len(configs) >= trials:
+            break
+        config = build_config(base_config, *values)
+        if config not in configs:
+            configs.append(config)
+    return configs
+
+
+def dataset_keys(cities):
+    keys = {}
+    for city in cities:
+        timestamps = get_training_frame(city)['timestamp']
+        keys[city] = [int(len(timestamps)), int(timestamps.max())]
+    return keys
+
+
+def get_trial_key(product, config, datasets, backtest_config, window_days):
+    content = dumps([product, config, datasets, backtest_config, window_days], sort_keys=True)
+    return hashlib.sha256(content.encode('UTF-8')).hexdigest()
+
+
+def read_cached_trial(trial_key, trials_dir=TUNING_TRIALS_DIR):
+    filename = path.join(trials_dir, f'{trial_key}.json')
+    if not path.isfile(filename):
+        return None
+    with open(filename, 'r') as f:
+        return loads(f.read())
+
+
+def write_cached_trial(trial_key, trial, trials_dir=TUNING_TRIALS_DIR):
+    makedirs(trials_dir, exist_ok=True)
+    write_file_atomically(path.join(trials_dir, f'{trial_key}.json'), dumps(trial))
+
+
+def evaluate_trial(product, config, cities, backtest_config=TUNING_BACKTEST_CONFIG, window_days=None):
+    records = []
+    for city in cities:
+        df = get_training_frame(city)
+        for origin in rolling_origins(df['timestamp'].to_numpy(), backtest_config['origins'],
+                                      backtest_config['step_hours'], backtest_config['horizon_hours']):
+            records.append(run_backtest_job(city, product, PROPHET_ENGINE, origin, backtest_config, window_days,
+                                            df=df, model_config=config))
+
+    scored = [r for r in records if r['status'] == 'ok']
+    trial = {'product': product, 'config': config, 'jobs': len(records), 'failed': len(records) - len(scored)}
+    if scored:
+        buckets = [bucket for r in scored for bucket in r['metrics'].values()]
+        n = sum(bucket['n'] for bucket in buckets)
+        trial['mae'] = sum(bucket['mae'] * bucket['n'] for bucket in buckets) / n
+        trial['rmse'] = float(np.sqrt(sum(bucket['rmse'] ** 2 * bucket['n'] for bucket in buckets) / n))
+        trial['fit_time'] = float(np.mean([r['fit_time'] for r in scored]))
+        trial['predict_time'] = float(np.mean([r['predict_time'] for r in scored]))
+    return trial
+
+
+def dominates(a, b, objectives=PARETO_OBJECTIVES):
+    return (all(a[key] <= b[key] for key in objectives)
+            and any(a[key] < b[key] for key in objectives))
+
+
+def pareto_front(trials, objectives=PARETO_OBJECTIVES):
+    front = [t for t in trials if not any(dominates(other, t, objectives) for other in trials)]
+    return sorted(front, key=lambda t: t['mae'])
+
+
+def select_config(front, tolerance=0.02):
+    best_mae = min(t['mae'] for t in front)
+    acceptable = [t for t in front if t['mae'] <= best_mae * (1 + tolerance)]
+    return min(acceptable, key=lambda t: (t['fit_time'] + t['predict_time'], t['mae']))
+
+
+def interleave_candidates(products, trials, seed):
+    # Round robin over the products, so a short budget still covers each.
+    candidates = {product: candidate_configs(MODEL_CONFIGS[PRODUCTS[product]], trials, seed=seed)
+                  for product in products}
+    ordered = []
+    for i in range(trials):
+        ordered += [(product, configs[i]) for product, configs in candidates.items() if i < len(configs)]
+    return ordered
+
+
+def run_trials(candidates, cities, backtest_config, window_days, budget_s, max_workers, threads_per_worker,
+               trials_dir):
+    datasets = dataset_keys(cities)
+    results, pending = [], []
+    for product, config in candidates:
+        trial_key = get_trial_key(product, config, datasets, backtest_config, window_days)
+        cached = read_cached_trial(trial_key, trials_dir)
+        if cached is not None:
+            results.append(cached)
+        else:
+            pending.append((trial_key, product, config))
+    logging.info(f"Tuning: {len(results)} cached trials, {len(pending)} to run within {budget_s} s")
+
+    def finish(trial_key, trial):
+        write_cached_trial(trial_key, trial, trials_dir)
+        results.append(trial)
+
+    deadline = perf_counter() + budget_s
+    if max_workers == 1:
+        for trial_key, product, config in pending:
+            if perf_counter() >= deadline:
+                break
+            finish(trial_key, evaluate_trial(product, config, cities, backtest_config, window_days))
+        return results
+
+    with worker_thread_env(threads_per_worker), \
+            ProcessPoolExecutor(max_workers=max_workers, initializer=limit_worker_threads,
+                                initargs=(threads_per_worker,)) as pool:
+        running = {}
+        while pending or running:
+            while pending and len(running) < max_workers and perf_counter() < deadline:
+                trial_key, product, config = pending.pop(0)
+                future = pool.submit(evaluate_trial, product, config, cities, backtest_config, window_days)
+                running[future] = trial_key
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finish(running.pop(future), future.result())
+    if pending:
+        logging.info(f"Tuning budget spent, {len(pending)} trials not run")
+    return results
+
+
+def summarize_trials(trials, tolerance=0.02):
+    tuned = {}
+    for product in sorted({t['product'] for t in trials}):
+        scored = [t for t in trials if t['product'] == product and 'mae' in t]
+        if not scored:
+            logging.error(f"No successful trial for {product}, its config is left unchanged")
+            continue
+        front = pareto_front(scored)
+        selected = select_config(front, tolerance)
+        tuned[product] = {
+            'config': selected['config'],
+            **{key: selected[key] for key in ('mae', 'rmse', 'fit_time', 'predict_time')},
+            'trials': len(scored),
+            'pareto_front': [{key: t[key] for key in ('config', 'mae', 'fit_time', 'predict_time')} for t in front]
+        }
+    return tuned
+
+
+def write_tuned_configs(tuned, metadata, filename=TUNED_MODEL_CONFIGS_FILENAME):
+    # Products that were not part of this search keep their tuned configs.
+    products = {}
+    if path.isfile(filename):
+        with open(filename, 'r') as f:
+            products = loads(f.read()).get('products', {})
+    products.update(tuned)
+    makedirs(path.dirname(filename) or '.', exist_ok=True)
+    write_file_atomically(filename, dumps(dict(metadata, products=products), indent=2, sort_keys=True))
+    return products
+
+
+def run_search(products=None, cities=None, trials=20, budget_s=3600, max_workers=None, threads_per_worker=1,
+               backtest_config=TUNING_BACKTEST_CONFIG, window_days=TRAINING_WINDOW_DAYS, tolerance=0.02, seed=0,
+               output=TUNED_MODEL_CONFIGS_FILENAME, trials_dir=TUNING_TRIALS_DIR):
+    products = [p for p in PRODUCTS if p != 'weather_description'] if products is None else products
+    unsupported = [p for p in products if 'seasonalities' not in MODEL_CONFIGS.get(PRODUCTS.get(p), {})]
+    if unsupported:
+        handle_error(f"Failed to tune: {unsupported} are not Prophet products", ValueError)
+    cities = list_trainable_cities() if cities is None else cities
+    max_workers = max_workers or os.cpu_count() or 1
+
+    started = perf_counter()
+    results = run_trials(interleave_candidates(products, trials, seed), cities, backtest_config, window_days,
+                         budget_s, max_workers, threads_per_worker, trials_dir)
+    tuned = summarize_trials(results, tolerance)
+    metadata = {
+        'tuned_at': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        'cities': cities,
+        'backtest': backtest_config,
+        'window_days': window_days,
+        'tolerance': tolerance
+    }
+    if output is not None and tuned:
+        write_tuned_configs(tuned, metadata, output)
+    return {'wall_time': round(perf_counter() - started, 3), 'trials': len(results), 'products': tuned}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Search Prophet seasonality and changepoint settings per product")
+    parser.add_argument('--products', nargs='+', choices=list(PRODUCTS),
+                        help="products to tune (default: all Prophet ones)")
+    parser.add_argument('--cities', nargs='+', help="cities to backtest on (default: every city with a dataset)")
+    parser.add_argument('--trials', type=int, default=20, help="configs tried per product, the current one included")
+    parser.add_argument('--budget', type=float, default=3600, help="wall-clock budget in seconds")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: cpu count)")
+    parser.add_argument('--threads-per-worker', type=int, default=1)
+    parser.add_argument('--origins', type=int, default=TUNING_BACKTEST_CONFIG['origins'])
+    parser.add_argument('--window-days', type=int, default=TRAINING_WINDOW_DAYS)
+    parser.add_argument('--tolerance', type=float, default=0.02,
+                        help="relative MAE given up for a cheaper config from the Pareto front")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=TUNED_MODEL_CONFIGS_FILENAME)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    summary = run_search(args.products, args.cities, args.trials, args.budget, args.workers,
+                         args.threads_per_worker, dict(TUNING_BACKTEST_CONFIG, origins=args.origins),
+                         args.window_days, args.tolerance, args.seed, args.output)
+    print(dumps({product: {k: v for k, v in tuned.items() if k != 'pareto_front'}
+                 for product, tuned in summary['products'].items()}, indent=2))
+    logging.info(f"{summary['trials']} trials in {summary['wall_time']} s, configs written to '{args.output}'")
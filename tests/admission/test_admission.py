@@ -0,0 +1,165 @@
+import pytest
+
+import asyncio
+import threading
+
+from json import dumps
+from unittest.mock import patch
+
+from src.api.app import app
+from src.scripts.admission import admission
+from src.scripts.admission.admission import (parse_budget, admit, admit_async, release, retry_after,
+                                             get_admission_stats, reset_admission, remember_forecast,
+                                             stale_forecast)
+
+
+FORECAST = {"result": [dumps({"timestamp": f"2024-03-28 {hour:02d}:00:00", "temp": 1.0}) for hour in range(24)],
+            "status": "success"}
+
+
+@pytest.fixture
+def budgets():
+    with patch.dict(admission.ADMISSION_BUDGETS, {'forecast': '1,1,0.05', 'cities': '1,0,0.05'}), \
+         patch.dict(admission._stale_forecasts, clear=True):
+        reset_admission()
+        yield
+    reset_admission()
+
+
+def test_parse_budget():
+    assert parse_budget('2,8,10') == {'concurrency': 2, 'queue': 8, 'deadline_s': 10.}
+
+
+def test_sheds_when_the_queue_is_full(budgets):
+    ticket = admit('cities')
+
+    assert ticket is not None
+    assert admit('cities') is None
+    stats = get_admission_stats()['cities']
+    assert (stats['active'], stats['admitted'], stats['shed_queue_full']) == (1, 1, 1)
+
+    release(ticket)
+    assert get_admission_stats()['cities']['active'] == 0
+    assert admit('cities') is not None
+
+
+def test_sheds_past_the_deadline(budgets):
+    ticket = admit('forecast')
+
+    assert admit('forecast') is None
+    stats = get_admission_stats()['forecast']
+    assert stats['shed_deadline'] == 1
+    assert stats['waiting'] == 0
+    assert stats['wait_s_max'] >= 0.05
+    release(ticket)
+
+
+def test_waiting_request_is_admitted_on_release(budgets):
+    with patch.dict(admission.ADMISSION_BUDGETS, {'forecast': '1,1,5'}):
+        reset_admission('forecast')
+        ticket = admit('forecast')
+        threading.Timer(0.05, release, [ticket]).start()
+        waiter = admit('forecast')
+
+    assert waiter is not None
+    assert get_admission_stats()['forecast']['admitted'] == 2
+    release(waiter)
+
+
+def test_retry_after_follows_the_service_time(budgets):
+    assert retry_after('forecast') == 1
+    with patch.object(admission, 'SERVICE_TIME_WEIGHT', 1.):
+        ticket = admit('forecast')
+        ticket = (ticket[0], ticket[1], ticket[2] - 2.5)
+        release(ticket)
+    assert retry_after('forecast') == 3
+
+
+def test_admit_async(budgets):
+    async def run():
+        ticket = await admit_async('forecast')
+        shed = await admit_async('forecast')
+        release(ticket)
+        return ticket, shed, await admit_async('forecast')
+
+    ticket, shed, admitted = asyncio.run(run())
+
+    assert ticket is not None and admitted is not None
+    assert shed is None
+    assert get_admission_stats()['forecast']['shed_deadline'] == 1
+
+
+def test_stale_forecast(budgets):
+    assert stale_forecast("miami", 24) is None
+
+    remember_forecast("miami", None, FORECAST)
+    remember_forecast("miami", None, dict(FORECAST, result=FORECAST["result"][:12]))
+    remember_forecast("miami", None, {"result": [], "status": "error"})
+    stale, age = stale_forecast("miami", 12)
+
+    assert stale["result"] == FORECAST["result"][:12]
+    assert age == 0
+    assert stale_forecast("miami", 48) is None
+    assert stale_forecast("miami", 12, "harmonic") is None
+    assert get_admission_stats()['forecast']['degraded'] == 1
+
+
+def test_stale_forecast_drops_the_past_hours(budgets):
+    computed_at = 1711584000. + 3000
+    with patch('src.scripts.admission.admission.time', return_value=computed_at):
+        remember_forecast("miami", None, FORECAST)
+
+    # Past the hour the first row is gone, 23 rows are left.
+    with patch('src.scripts.admission.admission.time', return_value=computed_at + 700):
+        stale, age = stale_forecast("miami", 12)
+        assert stale["result"] == FORECAST["result"][1:13]
+        assert age == 700
+        assert stale_forecast("miami", 23)[0]["result"] == FORECAST["result"][1:]
+        assert stale_forecast("miami", 24) is None
+
+    with patch('src.scripts.admission.admission.time', return_value=computed_at + admission.STALE_MAX_AGE_S + 1):
+        assert stale_forecast("miami", 1) is None
+
+
+def test_stale_forecast_of_a_previous_model_version(budgets):
+    with patch('src.scripts.admission.admission.get_model_version', return_value='20240101T000000'):
+        remember_forecast("miami", None, FORECAST)
+        assert stale_forecast("miami", 12) is not None
+    with patch('src.scripts.admission.admission.get_model_version', return_value='20240102T000000'):
+        assert stale_forecast("miami", 12) is None
+
+
+@patch('src.scripts.model_prediction.model_prediction.get_city_location', return_value=(25.8, -80.2, 0.))
+@patch('src.api.app.coalesced_forecast', return_value=FORECAST)
+def test_overloaded_forecasts_are_shed_or_degraded(coalesced_forecast, get_city_location, budgets):
+    client = app.test_client()
+    ticket = admit('forecast')
+
+    response = client.get('/predict/miami/24')
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    coalesced_forecast.assert_not_called()
+
+    remember_forecast("miami", None, FORECAST)
+    response = client.get('/predict/miami/24?resolution=daily')
+    assert response.status_code == 200
+    assert response.headers['X-Forecast-Degraded'] == 'stale'
+    assert 'ETag' not in response.headers
+    assert len(response.json['data']) == 1
+
+    release(ticket)
+    assert client.get('/predict/miami/24').headers.get('X-Forecast-Degraded') is None
+
+
+@patch('src.api.app.get_city', return_value=dumps({"result": [], "status": "success"}))
+def test_overloaded_city_lookups_are_shed(get_city, budgets):
+    ticket = admit('cities')
+
+    response = app.test_client().get('/cities/miami')
+    assert response.status_code == 503
+    assert response.json['meta'] == 'error'
+    release(ticket)
+
+    assert app.test_client().get('/cities/miami').status_code == 200
+    stats = app.test_client().get('/statsz').json
+    assert stats['admission']['cities']['admitted'] == 2
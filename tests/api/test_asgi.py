@@ -0,0 +1,95 @@
+import pytest
+import asyncio
+import threading
+import time
+
+from unittest.mock import patch
+from json import dumps
+
+from starlette.testclient import TestClient
+
+from src.api.app import app as wsgi_app
+from src.api.asgi import app, create_forecast_pool, warm_up_pool
+from src.scripts.model_warmup.model_warmup import WARMUP_STATE
+
+
+CITY_RESULT = dumps({"result": [{"name": "Nashville", "country": "USA", "zip_code": "37201", "lon": "-86.7816",
+                                 "lat": "36.1627", "utc_time_difference": "-6"}], "status": "success"})
+
+
+@pytest.fixture
+def client():
+    with patch('src.api.asgi.FORECAST_EXECUTOR', 'thread'), patch('src.api.asgi.FORECAST_WORKERS', 2), \
+         patch('src.scripts.model_warmup.model_warmup.WARMUP_CITIES', []):
+        with TestClient(app) as client:
+            yield client
+    WARMUP_STATE.update(ready=False, cities=[], failed=[], duration=None)
+
+
+@patch('src.api.app.get_city', return_value=CITY_RESULT)
+@patch('src.api.asgi.get_city')
+def test_city_envelope_matches_wsgi(get_city, wsgi_get_city, client):
+    get_city.return_value = CITY_RESULT
+
+    response = client.get('/cities/nashville?page=1&limit=1')
+    wsgi_response = wsgi_app.test_client().get('/cities/nashville?page=1&limit=1')
+
+    assert response.status_code == wsgi_response.status_code == 200
+    assert response.content == wsgi_response.data
+    get_city.assert_awaited_once_with('nashville', 1, 1)
+
+
+@patch('src.scripts.model_prediction.model_prediction.predict_hourly_city_weather')
+def test_forecast_does_not_block_city_lookups(predict, client):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_forecast(city_name, prediction_hours, engines):
+        started.set()
+        release.wait(10)
+        return {"result": [dumps({"temp": 1.0})], "status": "success"}
+    predict.side_effect = slow_forecast
+
+    responses = {}
+    request = threading.Thread(target=lambda: responses.update(forecast=client.get('/predict/nashville/24')))
+    request.start()
+    assert started.wait(10)
+
+    with patch('src.api.asgi.get_number_of_cities', return_value=dumps({"result": 3, "status": "success"})):
+        city_response = client.get('/cities/total/n')
+    assert city_response.json()['data'] == 3
+    assert request.is_alive()
+
+    release.set()
+    request.join(10)
+    assert responses['forecast'].json() == {'data': [dumps({"temp": 1.0})], 'message': '', 'meta': 'success'}
+    predict.assert_called_once_with(city_name='nashville', prediction_hours=24, engines=None)
+
+
+def test_readiness(client):
+    assert client.get('/healthz').status_code == 200
+    for _ in range(100):
+        if WARMUP_STATE['ready']:
+            break
+        time.sleep(0.01)
+    assert client.get('/readyz').status_code == 200
+
+
+def test_create_forecast_pool_error():
+    with pytest.raises(ValueError):
+        create_forecast_pool('fiber', 1)
+
+
+def test_every_pool_process_warms_up():
+    # Forked processes inherit the patched warmup cities.
+    with patch('src.scripts.model_warmup.model_warmup.WARMUP_CITIES', []):
+        pool = create_forecast_pool('process', 2)
+        try:
+            asyncio.run(warm_up_pool(pool, 'process', 2))
+        finally:
+            pool.shutdown()
+    try:
+        assert WARMUP_STATE['ready']
+        assert WARMUP_STATE['processes'] == 2
+    finally:
+        WARMUP_STATE.update(ready=False, cities=[], failed=[], duration=None)
+        WARMUP_STATE.pop('processes', None)
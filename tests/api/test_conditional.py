@@ -0,0 +1,200 @@
+import pytest
+
+import os
+
+from datetime import datetime, timezone
+from json import dumps
+from unittest.mock import patch
+
+from starlette.testclient import TestClient
+
+from src.api.app import app as wsgi_app
+from src.api.asgi import app as asgi_app
+from src.api.conditional import (forecast_validators, is_not_modified, parse_since, parse_engine, filter_since,
+                                 get_models_version, FORECAST_ENGINES)
+from src.scripts.model_registry.model_registry import create_version, publish_version
+from src.scripts.model_warmup.model_warmup import WARMUP_STATE
+
+
+NOW = datetime(2024, 3, 28, 10, 45, tzinfo=timezone.utc)
+
+FORECAST = {"result": [dumps({"timestamp": f"2024-03-28 {hour:02d}:00:00", "temp": 1.0}) for hour in range(10, 14)],
+            "status": "success"}
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    create_version(str(tmp_path / "miami"), "v1")
+    publish_version(str(tmp_path / "miami"), "v1", {})
+    with patch('src.scripts.model_prediction.model_prediction.MODELS_DIR', str(tmp_path)):
+        yield tmp_path
+
+
+@pytest.fixture
+def asgi_client():
+    with patch('src.api.asgi.FORECAST_EXECUTOR', 'thread'), patch('src.api.asgi.FORECAST_WORKERS', 1), \
+         patch('src.scripts.model_warmup.model_warmup.WARMUP_CITIES', []):
+        with TestClient(asgi_app) as client:
+            yield client
+    WARMUP_STATE.update(ready=False, cities=[], failed=[], duration=None)
+
+
+def test_models_version(models_dir):
+    version, published_at = get_models_version(str(models_dir / "miami"))
+    assert version == "v1"
+    assert published_at.tzinfo == timezone.utc
+
+    (models_dir / "legacy").mkdir()
+    (models_dir / "legacy" / "temp.json").write_text("{}")
+    version, modified_at = get_models_version(str(models_dir / "legacy"))
+    assert version.startswith("mtime-")
+
+    # Retrained in place, the directory's own mtime does not change.
+    os.utime(models_dir / "legacy" / "temp.json", (2_000_000_000, 2_000_000_000))
+    retrained_version, retrained_at = get_models_version(str(models_dir / "legacy"))
+    assert retrained_version == "mtime-2000000000000000000"
+    assert retrained_at == datetime.fromtimestamp(2_000_000_000, timezone.utc)
+    assert get_models_version(str(models_dir / "unknown")) == (None, None)
+
+
+def test_validators_change_with_hour_version_and_parameters(models_dir):
+    validators = forecast_validators("miami", "24", now=NOW)
+
+    assert validators["ETag"] == forecast_validators("miami", 24, now=NOW.replace(minute=59))["ETag"]
+    assert validators["Cache-Control"] == "public, max-age=300"
+    assert forecast_validators("miami", "24", now=NOW.replace(minute=58))["Cache-Control"] == "public, max-age=120"
+    assert validators["ETag"] != forecast_validators("miami", "24", now=NOW.replace(hour=11))["ETag"]
+    assert validators["ETag"] != forecast_validators("miami", "48", now=NOW)["ETag"]
+    assert validators["ETag"] == forecast_validators("miami", "24", {"engine": None}, now=NOW)["ETag"]
+    assert validators["ETag"] != forecast_validators("miami", "24", {"engine": "prophet"}, now=NOW)["ETag"]
+    assert validators["ETag"] != forecast_validators("miami", "24", {"since": "2024-03-28 11:00:00"}, now=NOW)["ETag"]
+
+    create_version(str(models_dir / "miami"), "v2")
+    publish_version(str(models_dir / "miami"), "v2", {})
+    assert validators["ETag"] != forecast_validators("miami", "24", now=NOW)["ETag"]
+
+
+def test_no_validators_without_models(models_dir):
+    assert forecast_validators("unknown", "24") is None
+
+
+def test_is_not_modified():
+    validators = {"ETag": '"abc"', "Last-Modified": "Thu, 28 Mar 2024 10:00:00 GMT"}
+
+    assert is_not_modified(validators, '"abc"')
+    assert is_not_modified(validators, 'W/"abc", "def"')
+    assert is_not_modified(validators, '*')
+    assert not is_not_modified(validators, '"def"')
+    assert not is_not_modified(validators, '"def"', "Thu, 28 Mar 2024 11:00:00 GMT")
+    assert is_not_modified(validators, None, "Thu, 28 Mar 2024 10:00:00 GMT")
+    assert not is_not_modified(validators, None, "Thu, 28 Mar 2024 09:59:59 GMT")
+    assert not is_not_modified(validators, None, "yesterday")
+    assert not is_not_modified(validators)
+
+
+def test_parse_since():
+    assert parse_since(None) is None
+    assert parse_since("1711620000") == "2024-03-28 10:00:00"
+    assert parse_since("2024-03-28T10:00:00") == "2024-03-28 10:00:00"
+    assert parse_since("2024-03-28 10:00:00") == "2024-03-28 10:00:00"
+    with pytest.raises(ValueError):
+        parse_since("yesterday")
+
+
+def test_parse_engine():
+    from src.scripts.model_prediction.model_prediction import ENGINE_LOADERS
+
+    assert set(FORECAST_ENGINES) == set(ENGINE_LOADERS) | {'prophet'}
+    assert parse_engine(None) is None
+    assert parse_engine('') is None
+    assert parse_engine('harmonic') == 'harmonic'
+    with pytest.raises(ValueError):
+        parse_engine('bogus')
+
+
+def test_filter_since():
+    rows = filter_since(FORECAST, "2024-03-28 11:00:00")["result"]
+    assert rows == FORECAST["result"][2:]
+    assert filter_since(FORECAST, None) is FORECAST
+    assert filter_since({"result": [], "status": "error"}, "2024-03-28 11:00:00")["status"] == "error"
+
+
+@patch('src.api.app.coalesced_forecast', return_value=FORECAST)
+def test_wsgi_revalidation_skips_the_forecast(forecast, models_dir):
+    client = wsgi_app.test_client()
+
+    response = client.get('/predict/miami/4')
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"].startswith("public, max-age=")
+    assert "Last-Modified" in response.headers
+
+    revalidated = client.get('/predict/miami/4', headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b""
+    assert revalidated.headers["ETag"] == etag
+    forecast.assert_called_once()
+
+    modified_since = client.get('/predict/miami/4', headers={"If-Modified-Since": response.headers["Last-Modified"]})
+    assert modified_since.status_code == 304
+    forecast.assert_called_once()
+
+
+@patch('src.api.app.coalesced_forecast', return_value=FORECAST)
+def test_wsgi_since(forecast, models_dir):
+    client = wsgi_app.test_client()
+
+    response = client.get('/predict/miami/4?since=2024-03-28 12:00:00')
+    assert response.json["data"] == FORECAST["result"][3:]
+
+    response = client.get('/predict/miami/4?since=yesterday')
+    assert response.status_code == 400
+    assert response.json["meta"] == "error"
+    forecast.assert_called_once()
+
+
+@patch('src.api.app.stale_forecast')
+@patch('src.api.app.coalesced_forecast', return_value=FORECAST)
+def test_wsgi_invalid_engine(forecast, stale_forecast, models_dir):
+    response = wsgi_app.test_client().get('/predict/miami/4?engine=bogus')
+
+    assert response.status_code == 400
+    assert response.json["meta"] == "error"
+    assert "bogus" in response.json["message"]
+    forecast.assert_not_called()
+    stale_forecast.assert_not_called()
+
+
+@patch('src.api.asgi.coalesced_forecast_async', return_value=FORECAST)
+def test_asgi_invalid_engine(forecast, models_dir, asgi_client):
+    response = asgi_client.get('/predict/miami/4?engine=bogus')
+
+    assert response.status_code == 400
+    assert response.json()["meta"] == "error"
+    forecast.assert_not_called()
+
+
+@patch('src.api.app.coalesced_forecast', return_value={"result": [], "status": "error", "message": "No models"})
+def test_wsgi_errors_are_not_cacheable(forecast, models_dir):
+    response = wsgi_app.test_client().get('/predict/miami/4')
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+
+@patch('src.api.asgi.coalesced_forecast_async', return_value=FORECAST)
+def test_asgi_revalidation_matches_wsgi(forecast, models_dir, asgi_client):
+    with patch('src.api.app.coalesced_forecast', return_value=FORECAST):
+        wsgi_response = wsgi_app.test_client().get('/predict/miami/4?since=2024-03-28 11:00:00')
+    response = asgi_client.get('/predict/miami/4?since=2024-03-28 11:00:00')
+
+    assert response.status_code == 200
+    assert response.content == wsgi_response.data
+    assert response.headers["ETag"] == wsgi_response.headers["ETag"]
+
+    revalidated = asgi_client.get('/predict/miami/4?since=2024-03-28 11:00:00',
+                                  headers={"If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    forecast.assert_awaited_once()
+
+    assert asgi_client.get('/predict/miami/4?since=yesterday').status_code == 400
@@ -0,0 +1,87 @@
+import pytest
+
+from json import dumps, loads
+from unittest.mock import patch
+
+from starlette.testclient import TestClient
+
+from src.api.app import app as wsgi_app
+from src.api.asgi import app as asgi_app
+from src.api.streaming import wants_stream, ndjson_lines, STREAM_MEDIA_TYPE
+from src.scripts.admission.admission import get_admission_stats, reset_admission
+from src.scripts.model_warmup.model_warmup import WARMUP_STATE
+
+
+BLOCKS = ["".join(dumps({"timestamp": f"2024-03-28 {hour:02d}:00:00", "temp": 1.0}) + "\n" for hour in hours)
+          for hours in [range(0, 2), range(2, 4)]]
+
+
+def stream_result(*args):
+    return {"result": iter(BLOCKS), "status": "success"}
+
+
+@pytest.fixture(autouse=True)
+def admission_state():
+    reset_admission()
+    yield
+    reset_admission()
+
+
+@pytest.fixture
+def asgi_client():
+    with patch('src.api.asgi.FORECAST_EXECUTOR', 'thread'), patch('src.api.asgi.FORECAST_WORKERS', 1), \
+         patch('src.scripts.model_warmup.model_warmup.WARMUP_CITIES', []):
+        with TestClient(asgi_app) as client:
+            yield client
+    WARMUP_STATE.update(ready=False, cities=[], failed=[], duration=None)
+
+
+def test_wants_stream():
+    assert wants_stream("ndjson")
+    assert wants_stream(None, "application/x-ndjson, application/json;q=0.5")
+    assert not wants_stream(None, "application/json")
+    assert not wants_stream()
+
+
+def test_ndjson_lines_ends_failed_streams_with_an_error_row():
+    def failing():
+        yield BLOCKS[0]
+        raise ValueError("model missing")
+
+    lines = list(ndjson_lines(failing()))
+    assert lines[0] == BLOCKS[0]
+    assert loads(lines[1]) == {"status": "error", "message": "model missing"}
+
+
+@patch('src.api.app.coalesced_forecast')
+@patch('src.api.app.stream_forecast', side_effect=stream_result)
+def test_wsgi_stream(stream_forecast, coalesced_forecast):
+    with wsgi_app.test_client().get('/predict/miami/4?format=ndjson&engine=harmonic') as response:
+        assert response.status_code == 200
+        assert response.mimetype == STREAM_MEDIA_TYPE
+        assert response.data.decode() == "".join(BLOCKS)
+    # The stream released its admission slot once closed.
+    assert get_admission_stats()["forecast"]["active"] == 0
+    stream_forecast.assert_called_once_with("miami", "4", "harmonic", None)
+    coalesced_forecast.assert_not_called()
+
+
+@patch('src.api.app.stream_forecast', return_value={"result": [], "status": "error", "message": "No data found"})
+def test_wsgi_stream_unknown_city(stream_forecast):
+    response = wsgi_app.test_client().get('/predict/atlantis/4', headers={"Accept": STREAM_MEDIA_TYPE})
+
+    assert response.status_code == 404
+    assert response.json["meta"] == "error"
+
+
+@patch('src.api.app.stream_forecast', side_effect=stream_result)
+@patch('src.api.asgi.stream_forecast', side_effect=stream_result)
+def test_asgi_stream_matches_wsgi(stream_forecast, wsgi_stream_forecast, asgi_client):
+    with wsgi_app.test_client().get('/predict/miami/4?format=ndjson') as wsgi_response:
+        wsgi_body = wsgi_response.data
+    response = asgi_client.get('/predict/miami/4?format=ndjson')
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(STREAM_MEDIA_TYPE)
+    assert response.content == wsgi_body
+    assert get_admission_stats()["forecast"]["active"] == 0
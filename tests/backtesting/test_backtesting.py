@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+import pytest
+from unittest.mock import patch
+from json import loads
+
+from src.scripts.model_training.model_training import prepare_training_frame
+
+from src.scripts.backtesting.backtesting import (rolling_origins, bucket_labels, regression_metrics,
+    classification_metrics, run_backtest_job, build_backtest_jobs, run_backtest, BACKTEST_CONFIG)
+
+
+CONFIG = dict(BACKTEST_CONFIG, origins=2, step_hours=24, horizon_hours=48, horizon_buckets=[24, 48])
+
+
+@pytest.fixture
+def city_df():
+    timestamps = np.arange(1_700_000_000, 1_700_000_000 + 3600 * 24 * 30, 3600)
+    hours = np.arange(len(timestamps))
+    df = pd.DataFrame({"timestamp": timestamps})
+    for column in ['humidity', 'pressure', 'temp', 'wind_speed', 'feels_like', 'clouds_percentage',
+                   'sun_horison_angle', 'precipitation', 'wind_direction']:
+        df[column] = 10 + np.sin(2 * np.pi * hours / 24)
+    df["weather_description"] = np.where(df["temp"] > 10, "Clear", "Clouds")
+    return prepare_training_frame(df)
+
+
+def test_rolling_origins_leave_a_full_horizon():
+    timestamps = np.arange(0, 3600 * 100, 3600)
+
+    origins = rolling_origins(timestamps, 3, 24, 48)
+
+    assert origins == [3600 * 4, 3600 * 28, 3600 * 52]
+    assert timestamps.max() - origins[-1] == 3600 * 47
+
+
+def test_regression_metrics_per_bucket():
+    lead_hours = np.arange(1, 49)
+    y = np.zeros(48)
+    yhat = np.concatenate([np.ones(24), np.full(24, -2.)])
+
+    metrics = regression_metrics(y, yhat, lead_hours, [24, 48])
+
+    assert bucket_labels([24, 48]) == ["1-24h", "25-48h"]
+    assert metrics["1-24h"] == {"mae": 1., "rmse": 1., "n": 24}
+    assert metrics["25-48h"] == {"mae": 2., "rmse": 2., "n": 24}
+
+
+def test_classification_metrics():
+    metrics = classification_metrics(["Rain", "Rain", "Clear", "Clear"], ["Rain", "Clear", "Clear", "Clear"])
+
+    assert metrics["accuracy"] == 0.75
+    assert metrics["f1_macro"] == pytest.approx((2 / 3 + 0.8) / 2)
+
+
+def test_run_backtest_job_scores_the_horizon(city_df):
+    origin = rolling_origins(city_df["timestamp"], 1, 24, 48)[0]
+
+    record = run_backtest_job("chicago", "temp", "harmonic", origin, CONFIG, df=city_df)
+    classifier = run_backtest_job("chicago", "weather_description", "prophet", origin, CONFIG, df=city_df)
+
+    assert record["status"] == "ok"
+    assert record["metrics"]["1-24h"]["n"] == 24 and record["metrics"]["25-48h"]["n"] == 24
+    assert record["metrics"]["25-48h"]["mae"] < 1e-2
+    assert classifier["metrics"]["accuracy"] > 0.9
+
+
+def test_run_backtest_job_reports_failures(city_df):
+    record = run_backtest_job("chicago", "weather_description", "harmonic", 1_700_000_000, CONFIG, df=city_df)
+
+    assert record["status"] == "failed"
+
+
+@patch("src.scripts.backtesting.backtesting.get_training_frame")
+def test_run_backtest_writes_results(get_training_frame, city_df, tmp_path):
+    get_training_frame.return_value = city_df
+    output = str(tmp_path / "backtest.json")
+
+    jobs = build_backtest_jobs(["chicago"], ["temp", "weather_description"], ["harmonic"], CONFIG)
+    result = run_backtest(["chicago"], ["temp", "humidity"], ["harmonic"], CONFIG, max_workers=1, output=output)
+
+    assert [job[1] for job in jobs] == ["temp", "temp"]
+    assert loads(open(output).read()) == result
+    assert [(s["product"], s["origins"]) for s in result["summary"]] == [("humidity", 2), ("temp", 2)]
+    assert set(result["summary"][0]["horizons"]) == {"1-24h", "25-48h"}
+    assert result["failed"] == []
@@ -0,0 +1,94 @@
+import pytest
+
+import pandas as pd
+
+from json import dumps, loads
+from unittest.mock import patch
+
+from src.api.app import app
+from src.scripts.forecast_resolution.forecast_resolution import (parse_resolution, aggregate_frame,
+                                                                  aggregate_forecast, resample_city_forecast)
+
+
+def hourly_frame(hours=48, start="2024-03-28 00:00:00"):
+    timestamps = pd.date_range(start, periods=hours, freq="h")
+    return pd.DataFrame({
+        'timestamp': timestamps.strftime('%Y-%m-%d %H:%M:%S'),
+        'temp': [float(i % 24) for i in range(hours)],
+        'precipitation': [0.5] * hours,
+        'wind_direction': [350. if i % 2 else 10. for i in range(hours)],
+        'clouds_percentage': [20.] * hours,
+        'weather_description': ["Rain" if i % 24 < 8 else "Sun" for i in range(hours)]
+    })
+
+
+def test_parse_resolution():
+    assert parse_resolution(None) is None
+    assert parse_resolution("hourly") is None
+    assert parse_resolution("daily") == "daily"
+    with pytest.raises(ValueError):
+        parse_resolution("weekly")
+
+
+def test_aggregate_frame_daily():
+    summary = aggregate_frame(hourly_frame(), 24).set_index('timestamp')
+
+    assert list(summary.index) == ["2024-03-28 00:00:00", "2024-03-29 00:00:00"]
+    day = summary.loc["2024-03-28 00:00:00"]
+    assert day['hours'] == 24
+    assert (day['temp_min'], day['temp_max'], day['temp_mean']) == (0., 23., 11.5)
+    assert day['precipitation_sum'] == 12.
+    assert day['clouds_percentage_mean'] == 20.
+    # 350 and 10 average to north, not to 180.
+    direction = day['wind_direction_circular_mean']
+    assert min(direction, 360 - direction) == pytest.approx(0., abs=1e-6)
+    assert day['weather_description_mode'] == "Sun"
+
+
+def test_aggregate_frame_in_local_time():
+    # UTC-6: the first local day ends at 18:00 UTC, partial days are kept.
+    summary = aggregate_frame(hourly_frame(), 24, -6)
+
+    assert list(summary['timestamp']) == ["2024-03-27 00:00:00", "2024-03-28 00:00:00", "2024-03-29 00:00:00"]
+    assert list(summary['hours']) == [6, 24, 18]
+    assert summary['weather_description_mode'][0] == "Rain"
+
+
+def test_aggregate_forecast():
+    frame = hourly_frame(hours=12)
+    data = {"result": [dumps(row) for row in frame.to_dict(orient='records')], "status": "success"}
+
+    result = aggregate_forecast(data, "6h")
+    rows = [loads(row) for row in result["result"]]
+
+    assert [row["timestamp"] for row in rows] == ["2024-03-28 00:00:00", "2024-03-28 06:00:00"]
+    assert rows[1]["temp_max"] == 11.
+    assert [row["weather_description_mode"] for row in rows] == ["Rain", "Sun"]
+    assert aggregate_forecast(data, None) is data
+    error = {"result": [], "status": "error", "message": "No data found"}
+    assert aggregate_forecast(error, "daily") is error
+
+
+@patch('src.scripts.model_prediction.model_prediction.get_city_location', return_value=(41.8, -87.6, -6.))
+def test_resample_city_forecast_uses_the_city_offset(get_city_location):
+    frame = hourly_frame()
+    data = {"result": [dumps(row) for row in frame.to_dict(orient='records')], "status": "success"}
+
+    rows = [loads(row) for row in resample_city_forecast(data, "chicago", "daily")["result"]]
+
+    assert [row["hours"] for row in rows] == [6, 24, 18]
+    get_city_location.assert_called_once_with("chicago")
+
+
+@patch('src.api.app.resample_city_forecast')
+@patch('src.api.app.coalesced_forecast', return_value={"result": [], "status": "success"})
+def test_predict_route_resolution(coalesced_forecast, resample_city_forecast):
+    resample_city_forecast.return_value = {"result": ['{"hours": 24}'], "status": "success"}
+    client = app.test_client()
+
+    response = client.get('/predict/chicago/168?resolution=daily&format=ndjson')
+    assert response.status_code == 200
+    assert response.json["data"] == ['{"hours": 24}']
+    resample_city_forecast.assert_called_once_with({"result": [], "status": "success"}, "chicago", "daily")
+
+    assert client.get('/predict/chicago/168?resolution=weekly').status_code == 400
@@ -0,0 +1,139 @@
+import pytest
+
+import asyncio
+
+from json import dumps
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+
+from src.api.app import app
+from src.scripts.metrics import metrics
+from src.scripts.metrics.metrics import (city_label, stage_timer, instrument_redis, instrument_async_redis,
+                                         start_request, finish_request, generate_metrics, OTHER_CITY)
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class FakeRedis:
+    def execute_command(self, *args, **options):
+        return args
+
+    def get(self, name):
+        return self.execute_command('GET', name)
+
+
+class FakeAsyncRedis:
+    async def execute_command(self, *args, **options):
+        return args
+
+
+def test_city_labels_are_bounded():
+    with patch.object(metrics, 'CITY_LABELS', 2), patch.object(metrics, '_city_labels', set()):
+        assert city_label("Miami") == "miami"
+        assert city_label("Chicago") == "chicago"
+        assert city_label("Boston") == OTHER_CITY
+        assert city_label("MIAMI") == "miami"
+
+
+@patch('src.scripts.model_prediction.model_prediction.check_city_name', return_value=False)
+def test_unknown_cities_take_no_label(check_city_name):
+    from src.scripts.model_prediction.model_prediction import predict_hourly_city_weather
+
+    count = sample('weather_forecast_stage_seconds_count', stage='check_city', city='', param='')
+    with patch.object(metrics, '_city_labels', set()) as city_labels:
+        assert predict_hourly_city_weather('atlantis', 24)['status'] == 'error'
+        assert city_labels == set()
+    assert sample('weather_forecast_stage_seconds_count', stage='check_city', city='', param='') == count + 1
+
+
+def test_stage_timer():
+    count = sample('weather_forecast_stage_seconds_count', stage='predict', city='metrics_city', param='temp')
+
+    with stage_timer('predict', 'metrics_city', 'temp'):
+        pass
+    with pytest.raises(ValueError):
+        with stage_timer('predict', 'metrics_city', 'temp'):
+            raise ValueError()
+
+    assert sample('weather_forecast_stage_seconds_count', stage='predict', city='metrics_city',
+                  param='temp') == count + 2
+
+
+def test_redis_round_trips_per_request():
+    count = sample('weather_redis_command_seconds_count', command='GET')
+    observations = sample('weather_redis_round_trips_per_request_sum', endpoint='metrics_test')
+    redis_cnt = instrument_redis(FakeRedis())
+
+    request = start_request()
+    assert redis_cnt.get('a') == ('GET', 'a')
+    redis_cnt.get('b')
+    finish_request(request, 'metrics_test', 200)
+    redis_cnt.get('outside a request')
+
+    assert sample('weather_redis_command_seconds_count', command='GET') == count + 3
+    assert sample('weather_redis_round_trips_per_request_sum', endpoint='metrics_test') == observations + 2
+    assert sample('weather_request_seconds_count', endpoint='metrics_test', status='200') >= 1
+
+
+def test_async_redis_round_trips():
+    count = sample('weather_redis_command_seconds_count', command='HMGET')
+    redis_cnt = instrument_async_redis(FakeAsyncRedis())
+
+    assert asyncio.run(redis_cnt.execute_command(b'HMGET', 'city')) == (b'HMGET', 'city')
+    assert sample('weather_redis_command_seconds_count', command='HMGET') == count + 1
+
+
+def test_model_cache_lookups(tmp_path):
+    from src.scripts.model_prediction.model_prediction import load_cached
+
+    misses, hits = sample('weather_model_cache_lookups_total', result='miss'), \
+        sample('weather_model_cache_lookups_total', result='hit')
+    filepath = str(tmp_path / "model.json")
+    load_cached(filepath, lambda filepath: object(), cacheable=True)
+    load_cached(filepath, lambda filepath: object(), cacheable=True)
+
+    assert sample('weather_model_cache_lookups_total', result='miss') == misses + 1
+    assert sample('weather_model_cache_lookups_total', result='hit') == hits + 1
+    assert sample('weather_model_cache_entries') >= 1
+
+
+@patch('src.api.app.get_city', return_value=dumps({"result": [], "status": "success"}))
+def test_metrics_endpoint(get_city):
+    client = app.test_client()
+    client.get('/cities/miami')
+
+    response = client.get('/metrics')
+    body = response.data.decode()
+
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+    assert 'weather_request_seconds_count{endpoint="get_city_info",status="200"}' in body
+    assert 'weather_redis_round_trips_per_request_bucket' in body
+    assert 'weather_admission_admitted_total{endpoint="cities"}' in body
+    assert 'weather_single_flight_forecasts_total' in body
+    assert 'process_resident_memory_bytes' in body
+
+
+def test_generate_metrics_multiprocess(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+
+    body, content_type = generate_metrics()
+
+    assert b'process_resident_memory_bytes' in body
+    assert b'weather_admission_active' in body
+
+
+def test_asgi_metrics_endpoint():
+    from starlette.testclient import TestClient
+    from src.api.asgi import app as asgi_app
+
+    with patch('src.api.asgi.get_city', return_value=dumps({"result": [], "status": "success"})):
+        client = TestClient(asgi_app)
+        client.get('/cities/miami')
+        response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert 'weather_request_seconds_count{endpoint="get_city_info",status="200"}' in response.text
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+import pytest
+
+from prophet import Prophet
+from sklearn.tree import DecisionTreeClassifier
+
+from src.scripts.model_pack.model_pack import (build_model_pack, load_model_pack, convert_city_models,
+    prophet_pack_entry, write_model_pack, PackedProphetModel, MODEL_PACK_FILENAME)
+from src.scripts.model_training.utils.utils import save_prophet_model, save_sklearn_model
+from src.scripts.tree_model.tree_model import export_tree_model, TreeModel
+
+
+def hourly_df(rows=24 * 40):
+    ds = pd.date_range("2024-01-01", periods=rows, freq="h")
+    hours = np.arange(rows)
+    y = 20 + 0.01 * hours + 5 * np.sin(2 * np.pi * hours / 24) + np.random.default_rng(0).normal(0, 0.5, rows)
+    return pd.DataFrame({"ds": ds, "y": y})
+
+
+@pytest.fixture(scope="module")
+def fitted_models():
+    additive = Prophet(yearly_seasonality=False, weekly_seasonality=False)
+    additive.add_seasonality(name="monthly", period=30.5, fourier_order=5)
+    multiplicative = Prophet(yearly_seasonality=False, weekly_seasonality=False,
+                             seasonality_mode="multiplicative", scaling="minmax")
+    return [additive.fit(hourly_df()), multiplicative.fit(hourly_df())]
+
+
+@pytest.fixture
+def fitted_tree():
+    rng = np.random.default_rng(0)
+    x = pd.DataFrame({"temp": rng.normal(15, 10, 500), "humidity": rng.uniform(0, 100, 500)})
+    y = np.where(x["humidity"] > 70, "Rain", "Clouds")
+    return DecisionTreeClassifier(random_state=0).fit(x, y), x
+
+
+def test_packed_forecast_matches_prophet(fitted_models, tmp_path):
+    for i, model in enumerate(fitted_models):
+        save_prophet_model(model, str(tmp_path / f"product{i}.json"), slim=True)
+    build_model_pack(str(tmp_path), {f"product{i}": f"product{i}.json" for i in range(len(fitted_models))})
+
+    packed = load_model_pack(str(tmp_path / MODEL_PACK_FILENAME))
+
+    for i, model in enumerate(fitted_models):
+        expected = model.predict(model.make_future_dataframe(periods=240, freq="h", include_history=False))
+        future = packed[f"product{i}"].make_future_dataframe(periods=240, freq="h")
+        forecast = packed[f"product{i}"].predict(future)
+
+        assert isinstance(packed[f"product{i}"], PackedProphetModel)
+        np.testing.assert_array_equal(forecast["ds"].to_numpy(), expected["ds"].to_numpy())
+        np.testing.assert_allclose(forecast["yhat"], expected["yhat"], rtol=1e-9, atol=1e-9)
+
+
+def test_pack_holds_trees(fitted_tree, tmp_path):
+    model, x = fitted_tree
+    export_tree_model(model, str(tmp_path / "weather_description.npz"))
+    save_sklearn_model(model, str(tmp_path / "weather_description.pkl"))
+
+    assert convert_city_models(str(tmp_path)) == ["weather_description"]
+    tree = load_model_pack(str(tmp_path / MODEL_PACK_FILENAME))["weather_description"]
+
+    assert isinstance(tree, TreeModel)
+    np.testing.assert_array_equal(tree.predict(x), model.predict(x))
+    assert all(getattr(tree, name).flags.aligned for name in ["feature", "threshold", "children", "leaf_class"])
+    assert not tree.threshold.flags.writeable
+
+
+def test_unsupported_model_is_left_out(tmp_path):
+    model = Prophet(growth="flat", yearly_seasonality=False, weekly_seasonality=False).fit(hourly_df(24 * 5))
+    save_prophet_model(model, str(tmp_path / "temp.json"))
+
+    assert prophet_pack_entry(model) is None
+    assert build_model_pack(str(tmp_path), {"temp": "temp.json"}) == []
+    assert load_model_pack(str(tmp_path / MODEL_PACK_FILENAME)) == {}
+
+
+def test_invalid_pack_is_rejected(tmp_path):
+    filename = str(tmp_path / MODEL_PACK_FILENAME)
+    write_model_pack(filename, {})
+    with open(filename, "r+b") as f:
+        f.write(b"NOTAPACK")
+
+    with pytest.raises(ValueError):
+        load_model_pack(filename)
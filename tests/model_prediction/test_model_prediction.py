@@ -9,6 +9,10 @@ from src.scripts.model_prediction.model_prediction import (
 )
 
 import pandas as pd 
+import numpy as np
+
+from src.scripts.model_training.global_model.global_model import publish_global_model
+from src.scripts.model_training.harmonic.harmonic import create_harmonic_model, HarmonicModel
 
 
 
@@ -133,4 +137,154 @@ def test_predict_hourly_city_weather(open_weather_models_patched, check_city_nam
                                          prediction_hours=prediction_hours,
                                          target_params=target_params)
     
-    assert result["status"] == "success"
\ No newline at end of file
+    assert result["status"] == "success"
+
+from src.scripts.model_prediction import model_prediction
+from src.scripts.model_registry.model_registry import create_version, publish_version
+
+@patch('src.scripts.model_prediction.model_prediction.match_time_difference')
+@patch('src.scripts.model_prediction.model_prediction.load_prophet_model')
+@patch('src.scripts.model_prediction.model_prediction.load_sklearn_model')
+def test_open_weather_models_from_registry(load_sklearn, load_prophet, match_time_difference,
+                                           tmp_path, monkeypatch):
+    monkeypatch.setattr(model_prediction, 'MODELS_DIR', str(tmp_path))
+    monkeypatch.setattr(model_prediction, '_model_cache', model_prediction.OrderedDict())
+    city_dir = str(tmp_path / "Miami")
+    create_version(city_dir, "v1")
+    publish_version(city_dir, "v1", {
+        "temp": {"file": "temp.json", "last_ds": "2024-03-28 00:00:00"},
+        "weather_description": {"file": "weather_description.pkl", "last_ds": "2024-03-28 00:00:00"}
+    })
+    match_time_difference.return_value = 3
+
+    for _ in range(2):
+        result = open_weather_models("Miami", 24, ['temp', 'weather_description'])
+
+    assert set(result['models'].keys()) == {'temp', 'weather_description'}
+    assert result['prediction_hours'] == 27
+    match_time_difference.assert_called_with(city_name="Miami", model_last_index="2024-03-28 00:00:00")
+    load_prophet.assert_called_once_with(str(tmp_path / "Miami" / "versions" / "v1" / "temp.json"))
+    load_sklearn.assert_called_once()
+    load_prophet.return_value.history.tail.assert_not_called()
+
+
+@patch('src.scripts.model_prediction.model_prediction.get_city_location')
+@patch('src.scripts.model_prediction.model_prediction.match_time_difference')
+@patch('src.scripts.model_prediction.model_prediction.load_prophet_model')
+def test_open_weather_models_selects_global_model(load_prophet, match_time_difference, get_city_location,
+                                                  tmp_path, monkeypatch):
+    monkeypatch.setattr(model_prediction, 'MODELS_DIR', str(tmp_path))
+    monkeypatch.setattr(model_prediction, '_model_cache', model_prediction.OrderedDict())
+    publish_global_model(str(tmp_path), {
+        'format_version': np.array([1], dtype=np.int32),
+        'coef': np.zeros((44, 1)),
+        'products': np.array(['temp']),
+        'cities': np.array(['miami']),
+        'bias': np.zeros((1, 1)),
+        'last_timestamp': np.array([1711584000]),
+        'day_order': np.array([3], dtype=np.int32),
+        'year_order': np.array([2], dtype=np.int32),
+        'bias_half_life_hours': np.array([24.])
+    }, version="v1")
+    create_version(str(tmp_path / "Miami"), "v1")
+    publish_version(str(tmp_path / "Miami"), "v1", {
+        "temp": {"file": "temp.json", "last_ds": "2024-03-28 00:00:00"},
+        "humidity": {"file": "humidity.json", "last_ds": "2024-03-28 00:00:00"}
+    })
+    get_city_location.return_value = (25.76, -80.19, -5.)
+    match_time_difference.return_value = 0
+
+    result = open_weather_models("Miami", 24, ['temp', 'humidity'], global_params={'temp'})
+
+    assert result['models']['temp'].last_ds == pd.Timestamp("2024-03-28 00:00:00")
+    assert result['models']['humidity'] is load_prophet.return_value
+    load_prophet.assert_called_once()
+
+
+@patch('src.scripts.model_prediction.model_prediction.match_time_difference')
+@patch('src.scripts.model_prediction.model_prediction.load_prophet_model')
+def test_open_weather_models_selects_engine_per_param(load_prophet, match_time_difference, tmp_path, monkeypatch):
+    monkeypatch.setattr(model_prediction, 'MODELS_DIR', str(tmp_path))
+    monkeypatch.setattr(model_prediction, '_model_cache', model_prediction.OrderedDict())
+    version_dir = create_version(str(tmp_path / "Miami"), "v1")
+    df = pd.DataFrame({'ds': pd.date_range("2024-03-01", "2024-03-28", freq="h")})
+    df['y'] = np.arange(len(df), dtype=float)
+    create_harmonic_model(df, f"{version_dir}/temp.harmonic.npz")
+    publish_version(str(tmp_path / "Miami"), "v1", {
+        "temp": {"file": "temp.json", "last_ds": "2024-03-28 00:00:00"},
+        "humidity": {"file": "humidity.json", "last_ds": "2024-03-28 00:00:00"}
+    }, {"engines": {"harmonic": {"temp": {"file": "temp.harmonic.npz", "last_ds": "2024-03-28 00:00:00"}}}})
+    match_time_difference.return_value = 0
+
+    prophet = open_weather_models("Miami", 24, ['temp', 'humidity'])
+    harmonic = open_weather_models("Miami", 24, ['temp', 'humidity'], engines='harmonic')
+
+    assert prophet['models']['temp'] is load_prophet.return_value
+    assert isinstance(harmonic['models']['temp'], HarmonicModel)
+    # Parameters without a model of the engine fall back to Prophet.
+    assert harmonic['models']['humidity'] is load_prophet.return_value
+    with pytest.raises(ValueError):
+        open_weather_models("Miami", 24, ['temp'], engines={'temp': 'arima'})
+
+
+from json import loads
+from src.scripts.model_prediction.model_prediction import stream_hourly_city_weather
+
+
+@pytest.fixture
+def harmonic_models(tmp_path):
+    df = pd.DataFrame({'ds': pd.date_range("2024-03-01", "2024-03-28", freq="h")})
+    models = {}
+    for param in ['humidity', 'temp']:
+        df['y'] = np.sin(np.arange(len(df)) / 24) * (10 if param == 'temp' else 50)
+        models[param] = create_harmonic_model(df, str(tmp_path / f"{param}.harmonic.npz"))
+    models['weather_description'] = Mock()
+    models['weather_description'].predict.side_effect = lambda X: np.where(X['temp'] > 0, "Sun", "Rain")
+    return models
+
+
+@patch('src.scripts.model_prediction.model_prediction.check_city_name', return_value=True)
+@patch('src.scripts.model_prediction.model_prediction.open_weather_models')
+def test_stream_hourly_city_weather_matches_batch(open_weather_models_patched, check_city_name, harmonic_models):
+    target_params = ['humidity', 'temp', 'weather_description']
+    open_weather_models_patched.return_value = {"models": harmonic_models, "prediction_hours": 60}
+
+    batch = predict_hourly_city_weather("Miami", 50, target_params=target_params)
+    stream = stream_hourly_city_weather("Miami", 50, target_params=target_params, block_hours=16)
+    blocks = list(stream["result"])
+
+    assert stream["status"] == "success"
+    assert [len(block.splitlines()) for block in blocks] == [16, 16, 16, 2]
+    # Equal up to rounding, the blocks go through smaller matrix products.
+    streamed = [loads(row) for row in "".join(blocks).splitlines()]
+    assert [row["timestamp"] for row in streamed] == [loads(row)["timestamp"] for row in batch["result"]]
+    assert streamed == [pytest.approx(loads(row)) for row in batch["result"]]
+
+    since = stream_hourly_city_weather("Miami", 50, target_params=target_params, since="2024-03-30 10:00:00")
+    rows = [loads(row)["timestamp"] for row in "".join(since["result"]).splitlines()]
+    assert rows == [row["timestamp"] for row in streamed if row["timestamp"] > "2024-03-30 10:00:00"]
+
+
+@patch('src.scripts.model_prediction.model_prediction.check_city_name', return_value=False)
+def test_stream_hourly_city_weather_unknown_city(check_city_name):
+    assert stream_hourly_city_weather("Atlantis", 24)["status"] == "error"
+
+
+def test_city_locations_expire():
+    from json import dumps
+    from src.scripts.model_prediction import model_prediction
+    from src.scripts.model_prediction.model_prediction import get_city_location
+
+    def city(offset):
+        return dumps({"result": [{"name": "Miami", "lat": "25.76", "lon": "-80.19", "utc_time_difference": offset}],
+                      "status": "success"})
+
+    with patch.dict(model_prediction._city_locations, clear=True), \
+         patch('src.scripts.model_prediction.model_prediction.get_city', side_effect=[city("-5"), city("-4")]), \
+         patch('src.scripts.model_prediction.model_prediction.time', return_value=1000.):
+        assert get_city_location("miami") == (25.76, -80.19, -5.)
+        assert get_city_location("miami") == (25.76, -80.19, -5.)
+        # The catalog was reseeded since, it is read again once expired.
+        with patch('src.scripts.model_prediction.model_prediction.time',
+                   return_value=1000. + model_prediction.CITY_LOCATION_TTL_S + 1):
+            assert get_city_location("miami") == (25.76, -80.19, -4.)
@@ -0,0 +1,72 @@
+import os
+
+from src.scripts.model_registry.model_registry import (create_version, publish_version,
+    read_current_manifest, get_current_version, describe_model_file, get_model_file,
+    CURRENT_POINTER, VERSIONS_DIR)
+
+
+def write_model(version_dir, product, content="{}"):
+    filename = os.path.join(version_dir, get_model_file(product))
+    with open(filename, "w") as f:
+        f.write(content)
+    entry = describe_model_file(filename)
+    entry["last_ds"] = "2024-03-28 00:00:00"
+    return entry
+
+
+def test_get_model_file():
+    assert get_model_file("temp") == "temp.json"
+    assert get_model_file("weather_description") == "weather_description.npz"
+
+
+def test_unpublished_city_has_no_manifest(tmp_path):
+    assert read_current_manifest(str(tmp_path / "miami")) is None
+    assert get_current_version(str(tmp_path / "miami")) is None
+
+
+def test_publish_and_read_manifest(tmp_path):
+    city_dir = str(tmp_path / "miami")
+    version_dir = create_version(city_dir, "v1")
+    entry = write_model(version_dir, "temp", '{"params": 1}')
+
+    publish_version(city_dir, "v1", {"temp": entry}, {"city": "miami"})
+    manifest = read_current_manifest(city_dir)
+
+    assert manifest["version"] == "v1"
+    assert manifest["version_dir"] == version_dir
+    assert manifest["city"] == "miami"
+    assert manifest["products"]["temp"]["bytes"] == len('{"params": 1}')
+    assert manifest["products"]["temp"]["last_ds"] == "2024-03-28 00:00:00"
+    assert read_current_manifest(city_dir) is manifest
+
+
+def test_publish_swaps_version_and_carries_over_models(tmp_path):
+    city_dir = str(tmp_path / "miami")
+    v1 = create_version(city_dir, "v1")
+    publish_version(city_dir, "v1", {"temp": write_model(v1, "temp"),
+                                     "humidity": write_model(v1, "humidity")})
+
+    v2 = create_version(city_dir, "v2")
+    publish_version(city_dir, "v2", {"temp": write_model(v2, "temp", '{"new": 1}')})
+    manifest = read_current_manifest(city_dir)
+
+    assert manifest["version"] == "v2"
+    assert set(manifest["products"]) == {"temp", "humidity"}
+    assert os.path.isfile(os.path.join(v2, "humidity.json"))
+    with open(os.path.join(city_dir, CURRENT_POINTER)) as f:
+        assert f.read() == "v2"
+
+
+def test_publish_prunes_old_versions(tmp_path):
+    city_dir = str(tmp_path / "miami")
+    for i in range(8):
+        version = f"v{i}"
+        version_dir = create_version(city_dir, version)
+        publish_version(city_dir, version, {"temp": write_model(version_dir, "temp")})
+    staging = create_version(city_dir, "v9")
+
+    publish_version(city_dir, "v7", {"temp": write_model(os.path.join(city_dir, VERSIONS_DIR, "v7"), "temp")})
+
+    remaining = sorted(os.listdir(os.path.join(city_dir, VERSIONS_DIR)))
+    assert remaining == ["v3", "v4", "v5", "v6", "v7", "v9"]
+    assert os.path.isdir(staging)
@@ -0,0 +1,69 @@
+import pytest
+
+import pandas as pd
+
+from src.scripts.model_training.fingerprint.fingerprint import (compute_fingerprint,
+    compute_prefix_hash, plan_retraining)
+
+
+@pytest.fixture
+def dataset():
+    return pd.DataFrame({"timestamp": range(1393632000, 1393632000 + 3600 * 48, 3600),
+                         "temp": [float(i % 24) for i in range(48)]})
+
+
+def fingerprint(df, hyperparameters=None, code_files=()):
+    return compute_fingerprint(df, "timestamp", hyperparameters or {"fourier_order": 5}, code_files)
+
+
+def test_compute_fingerprint_is_deterministic(dataset):
+    first, second = fingerprint(dataset), fingerprint(dataset.copy())
+
+    assert first == second
+    assert first["rows"] == 48
+    assert first["last_timestamp"] == str(1393632000 + 3600 * 47)
+
+
+def test_compute_fingerprint_detects_changes(dataset):
+    changed = dataset.copy()
+    changed.loc[3, "temp"] = 100.0
+
+    assert fingerprint(changed)["content_hash"] != fingerprint(dataset)["content_hash"]
+    assert (fingerprint(dataset, {"fourier_order": 25})["hyperparameters_hash"]
+            != fingerprint(dataset)["hyperparameters_hash"])
+
+
+def test_compute_prefix_hash(dataset):
+    previous = fingerprint(dataset.iloc[:40])
+
+    assert compute_prefix_hash(dataset, 40) == previous["content_hash"]
+    assert compute_prefix_hash(dataset, 60) is None
+
+
+@pytest.mark.parametrize(("policy", "new_rows", "expected"),
+                         [("auto", 0, "skip"),
+                          ("auto", 2, "warm"),
+                          ("auto", 8, "full"),
+                          ("warm", 8, "warm"),
+                          ("full", 2, "full")])
+def test_plan_retraining_appended_rows(dataset, policy, new_rows, expected):
+    previous = fingerprint(dataset.iloc[:40])
+    current_df = dataset.iloc[:40 + new_rows]
+    current = fingerprint(current_df)
+
+    assert plan_retraining(previous, current, compute_prefix_hash(current_df, 40), policy) == expected
+
+
+def test_plan_retraining_rewritten_history(dataset):
+    previous = fingerprint(dataset.iloc[:40])
+    rewritten = dataset.copy()
+    rewritten.loc[0, "temp"] = -5.0
+
+    assert plan_retraining(previous, fingerprint(rewritten),
+                           compute_prefix_hash(rewritten, 40), "warm") == "full"
+
+
+def test_plan_retraining_without_previous_or_invalid_policy(dataset):
+    assert plan_retraining(None, fingerprint(dataset)) == "full"
+    with pytest.raises(ValueError):
+        plan_retraining(None, fingerprint(dataset), policy="sometimes")
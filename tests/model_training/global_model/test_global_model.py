@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+import pytest
+from unittest.mock import patch
+
+from src.scripts.model_training.global_model.global_model import (train_global_model, publish_global_model,
+    load_global_model, global_features, GlobalModel, get_global_models_dir, GLOBAL_MODEL_CONFIG, GLOBAL_MODEL_FILE)
+from src.scripts.model_registry.model_registry import read_current_manifest
+
+CATALOG = {"chicago": (41.88, -87.63, -6.), "miami": (25.76, -80.19, -5.)}
+
+
+def city_dataset(city):
+    timestamps = np.arange(1_600_000_000, 1_600_000_000 + 3600 * 24 * 60, 3600)
+    X = global_features(timestamps, CATALOG[city], GLOBAL_MODEL_CONFIG)
+    coef = np.linspace(-1, 1, X.shape[1])
+    return pd.DataFrame({"timestamp": timestamps, "temp": X @ coef + 20, "humidity": X @ coef[::-1] + 50})
+
+
+@pytest.fixture
+def trained_arrays():
+    config = dict(GLOBAL_MODEL_CONFIG, alpha=1e-9)
+    with patch("src.scripts.model_training.model_training.load_training_dataset",
+               side_effect=lambda city, window_days: city_dataset(city)):
+        return train_global_model(["chicago", "miami", "atlantis"], ["temp", "humidity"], config=config,
+                                  catalog=CATALOG)
+
+
+def test_train_global_model(trained_arrays):
+    assert list(trained_arrays["cities"]) == ["chicago", "miami"]
+    assert trained_arrays["coef"].shape == (4 * (1 + 6 + 4), 2)
+    np.testing.assert_allclose(trained_arrays["bias"], 0, atol=1e-6)
+
+
+def test_global_city_model_forecast(trained_arrays, tmp_path):
+    publish_global_model(str(tmp_path), trained_arrays, version="v1")
+    manifest = read_current_manifest(get_global_models_dir(str(tmp_path)))
+    global_model = load_global_model(f"{manifest['version_dir']}/{GLOBAL_MODEL_FILE}")
+
+    model = global_model.city_model("temp", "Miami", CATALOG["miami"])
+    future = model.make_future_dataframe(periods=48, freq="h")
+    forecast = model.predict(future)
+
+    expected = city_dataset("miami")
+    last = pd.Timestamp(expected["timestamp"].max(), unit="s")
+    assert sorted(manifest["products"]) == ["humidity", "temp"]
+    assert manifest["products"]["temp"]["last_ds"] == last.strftime("%Y-%m-%d %H:%M:%S")
+    assert future["ds"].iloc[0] == last + pd.Timedelta(hours=1)
+    seconds = future["ds"].to_numpy(dtype=np.int64) // 10 ** 9
+    X = global_features(seconds, CATALOG["miami"], GLOBAL_MODEL_CONFIG)
+    np.testing.assert_allclose(forecast["yhat"], X @ np.linspace(-1, 1, X.shape[1]) + 20, atol=1e-4)
+
+
+def test_global_model_decays_recent_bias(trained_arrays):
+    biased = dict(trained_arrays, bias=trained_arrays["bias"].copy())
+    biased["bias"][1, 0] = 2.
+    model = GlobalModel(biased).city_model("temp", "miami", CATALOG["miami"])
+    unbiased = GlobalModel(trained_arrays).city_model("temp", "miami", CATALOG["miami"])
+    half_life = pd.Timedelta(hours=GLOBAL_MODEL_CONFIG["bias_half_life_hours"])
+    dates = pd.DataFrame({"ds": [model.last_ds, model.last_ds + half_life, model.last_ds + 10 * half_life]})
+
+    shift = model.predict(dates)["yhat"] - unbiased.predict(dates)["yhat"]
+
+    np.testing.assert_allclose(shift, [2., 1., 2. / 1024], atol=1e-6)
+
+
+def test_unknown_city_uses_location_only(trained_arrays):
+    model = GlobalModel(trained_arrays).city_model("temp", "Atlantis", (0., 0., 0.))
+
+    assert model.bias == 0.
+    assert model.last_timestamp == trained_arrays["last_timestamp"].max()
+    with pytest.raises(ValueError):
+        GlobalModel(trained_arrays).city_model("weather_description", "miami", CATALOG["miami"])
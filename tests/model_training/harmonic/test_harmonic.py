@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+import pytest
+
+from src.scripts.model_training.harmonic.harmonic import (create_harmonic_model, load_harmonic_model,
+    fit_harmonic_model, HarmonicModel, HARMONIC_MODEL_CONFIG)
+
+
+@pytest.fixture
+def hourly_df():
+    ds = pd.date_range("2023-01-01", periods=24 * 90, freq="h")
+    hours = np.arange(len(ds))
+    return pd.DataFrame({"ds": ds, "y": 10 + 0.01 * hours + 3 * np.sin(2 * np.pi * hours / 24)})
+
+
+def test_fit_harmonic_model_recovers_daily_cycle(hourly_df):
+    arrays = fit_harmonic_model(hourly_df, dict(HARMONIC_MODEL_CONFIG, alpha=1e-9))
+    model = HarmonicModel(arrays)
+
+    future = model.make_future_dataframe(periods=48)
+    forecast = model.predict(future)
+
+    hours = np.arange(len(hourly_df), len(hourly_df) + 48)
+    assert future["ds"].iloc[0] == hourly_df["ds"].iloc[-1] + pd.Timedelta(hours=1)
+    np.testing.assert_allclose(forecast["yhat"], 10 + 0.01 * hours + 3 * np.sin(2 * np.pi * hours / 24),
+                               atol=1e-6)
+
+
+def test_create_harmonic_model_round_trip(hourly_df, tmp_path):
+    model_filename = str(tmp_path / "temp.harmonic.npz")
+    hourly_df.loc[5, "y"] = np.nan
+
+    model = create_harmonic_model(hourly_df, model_filename)
+    loaded = load_harmonic_model(model_filename)
+
+    future = model.make_future_dataframe(periods=24)
+    np.testing.assert_array_equal(model.predict(future)["yhat"], loaded.predict(future)["yhat"])
+    assert loaded.last_ds == hourly_df["ds"].iloc[-1]
+
+
+def test_create_harmonic_model_requires_ds_and_y(tmp_path):
+    with pytest.raises(AttributeError):
+        create_harmonic_model(pd.DataFrame({"ds": []}), str(tmp_path / "temp.harmonic.npz"))
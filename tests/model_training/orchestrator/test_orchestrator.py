@@ -0,0 +1,147 @@
+import pytest
+
+import os
+from json import dumps
+from unittest.mock import patch, Mock
+
+from src.scripts.model_training.orchestrator import orchestrator
+from src.scripts.model_training.orchestrator.orchestrator import (build_training_jobs,
+    plan_training_jobs, run_training_job, read_completed_jobs, summarize_run, get_training_frame,
+    worker_thread_env)
+
+
+@pytest.fixture(autouse=True)
+def clear_training_frames():
+    orchestrator._training_frames.clear()
+    yield
+    orchestrator._training_frames.clear()
+
+
+def test_build_training_jobs_orders_slow_products_first():
+    jobs = build_training_jobs(["chicago", "miami"], ["weather_description", "temp", "pressure"])
+
+    assert len(jobs) == 6
+    assert {product for _, product in jobs[:2]} == {"pressure"}
+    assert {product for _, product in jobs[-2:]} == {"weather_description"}
+
+
+def test_build_training_jobs_skips_completed():
+    jobs = build_training_jobs(["chicago"], ["temp", "pressure"], completed={("chicago", "pressure")})
+    assert jobs == [("chicago", "temp")]
+
+
+def test_build_training_jobs_unknown_product():
+    with pytest.raises(ValueError):
+        build_training_jobs(["chicago"], ["snow_level"])
+
+
+def test_plan_training_jobs_without_policy():
+    planned, skipped = plan_training_jobs([("chicago", "temp")], policy=None, warm_start=True)
+    assert planned == [("chicago", "temp", "warm")]
+    assert skipped == []
+
+
+@patch("src.scripts.model_training.orchestrator.orchestrator.plan_product_model")
+@patch("src.scripts.model_training.orchestrator.orchestrator.load_training_frame")
+def test_plan_training_jobs_skips_unchanged(load_training_frame, plan_product_model):
+    plan_product_model.side_effect = lambda city, product, df, policy: (
+        {"temp": "skip", "pressure": "warm"}[product], {})
+
+    planned, skipped = plan_training_jobs([("chicago", "pressure"), ("chicago", "temp")], policy="auto")
+
+    load_training_frame.assert_called_once_with("chicago", None)
+    assert planned == [("chicago", "pressure", "warm")]
+    assert skipped == [("chicago", "temp")]
+
+
+@patch("src.scripts.model_training.orchestrator.orchestrator.describe_product_model")
+@patch("src.scripts.model_training.orchestrator.orchestrator.create_version")
+@patch("src.scripts.model_training.orchestrator.orchestrator.get_fit_stats")
+@patch("src.scripts.model_training.orchestrator.orchestrator.get_product_fingerprint")
+@patch("src.scripts.model_training.orchestrator.orchestrator.load_training_frame")
+@patch("src.scripts.model_training.orchestrator.orchestrator.create_product_model")
+def test_run_training_job_success(create_product_model, load_training_frame, get_product_fingerprint,
+                                  get_fit_stats, create_version, describe_product_model):
+    create_product_model.return_value = Mock()
+    create_version.return_value = "data/models/chicago/versions/v1"
+    get_product_fingerprint.return_value = {"rows": 10}
+    get_fit_stats.return_value = {"fit_iterations": 42, "fit_algorithm": "LBFGS", "converged": True}
+    describe_product_model.return_value = {"file": "temp.json"}
+
+    record = run_training_job("chicago", "temp", "v1", mode="warm")
+
+    create_product_model.assert_called_once_with("chicago", "temp", "data/models/chicago/versions/v1",
+                                                 df=load_training_frame.return_value,
+                                                 warm_start=True, slim=False)
+    filename, _, fingerprint, stats = describe_product_model.call_args.args
+    assert filename == "data/models/chicago/versions/v1/temp.json"
+    assert fingerprint == {"rows": 10}
+    assert stats["mode"] == "warm" and stats["fit_iterations"] == 42
+    assert record["status"] == "ok"
+    assert record["version"] == "v1"
+    assert record["entry"] == {"file": "temp.json"}
+    assert record["fit_iterations"] == 42
+    assert record["wall_time"] >= 0
+
+
+@patch("src.scripts.model_training.orchestrator.orchestrator.create_version")
+@patch("src.scripts.model_training.orchestrator.orchestrator.load_training_frame")
+def test_run_training_job_failure(load_training_frame, create_version):
+    load_training_frame.side_effect = FileNotFoundError("no data")
+
+    record = run_training_job("chicago", "temp", "v1")
+
+    assert record["status"] == "failed"
+    assert "no data" in record["error"]
+
+
+def test_read_completed_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(orchestrator, "TRAINING_RUNS_DIR", str(tmp_path))
+    with open(tmp_path / "run.jsonl", "w") as f:
+        f.write(dumps({"city": "chicago", "product": "temp", "status": "ok"}) + "\n")
+        f.write(dumps({"city": "chicago", "product": "pressure", "status": "failed"}) + "\n")
+        f.write('{"city": "chicago", "prod')
+
+    assert set(read_completed_jobs("run")) == {("chicago", "temp")}
+    assert read_completed_jobs("missing") == {}
+
+
+@patch("src.scripts.model_training.orchestrator.orchestrator.load_training_frame")
+def test_get_training_frame_loads_each_city_once(load_training_frame, tmp_path, monkeypatch):
+    monkeypatch.setattr(orchestrator, "CITIES_WEATHER_DATA_DIR", str(tmp_path))
+    (tmp_path / "chicago").mkdir()
+    dataset = tmp_path / "chicago" / "chicago.csv"
+    dataset.write_text("timestamp\n0\n")
+    load_training_frame.side_effect = lambda city, window_days: Mock()
+
+    df = get_training_frame("chicago", 30)
+    assert get_training_frame("chicago", 30) is df
+    load_training_frame.assert_called_once_with("chicago", 30)
+
+    os.utime(dataset, ns=(0, 1))
+    assert get_training_frame("chicago", 30) is not df
+    assert load_training_frame.call_count == 2
+
+
+def test_worker_thread_env_restores_parent(monkeypatch):
+    monkeypatch.setenv("OMP_NUM_THREADS", "8")
+    monkeypatch.delenv("STAN_NUM_THREADS", raising=False)
+
+    with worker_thread_env(1):
+        assert os.environ["OMP_NUM_THREADS"] == "1"
+        assert os.environ["STAN_NUM_THREADS"] == "1"
+
+    assert os.environ["OMP_NUM_THREADS"] == "8"
+    assert "STAN_NUM_THREADS" not in os.environ
+
+
+def test_summarize_run():
+    records = [
+        {"city": "chicago", "product": "temp", "status": "ok", "wall_time": 3.0, "fit_iterations": 100},
+        {"city": "chicago", "product": "pressure", "status": "failed", "wall_time": 1.0}
+    ]
+    summary = summarize_run("run", records, wall_time=2.0, max_workers=2)
+
+    assert summary["speedup"] == 2.0
+    assert summary["failed"] == [("chicago", "pressure")]
+    assert summary["fit_iterations_total"] == 100
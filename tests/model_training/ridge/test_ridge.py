@@ -0,0 +1,28 @@
+import numpy as np
+
+from src.scripts.model_training.ridge.ridge import harmonic_features, fit_ridge, SECONDS_PER_DAY
+
+
+def test_harmonic_features_match_day_columns():
+    seconds = np.arange(0, 2 * SECONDS_PER_DAY, 3600)
+
+    features = harmonic_features(seconds, SECONDS_PER_DAY, 2)
+
+    assert features.shape == (48, 4)
+    np.testing.assert_allclose(features[:, 0], np.sin(seconds * (2 * np.pi / SECONDS_PER_DAY)))
+    np.testing.assert_allclose(features[:, 1], np.cos(seconds * (2 * np.pi / SECONDS_PER_DAY)))
+    np.testing.assert_allclose(features[:, 2], np.sin(2 * seconds * (2 * np.pi / SECONDS_PER_DAY)), atol=1e-12)
+
+
+def test_fit_ridge_recovers_coefficients():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([np.ones(500), rng.normal(size=(500, 3))])
+    coef = np.array([10., 1., -2., 0.5])
+
+    np.testing.assert_allclose(fit_ridge(X, X @ coef, alpha=1e-9), coef, atol=1e-6)
+
+
+def test_fit_ridge_does_not_shrink_intercept():
+    X = np.column_stack([np.ones(100), np.zeros(100)])
+
+    np.testing.assert_allclose(fit_ridge(X, np.full(100, 5.), alpha=1e6), [5., 0.])
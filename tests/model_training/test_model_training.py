@@ -107,3 +107,123 @@ def test_create_products_models(mock_read_df, create_valid_df):
         
         returned_df = create_products_models("miami", product)
         assert_frame_equal(returned_df, response_df)
+
+
+# Tests for apply_training_window
+
+from src.scripts.model_training.model_training import apply_training_window
+
+@pytest.fixture
+def hourly_timestamps_df():
+    start = 1393632000
+    return pd.DataFrame({"timestamp": range(start, start + 3600 * 24 * 60, 3600)})
+
+def test_apply_training_window_disabled(hourly_timestamps_df):
+    assert apply_training_window(hourly_timestamps_df, None) is hourly_timestamps_df
+
+def test_apply_training_window_aligned_start(hourly_timestamps_df):
+    windowed = apply_training_window(hourly_timestamps_df, 30, alignment_days=7)
+    start = windowed["timestamp"].iloc[0]
+    
+    assert start % (7 * 24 * 3600) == 0
+    assert windowed["timestamp"].iloc[-1] == hourly_timestamps_df["timestamp"].iloc[-1]
+    assert 30 * 24 <= len(windowed) < 37 * 24
+
+    # One more day of data keeps the same window start
+    later = pd.DataFrame({"timestamp": range(hourly_timestamps_df["timestamp"].iloc[0],
+                                             hourly_timestamps_df["timestamp"].iloc[-1] + 3600 * 25, 3600)})
+    assert apply_training_window(later, 30, alignment_days=7)["timestamp"].iloc[0] == start
+
+def test_apply_training_window_invalid(hourly_timestamps_df):
+    with pytest.raises(ValueError):
+        apply_training_window(hourly_timestamps_df, 0)
+
+
+from src.scripts.model_training import model_training
+from src.scripts.model_training.model_training import publish_city_models
+from src.scripts.model_registry.model_registry import create_version, read_current_manifest
+from src.scripts.model_pack.model_pack import load_model_pack
+from src.scripts.tree_model.tree_model import export_tree_model
+from sklearn.tree import DecisionTreeClassifier
+
+def test_publish_city_models_builds_model_pack(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_training, "CITIES_WEATHER_MODELS_DIR", str(tmp_path))
+    x = pd.DataFrame({"temp": [1.0, 2.0, 3.0, 4.0]})
+    model = DecisionTreeClassifier().fit(x, ["Snow", "Snow", "Rain", "Rain"])
+    version_dir = create_version(str(tmp_path / "chicago"), "v1")
+    export_tree_model(model, f"{version_dir}/weather_description.npz")
+
+    publish_city_models("chicago", "v1", {"weather_description": {"file": "weather_description.npz"}})
+    manifest = read_current_manifest(str(tmp_path / "chicago"))
+
+    assert manifest["pack"] == {"file": "models.pack", "products": ["weather_description"]}
+    packed = load_model_pack(f"{version_dir}/models.pack")
+    assert list(packed["weather_description"].predict(x)) == ["Snow", "Snow", "Rain", "Rain"]
+
+
+from src.scripts.model_training.model_training import PRODUCTS, prepare_training_frame
+from src.scripts.model_training.harmonic.harmonic import load_harmonic_model
+
+def test_publish_city_models_creates_engine_models(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_training, "CITIES_WEATHER_MODELS_DIR", str(tmp_path))
+    df = pd.DataFrame({"timestamp": np.arange(1_700_000_000, 1_700_000_000 + 3600 * 72, 3600)})
+    for product in PRODUCTS:
+        df[product] = np.sin(np.arange(len(df)) / 24)
+    version_dir = create_version(str(tmp_path / "chicago"), "v1")
+
+    publish_city_models("chicago", "v1", {}, df=prepare_training_frame(df))
+    manifest = read_current_manifest(str(tmp_path / "chicago"))
+
+    harmonic = manifest["engines"]["harmonic"]
+    assert sorted(harmonic) == sorted(p for p in PRODUCTS if p != "weather_description")
+    assert harmonic["temp"]["file"] == "temp.harmonic.npz"
+    assert harmonic["temp"]["last_ds"] == "2023-11-17 21:13:20"
+    model = load_harmonic_model(f"{version_dir}/temp.harmonic.npz")
+    assert len(model.predict(model.make_future_dataframe(periods=24))) == 24
+
+
+# Tests for the shared training frame
+
+from src.scripts.model_training.model_training import get_product_frame, create_product_model
+from src.scripts.model_training.weather_description.weather_description import WEATHER_DESCRIPTION_FEATURES
+
+@pytest.fixture
+def raw_city_df():
+    df = pd.DataFrame({"timestamp": np.arange(1_700_000_000, 1_700_000_000 + 3600 * 48, 3600)})
+    for column in WEATHER_DESCRIPTION_FEATURES + ["day_sin"]:
+        df[column] = np.linspace(0, 1, len(df))
+    df["weather_description"] = np.where(df["temp"] > 0.5, "Clear", "Clouds")
+    return df
+
+def test_prepare_training_frame_types(raw_city_df):
+    frame = prepare_training_frame(raw_city_df)
+
+    assert frame["ds"].iloc[0] == pd.Timestamp(1_700_000_000, unit="s")
+    assert frame["timestamp"].dtype == np.int64
+    assert all(frame[c].dtype == np.float32 for c in WEATHER_DESCRIPTION_FEATURES)
+    assert frame["weather_description"].iloc[-1] == "Clear"
+    assert "ds" not in raw_city_df.columns
+
+def test_get_product_frame_shares_memory(raw_city_df):
+    frame = prepare_training_frame(raw_city_df)
+
+    temp = get_product_frame(frame, "temp")
+    humidity = get_product_frame(frame, "humidity")
+    classifier = get_product_frame(frame, "weather_description")
+
+    assert list(temp.columns) == ["ds", "y"]
+    assert np.shares_memory(temp["y"].to_numpy(), frame["temp"].to_numpy())
+    assert np.shares_memory(temp["ds"].to_numpy(), frame["ds"].to_numpy())
+    # Views of one product leave the frame usable for the next one.
+    assert "temp" in frame.columns and "timestamp" in frame.columns
+    assert np.shares_memory(humidity["y"].to_numpy(), frame["humidity"].to_numpy())
+    assert list(classifier.columns) == ["ds", *WEATHER_DESCRIPTION_FEATURES, "y"]
+    with pytest.raises(AttributeError):
+        get_product_frame(frame, "snow")
+
+def test_create_product_model_from_frame(raw_city_df, tmp_path):
+    frame = prepare_training_frame(raw_city_df)
+
+    model = create_product_model("chicago", "weather_description", str(tmp_path), df=frame)
+
+    assert list(model.feature_names_in_) == WEATHER_DESCRIPTION_FEATURES
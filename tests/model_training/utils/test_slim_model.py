@@ -0,0 +1,47 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from prophet import Prophet
+
+from src.scripts.model_training.utils.utils import (save_prophet_model, load_prophet_model,
+    load_slim_prophet_model)
+
+
+@pytest.fixture(scope="module")
+def fitted_model():
+    model = Prophet(yearly_seasonality=False, weekly_seasonality=False)
+    model.fit(pd.DataFrame({'ds': pd.date_range(start='2012-01-01', periods=200, freq='h'),
+                            'y': np.sin(np.arange(200) / 24 * 2 * np.pi)}))
+    return model
+
+
+def test_slim_model_round_trip(fitted_model, tmp_path):
+    full_filename, slim_filename = tmp_path / "full.json", tmp_path / "slim.json"
+    save_prophet_model(fitted_model, str(full_filename))
+    save_prophet_model(fitted_model, str(slim_filename), slim=True)
+
+    slim = load_slim_prophet_model(str(slim_filename))
+
+    assert slim_filename.stat().st_size < full_filename.stat().st_size
+    assert len(slim.history) == 1
+    assert 'trend' not in slim.params
+    assert slim.history_dates.max() == fitted_model.history_dates.max()
+
+    expected = fitted_model.predict(fitted_model.make_future_dataframe(periods=48, freq='h'))
+    forecast = slim.predict(slim.make_future_dataframe(periods=48, freq='h'))
+    np.testing.assert_allclose(forecast['yhat'].tail(48).values, expected['yhat'].tail(48).values)
+
+
+def test_slim_model_loads_with_default_loader(fitted_model, tmp_path):
+    filename = tmp_path / "slim.json"
+    save_prophet_model(fitted_model, str(filename), slim=True)
+    assert len(load_prophet_model(str(filename)).history) == 1
+
+
+def test_load_slim_rejects_full_model(fitted_model, tmp_path):
+    filename = tmp_path / "full.json"
+    save_prophet_model(fitted_model, str(filename))
+    with pytest.raises(ValueError):
+        load_slim_prophet_model(str(filename))
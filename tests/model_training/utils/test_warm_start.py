@@ -0,0 +1,91 @@
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from prophet import Prophet
+from unittest.mock import patch
+
+from src.scripts.model_training.utils.utils import (check_warm_start_compatibility,
+    fit_prophet_model, warm_start_params)
+
+
+@pytest.fixture
+def training_df():
+    return pd.DataFrame({'ds': pd.date_range(start='2012-01-01', end='2012-02-01'), 'y': range(0, 32)})
+
+
+@pytest.fixture
+def previous_model(training_df):
+    model = Prophet(yearly_seasonality=False, weekly_seasonality=False)
+    model.add_seasonality(name='monthly', period=30.5, fourier_order=5)
+    model.params = {'k': np.array([[0.5]]), 'm': np.array([[0.1]]), 'sigma_obs': np.array([[0.01]]),
+                    'delta': np.array([[0.0, 0.2]]), 'beta': np.array([[0.3, 0.4]])}
+    model.start = training_df['ds'].min()
+    model.history_dates = training_df['ds'].iloc[:-2]
+    return model
+
+
+def new_model(period=30.5):
+    model = Prophet(yearly_seasonality=False, weekly_seasonality=False)
+    model.add_seasonality(name='monthly', period=period, fourier_order=5)
+    return model
+
+
+def test_warm_start_params(previous_model):
+    params = warm_start_params(previous_model)
+    assert params['k'] == 0.5
+    assert params['sigma_obs'] == 0.01
+    assert list(params['delta']) == [0.0, 0.2]
+
+
+def test_compatible_when_window_grows(previous_model, training_df):
+    assert check_warm_start_compatibility(previous_model, new_model(), training_df) is None
+
+
+def test_incompatible_seasonality(previous_model, training_df):
+    reason = check_warm_start_compatibility(previous_model, new_model(period=60), training_df)
+    assert "monthly" in reason
+
+
+def test_incompatible_removed_components(previous_model, training_df):
+    previous_model.add_seasonality(name='quarterly', period=91.25, fourier_order=3)
+    reason = check_warm_start_compatibility(previous_model, new_model(), training_df)
+    assert "quarterly" in reason
+
+    previous_model.seasonalities.pop('quarterly')
+    previous_model.add_regressor('humidity')
+    reason = check_warm_start_compatibility(previous_model, new_model(), training_df)
+    assert "regressor 'humidity'" in reason
+
+
+def test_incompatible_window(previous_model, training_df):
+    reason = check_warm_start_compatibility(previous_model, new_model(), training_df.iloc[1:])
+    assert "window start" in reason
+    reason = check_warm_start_compatibility(previous_model, new_model(), training_df.iloc[:-5])
+    assert "shrank" in reason
+
+
+@patch('src.scripts.model_training.utils.utils.load_prophet_model')
+@patch('os.path.isfile')
+def test_fit_prophet_model_warm(is_file, load_prophet_model, previous_model, training_df):
+    is_file.return_value = True
+    load_prophet_model.return_value = previous_model
+    model = new_model()
+
+    with patch.object(model, 'fit') as fit:
+        fit_prophet_model(model, training_df, 'previous.json')
+
+    args, kwargs = fit.call_args
+    assert kwargs['init']['k'] == 0.5
+
+
+@patch('src.scripts.model_training.utils.utils.load_prophet_model')
+def test_fit_prophet_model_cold_without_previous(load_prophet_model, training_df, tmp_path):
+    model = new_model()
+
+    with patch.object(model, 'fit') as fit:
+        fit_prophet_model(model, training_df, str(tmp_path / 'missing.json'))
+
+    load_prophet_model.assert_not_called()
+    fit.assert_called_once_with(training_df)
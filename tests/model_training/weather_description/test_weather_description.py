@@ -43,4 +43,15 @@ def test_create_weather_description_model(mock_save_sklearn_model, mock_sklearn_
     create_weather_description_model(df, "model.pkl")
 
     mock_sklearn_model.fit.assert_called_once_with(real_x, real_y)
-    mock_save_sklearn_model.assert_called_once()
\ No newline at end of file
+    mock_save_sklearn_model.assert_called_once()
+
+def test_create_weather_description_model_exports_npz(create_valid_df, tmp_path):
+    from src.scripts.tree_model.tree_model import load_tree_model
+    from src.scripts.model_training.weather_description.weather_description import WEATHER_DESCRIPTION_FEATURES
+    df = create_valid_df
+    filename = str(tmp_path / "weather_description.npz")
+
+    model = create_weather_description_model(df, filename)
+
+    x = df[WEATHER_DESCRIPTION_FEATURES]
+    assert list(load_tree_model(filename).predict(x)) == list(model.predict(x))
@@ -0,0 +1,65 @@
+import pytest
+
+from unittest.mock import patch
+
+from src.api.app import app
+from src.scripts.model_warmup.model_warmup import list_model_cities, warm_up, merge_warmup_states, WARMUP_STATE
+
+
+@pytest.fixture(autouse=True)
+def reset_warmup_state():
+    yield
+    WARMUP_STATE.update(ready=False, cities=[], failed=[], duration=None)
+
+
+def test_list_model_cities(tmp_path):
+    for name in ('chicago', 'boston', '_global', 'training_runs'):
+        (tmp_path / name).mkdir()
+    (tmp_path / 'models.pack').write_bytes(b'')
+
+    assert list_model_cities(str(tmp_path)) == ['boston', 'chicago']
+    assert list_model_cities(str(tmp_path / 'missing')) == []
+
+
+@patch('src.scripts.model_prediction.model_prediction.predict_hourly_city_weather')
+def test_warm_up(predict):
+    predict.side_effect = lambda city_name, prediction_hours: (
+        {'result': [], 'status': 'success'} if city_name == 'chicago'
+        else {'result': [], 'status': 'error', 'message': f"No data found for {city_name}"})
+
+    state = warm_up(['chicago', 'atlantis'], [24, 240])
+
+    assert state['ready']
+    assert [c['city'] for c in state['cities']] == ['chicago']
+    assert list(state['cities'][0]['seconds']) == ['24', '240']
+    assert [f['city'] for f in state['failed']] == ['atlantis']
+    assert predict.call_count == 3
+
+
+def test_merge_warmup_states():
+    chicago, boston = {'city': 'chicago', 'seconds': {'24': 1.}}, {'city': 'boston', 'seconds': {'24': 2.}}
+    states = [
+        {'ready': True, 'cities': [chicago, boston], 'failed': [], 'duration': 3.},
+        {'ready': True, 'cities': [chicago], 'failed': [{'city': 'boston', 'error': 'OSError()'}], 'duration': 4.}
+    ]
+
+    merged = merge_warmup_states(states)
+    assert merged == {'ready': True, 'cities': [chicago], 'failed': [{'city': 'boston', 'error': 'OSError()'}],
+                      'duration': 4., 'processes': 2}
+    assert not merge_warmup_states([states[0], dict(states[1], ready=False)])['ready']
+    assert not merge_warmup_states([])['ready']
+
+
+@patch('src.scripts.model_prediction.model_prediction.predict_hourly_city_weather')
+def test_readiness_follows_warmup(predict):
+    predict.return_value = {'result': [], 'status': 'success'}
+    client = app.test_client()
+
+    assert client.get('/healthz').status_code == 200
+    assert client.get('/readyz').status_code == 503
+
+    warm_up(['chicago'], [24])
+
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json()['cities'][0]['city'] == 'chicago'
@@ -0,0 +1,128 @@
+import pytest
+
+import threading
+
+from json import dumps
+from time import sleep
+from unittest.mock import patch
+
+from starlette.testclient import TestClient
+
+from src.api.app import app
+from src.api.asgi import app as asgi_app
+from src.scripts.profiling import profiling
+from src.scripts.profiling.profiling import (Profile, start_profile, profiled_path, list_profiles, read_profile,
+                                             PROFILE_HEADER, PROFILE_ID_HEADER)
+from src.scripts.model_warmup.model_warmup import WARMUP_STATE
+
+
+CITIES = dumps({"result": [], "status": "success"})
+
+
+def slow_city(*args, **kwargs):
+    sleep(0.05)
+    return CITIES
+
+
+@pytest.fixture
+def profiles(tmp_path):
+    with patch.object(profiling, 'PROFILE_TOKEN', 'secret'), patch.object(profiling, 'PROFILE_DIR', str(tmp_path)), \
+         patch.object(profiling, 'PROFILE_INTERVAL_MS', 1):
+        yield tmp_path
+
+
+def test_disabled_profiling_starts_nothing():
+    threads = threading.active_count()
+
+    assert start_profile('get_city_info', 'secret', '/cities/miami') is None
+    assert threading.active_count() == threads
+    assert app.test_client().get('/admin/profiles').status_code == 404
+
+
+def test_profiled_path_drops_the_token():
+    assert profiled_path('/predict/miami/24', [('profile', 'secret'), ('engine', 'harmonic')]) == \
+        '/predict/miami/24?engine=harmonic'
+    assert profiled_path('/cities/', []) == '/cities/'
+
+
+@patch('src.api.app.get_city', side_effect=slow_city)
+def test_requested_profile(get_city, profiles):
+    client = app.test_client()
+    with client.get('/cities/miami?page=1', headers={PROFILE_HEADER: 'secret'}) as response:
+        profile_id = response.headers[PROFILE_ID_HEADER]
+
+    metadata = list_profiles()[0]
+    assert (metadata['id'], metadata['endpoint'], metadata['trigger']) == (profile_id, 'get_city_info', 'requested')
+    assert metadata['path'] == '/cities/miami?page=1'
+    assert metadata['samples'] > 0
+
+    response = client.get(f'/admin/profiles/{profile_id}', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    stack, count = response.data.decode().splitlines()[-1].rsplit(' ', 1)
+    assert int(count) > 0
+    assert any('slow_city' in line for line in response.data.decode().splitlines())
+
+    assert client.get('/admin/profiles', headers={'Authorization': 'Bearer secret'}).json['profiles'] == [metadata]
+    assert client.get('/admin/profiles', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/admin/profiles/unknown', headers={'Authorization': 'Bearer secret'}).status_code == 404
+
+
+@patch('src.api.app.get_city', return_value=CITIES)
+def test_unauthorized_requests_are_not_profiled(get_city, profiles):
+    with app.test_client().get('/cities/miami', headers={PROFILE_HEADER: 'wrong'}) as response:
+        assert PROFILE_ID_HEADER not in response.headers
+    # The token is not accepted in the query string, which is logged.
+    with app.test_client().get('/cities/miami?profile=secret') as response:
+        assert PROFILE_ID_HEADER not in response.headers
+    assert list_profiles() == []
+
+
+@patch('src.api.app.get_city', return_value=CITIES)
+def test_sampled_profiles(get_city, profiles):
+    with patch.object(profiling, 'PROFILE_SAMPLE_RATE', 2), patch.object(profiling, '_requests', iter(range(1, 5))):
+        for _ in range(4):
+            with app.test_client().get('/cities/miami'):
+                pass
+        with app.test_client().get('/metrics'):
+            pass
+
+    assert [metadata['trigger'] for metadata in list_profiles()] == ['sampled', 'sampled']
+
+
+def test_profiles_ring(profiles):
+    with patch.object(profiling, 'PROFILE_RING', 2):
+        ids = []
+        for _ in range(3):
+            profile = Profile('get_city_info', '/cities/miami', 'requested')
+            sleep(0.01)
+            profile.stop()
+            ids.append(profile.id)
+
+    assert [metadata['id'] for metadata in list_profiles()] == ids[:0:-1]
+    assert read_profile(ids[0]) is None
+    filenames = sorted(f"{profile_id}.{extension}" for profile_id in ids[1:] for extension in ['folded', 'json'])
+    assert sorted(path.name for path in profiles.iterdir()) == filenames
+
+
+def test_asgi_profiles_forecasts_in_a_thread(profiles):
+    def slow_forecast(city_name, prediction_hours, engines=None):
+        sleep(0.05)
+        return {"result": [], "status": "success"}
+
+    with patch('src.api.asgi.FORECAST_EXECUTOR', 'thread'), patch('src.api.asgi.FORECAST_WORKERS', 1), \
+         patch('src.scripts.model_warmup.model_warmup.WARMUP_CITIES', []), \
+         patch('src.api.asgi.forecast_validators', return_value=None), \
+         patch('src.api.asgi.coalesced_forecast', side_effect=slow_forecast), \
+         patch('src.api.asgi.coalesced_forecast_async') as coalesced_forecast_async:
+        with TestClient(asgi_app) as client:
+            response = client.get('/predict/miami/24', headers={PROFILE_HEADER: 'secret'})
+            stacks = client.get(f'/admin/profiles/{response.headers[PROFILE_ID_HEADER]}',
+                                headers={'Authorization': 'Bearer secret'})
+    WARMUP_STATE.update(ready=False, cities=[], failed=[], duration=None)
+
+    assert response.status_code == 200
+    coalesced_forecast_async.assert_not_called()
+    assert stacks.status_code == 200
+    assert 'slow_forecast' in stacks.text
+    assert list_profiles()[0]['endpoint'] == 'predict_hourly_weather'
@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+
+from unittest.mock import patch, Mock, AsyncMock
+
+from src.redis.get_async.get_async import get_city, get_all_cities, get_number_of_cities
+
+from json import loads
+
+
+CITIES = {
+    b"New York City": [el.encode("UTF-8") for el in ["USA", "10001", "-74.0060", "40.7128", "-5"]],
+    b"Nashville": [el.encode("UTF-8") for el in ["USA", "37201", "-86.7816", "36.1627", "-6"]],
+    b"New Orleans": [el.encode("UTF-8") for el in ["USA", "70112", "-90.0715", "29.9511", "-6"]]
+}
+
+
+@pytest.fixture
+def redis_mock():
+    redis_mock = Mock()
+    redis_mock.zscan = AsyncMock(return_value=(0, [(name, 0) for name in CITIES]))
+    pipe = Mock()
+    pipe.execute = AsyncMock(side_effect=lambda: [CITIES[call.args[0]] for call in pipe.hmget.call_args_list])
+    redis_mock.pipeline.return_value = pipe
+    with patch("src.redis.get_async.get_async.connect_to_redis", return_value=redis_mock):
+        yield redis_mock
+
+
+def test_get_city(redis_mock):
+    result = loads(asyncio.run(get_city("N", 0, 3)))
+
+    assert result["status"] == "success"
+    assert [city["name"] for city in result["result"]] == ["New York City", "Nashville", "New Orleans"]
+    assert result["result"][1] == {"name": "Nashville", "country": "USA", "zip_code": "37201", "lon": "-86.7816",
+                                   "lat": "36.1627", "utc_time_difference": "-6"}
+    # Prefix and exact match scans, one pipelined read of the page.
+    assert redis_mock.zscan.await_count == 2
+    redis_mock.pipeline.return_value.execute.assert_awaited_once()
+
+
+def test_get_city_page_error(redis_mock):
+    result = loads(asyncio.run(get_city("N", 3, 2)))
+
+    assert result["result"] == []
+    assert "total pages: 2" in result["message"]
+
+
+def test_get_all_cities(redis_mock):
+    result = loads(asyncio.run(get_all_cities(1, 2)))
+
+    assert [city["name"] for city in result["result"]] == ["New York City", "Nashville"]
+
+
+def test_get_number_of_cities(redis_mock):
+    assert loads(asyncio.run(get_number_of_cities("N")))["result"] == 3
@@ -0,0 +1,133 @@
+import asyncio
+import pytest
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from json import dumps
+from unittest.mock import patch, Mock
+
+from redis.exceptions import ConnectionError
+
+from src.scripts.single_flight.single_flight import (normalize_horizon, coalesced_forecast, coalesced_forecast_async,
+                                                     redis_single_flight, SINGLE_FLIGHT_STATS)
+
+
+@pytest.fixture(autouse=True)
+def reset_stats():
+    SINGLE_FLIGHT_STATS.update({name: 0 for name in SINGLE_FLIGHT_STATS})
+
+
+def forecast_rows(hours):
+    return {"result": [dumps({"hour": hour}) for hour in range(hours)], "status": "success"}
+
+
+@pytest.mark.parametrize(("hours", "expected"), [(1, 24), (24, 24), (25, 48), (200, 240), (300, 300), (0, 0)])
+def test_normalize_horizon(hours, expected):
+    assert normalize_horizon(hours) == expected
+
+
+@patch('src.scripts.model_prediction.model_prediction.predict_hourly_city_weather')
+def test_coalesced_forecast_shares_one_computation(predict):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_forecast(city_name, prediction_hours, engines):
+        started.set()
+        release.wait(10)
+        return forecast_rows(prediction_hours)
+    predict.side_effect = slow_forecast
+
+    results = {}
+    def request(name, hours):
+        results[name] = coalesced_forecast('chicago', str(hours))
+
+    leader = threading.Thread(target=request, args=('leader', 48))
+    leader.start()
+    assert started.wait(10)
+    followers = [threading.Thread(target=request, args=(name, hours)) for name, hours in (('day', 24), ('two', 48))]
+    for follower in followers:
+        follower.start()
+    while SINGLE_FLIGHT_STATS['coalesced'] < 2:
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(10)
+
+    predict.assert_called_once_with(city_name='chicago', prediction_hours=48, engines=None)
+    assert results['leader'] == results['two'] == forecast_rows(48)
+    assert results['day'] == forecast_rows(24)
+    assert SINGLE_FLIGHT_STATS == {'requests': 3, 'computed': 1, 'coalesced': 2, 'coalesced_redis': 0}
+
+
+@patch('src.scripts.model_prediction.model_prediction.predict_hourly_city_weather')
+def test_coalesced_forecast_longer_horizon_is_computed(predict):
+    predict.side_effect = lambda city_name, prediction_hours, engines: forecast_rows(prediction_hours)
+
+    assert len(coalesced_forecast('chicago', 10)['result']) == 10
+    assert len(coalesced_forecast('chicago', 100)['result']) == 100
+
+    assert [c.kwargs['prediction_hours'] for c in predict.call_args_list] == [24, 120]
+    assert SINGLE_FLIGHT_STATS['coalesced'] == 0
+
+
+@patch('src.scripts.model_prediction.model_prediction.predict_hourly_city_weather')
+def test_coalesced_forecast_async(predict):
+    release = threading.Event()
+
+    def slow_forecast(city_name, prediction_hours, engines):
+        release.wait(10)
+        return forecast_rows(prediction_hours)
+    predict.side_effect = slow_forecast
+
+    async def requests(pool):
+        tasks = [asyncio.create_task(coalesced_forecast_async('chicago', hours, None, pool)) for hours in (72, 30, 72)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*tasks)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = asyncio.run(requests(pool))
+
+    assert predict.call_count == 1
+    assert [len(r['result']) for r in results] == [72, 30, 72]
+    assert SINGLE_FLIGHT_STATS['coalesced'] == 2
+
+
+@patch('src.scripts.model_prediction.model_prediction.predict_hourly_city_weather')
+def test_coalesced_forecast_error_reaches_every_waiter(predict):
+    predict.side_effect = ValueError("no models")
+
+    with pytest.raises(ValueError):
+        coalesced_forecast('chicago', 24)
+    # Nothing is left in flight, the next request computes again.
+    with pytest.raises(ValueError):
+        coalesced_forecast('chicago', 24)
+    assert predict.call_count == 2
+
+
+def test_redis_single_flight_waits_for_the_lock_holder():
+    redis_cnt = Mock()
+    redis_cnt.get.side_effect = [None, dumps(forecast_rows(24)).encode()]
+    redis_cnt.set.return_value = False
+    compute = Mock()
+
+    with patch('src.scripts.single_flight.single_flight.REDIS_POLL_INTERVAL_S', 0):
+        assert redis_single_flight('key', compute, redis_cnt) == forecast_rows(24)
+    compute.assert_not_called()
+    assert SINGLE_FLIGHT_STATS['coalesced_redis'] == 1
+
+
+def test_redis_single_flight_lock_holder_shares_the_result():
+    redis_cnt = Mock()
+    redis_cnt.get.return_value = None
+    redis_cnt.set.return_value = True
+
+    assert redis_single_flight('key', lambda: forecast_rows(24), redis_cnt) == forecast_rows(24)
+    assert redis_cnt.set.call_args_list[1].args == ('single_flight:result:key', dumps(forecast_rows(24)))
+
+
+def test_redis_single_flight_without_redis():
+    redis_cnt = Mock()
+    redis_cnt.get.side_effect = ConnectionError("no redis")
+
+    assert redis_single_flight('key', lambda: forecast_rows(24), redis_cnt) == forecast_rows(24)
@@ -0,0 +1,154 @@
+import pytest
+
+import logging
+
+from json import dumps, loads
+from unittest.mock import patch
+
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from starlette.testclient import TestClient
+
+from src.api.app import app
+from src.api.asgi import app as asgi_app
+from src.redis.get.get import check_city_name
+from src.scripts.metrics.metrics import stage_timer
+from src.scripts.model_prediction.model_prediction import load_cached
+from src.scripts.model_training.utils.utils import handle_error
+from src.scripts.tracing import tracing
+from src.scripts.tracing.tracing import (configure_tracing, flush_tracing, start_span, traced, trace_redis,
+                                         inject_context, run_in_context, traced_lines, NO_SPAN)
+
+
+class FakeRedis:
+    def execute_command(self, *args, **options):
+        if args[0] == 'ZSCAN':
+            return 0, [(b'Miami', 0.)]
+        return [b'USA', b'33101', b'-80.19', b'25.76', b'-5']
+
+    def zscan(self, name, cursor=0, match=None):
+        return self.execute_command('ZSCAN', name, cursor, 'MATCH', match)
+
+    def hmget(self, name, keys):
+        return self.execute_command('HMGET', name, *keys)
+
+
+@pytest.fixture
+def spans():
+    exporter = InMemorySpanExporter()
+    with patch.object(tracing, '_tracer', None), patch.object(tracing, '_provider', None):
+        configure_tracing(span_processor=SimpleSpanProcessor(exporter))
+        yield exporter
+    logging.getLogger().removeFilter(tracing.LOG_FILTER)
+
+
+def by_name(exporter):
+    return {span.name: span for span in exporter.get_finished_spans()}
+
+
+def test_spans_are_free_while_tracing_is_off():
+    @traced('double', {'weather.value': 'value'})
+    def double(value):
+        return 2 * value
+
+    with start_span('stage') as span:
+        assert span is NO_SPAN
+    assert double(2) == 4
+    assert traced_lines(['line']) == ['line']
+    assert inject_context() is None
+
+
+def test_redis_helper_and_command_spans(spans):
+    with patch('src.redis.get.get.connect_to_redis', return_value=trace_redis(FakeRedis())):
+        assert check_city_name('miami')
+
+    named = by_name(spans)
+    check, lookup, zscan, hmget = (named[name] for name in ['check_city_name', 'get_city', 'redis ZSCAN',
+                                                            'redis HMGET'])
+    assert check.attributes['weather.city'] == 'miami'
+    assert dict(lookup.attributes) == {'weather.city': 'miami', 'weather.page': 0, 'weather.exact_match': True}
+    assert lookup.parent.span_id == check.context.span_id
+    assert zscan.parent.span_id == hmget.parent.span_id == lookup.context.span_id
+    assert zscan.attributes['db.system'] == 'redis'
+    assert len({span.context.trace_id for span in spans.get_finished_spans()}) == 1
+
+
+def test_stage_and_model_load_spans(tmp_path, spans):
+    filepath = str(tmp_path / 'temp.json')
+    with stage_timer('open_models', 'miami'):
+        load_cached(filepath, lambda filepath: object(), cacheable=True)
+        load_cached(filepath, lambda filepath: object(), cacheable=True)
+    with stage_timer('predict', 'miami', 'temp') as span:
+        span.set_attribute('weather.rows', 24)
+
+    finished = spans.get_finished_spans()
+    loads_ = [span for span in finished if span.name == 'load_model']
+    assert [span.attributes['weather.cache_hit'] for span in loads_] == [False, True]
+    assert loads_[0].attributes['weather.model_file'] == filepath
+    assert loads_[0].parent.span_id == by_name(spans)['open_models'].context.span_id
+    assert dict(by_name(spans)['predict'].attributes) == {'weather.city': 'miami', 'weather.param': 'temp',
+                                                          'weather.rows': 24}
+
+
+def test_errors_are_recorded_and_logged_with_the_trace(spans, caplog):
+    with pytest.raises(ValueError):
+        with start_span('predict'):
+            handle_error("Failed to make predictions", ValueError)
+
+    span = by_name(spans)['predict']
+    assert span.status.status_code.name == 'ERROR'
+    assert span.events[0].name == 'exception'
+    assert f"trace_id={span.context.trace_id:032x}" in caplog.text
+
+
+def test_context_crosses_processes(spans):
+    def child():
+        with start_span('child'):
+            pass
+
+    with start_span('parent'):
+        carrier = inject_context()
+    run_in_context(carrier, child)
+
+    named = by_name(spans)
+    assert named['child'].parent.span_id == named['parent'].context.span_id
+
+
+@patch('src.api.app.get_city', return_value=dumps({"result": [], "status": "success"}))
+def test_flask_request_spans(get_city, spans):
+    with app.test_client().get('/cities/miami'):
+        pass
+
+    span = by_name(spans)['GET /cities/<city_name>']
+    assert span.kind.name == 'SERVER'
+    assert span.attributes['http.route'] == '/cities/<city_name>'
+    assert span.attributes['http.response.status_code'] == 200
+    assert span.attributes['weather.city'] == 'miami'
+
+
+def test_asgi_request_spans(spans):
+    with patch('src.api.asgi.get_city', return_value=dumps({"result": [], "status": "success"})):
+        TestClient(asgi_app).get('/cities/miami')
+
+    span = by_name(spans)['GET /cities/{city_name}']
+    assert span.attributes['http.response.status_code'] == 200
+    assert span.attributes['weather.city'] == 'miami'
+
+
+def test_otlp_json_file_export(tmp_path):
+    trace_file = tmp_path / 'traces.jsonl'
+    with patch.object(tracing, '_tracer', None), patch.object(tracing, '_provider', None), \
+         patch.object(tracing, 'TRACE_FILE', str(trace_file)):
+        configure_tracing('file')
+        with start_span('predict', {'weather.city': 'miami', 'weather.rows': 24}):
+            pass
+        flush_tracing()
+    logging.getLogger().removeFilter(tracing.LOG_FILTER)
+
+    request = loads(trace_file.read_text().splitlines()[0])
+    resource_spans = request['resourceSpans'][0]
+    assert {'key': 'service.name', 'value': {'stringValue': 'weather-api'}} in resource_spans['resource']['attributes']
+    span = resource_spans['scopeSpans'][0]['spans'][0]
+    assert span['name'] == 'predict'
+    assert len(span['traceId']) == 32 and len(span['spanId']) == 16
+    assert {'key': 'weather.rows', 'value': {'intValue': '24'}} in span['attributes']
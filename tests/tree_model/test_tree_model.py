@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+import mmap
+import pytest
+
+from sklearn.tree import DecisionTreeClassifier
+
+from src.scripts.tree_model.tree_model import (export_tree_model, load_tree_model,
+    convert_sklearn_model, TreeModel)
+from src.scripts.model_training.utils.utils import save_sklearn_model
+
+
+@pytest.fixture
+def fitted_tree():
+    rng = np.random.default_rng(0)
+    x = pd.DataFrame({
+        "temp": rng.normal(15, 10, 2000).round(2),
+        "humidity": rng.integers(0, 100, 2000),
+        "pressure": rng.normal(1010, 8, 2000).round(1)
+    })
+    y = np.where(x["humidity"] > 80, "Rain", np.where(x["temp"] < 0, "Snow", "Clouds"))
+    y[rng.random(2000) < 0.2] = "Clear"
+    return DecisionTreeClassifier(random_state=0).fit(x, y), x
+
+
+@pytest.mark.parametrize("mmap_file", [True, False])
+def test_predictions_match_sklearn(fitted_tree, tmp_path, mmap_file):
+    model, x = fitted_tree
+    filename = str(tmp_path / "weather_description.npz")
+    export_tree_model(model, filename)
+
+    tree = load_tree_model(filename, mmap_file=mmap_file)
+    rng = np.random.default_rng(1)
+    unseen = pd.DataFrame({
+        "temp": rng.normal(15, 12, 5000),
+        "humidity": rng.uniform(0, 100, 5000),
+        "pressure": rng.normal(1010, 10, 5000)
+    })
+
+    assert list(tree.classes_) == list(model.classes_)
+    np.testing.assert_array_equal(tree.predict(x), model.predict(x))
+    np.testing.assert_array_equal(tree.predict(unseen), model.predict(unseen))
+    np.testing.assert_array_equal(tree.apply(unseen), model.apply(unseen))
+
+
+def test_mmap_arrays_are_read_only(fitted_tree, tmp_path):
+    model, _ = fitted_tree
+    filename = str(tmp_path / "weather_description.npz")
+    export_tree_model(model, filename)
+
+    tree = load_tree_model(filename)
+
+    base = tree.threshold
+    while isinstance(base, np.ndarray):
+        base = base.base
+    assert isinstance(base.obj, mmap.mmap)
+    assert not tree.threshold.flags.writeable
+    assert all(getattr(tree, name).flags.aligned for name in ["feature", "threshold", "children", "leaf_class"])
+
+
+def test_predict_selects_columns_by_name(fitted_tree, tmp_path):
+    model, x = fitted_tree
+    filename = str(tmp_path / "weather_description.npz")
+    export_tree_model(model, filename)
+    tree = load_tree_model(filename)
+
+    reordered = x[["pressure", "temp", "humidity"]].assign(timestamp=0)
+
+    np.testing.assert_array_equal(tree.predict(reordered), model.predict(x))
+    with pytest.raises(ValueError):
+        tree.predict(x.drop(columns=["pressure"]))
+
+
+def test_convert_sklearn_model(fitted_tree, tmp_path):
+    model, x = fitted_tree
+    save_sklearn_model(model, str(tmp_path / "weather_description.pkl"))
+
+    filename = convert_sklearn_model(str(tmp_path / "weather_description.pkl"))
+
+    assert filename == str(tmp_path / "weather_description.npz")
+    np.testing.assert_array_equal(load_tree_model(filename).predict(x), model.predict(x))
+
+
+def test_compressed_archive_is_rejected(fitted_tree, tmp_path):
+    model, _ = fitted_tree
+    filename = str(tmp_path / "weather_description.npz")
+    export_tree_model(model, filename)
+    arrays = dict(np.load(filename))
+    np.savez_compressed(filename, **arrays)
+
+    with pytest.raises(ValueError):
+        load_tree_model(filename)
+    assert isinstance(load_tree_model(filename, mmap_file=False), TreeModel)
+
+
+def test_export_unfitted_model(tmp_path):
+    with pytest.raises(AttributeError):
+        export_tree_model(DecisionTreeClassifier(), str(tmp_path / "weather_description.npz"))
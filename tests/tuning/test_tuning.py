@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch
+from json import loads
+
+from src.scripts.tuning.tuning import (candidate_configs, pareto_front, select_config, run_search,
+    write_tuned_configs)
+from src.scripts.model_training import model_training
+from src.scripts.model_training.model_training import (get_product_config, BASIC_PROPHET_MODEL_CONFIG)
+
+
+def trial(mae, fit_time, predict_time=0.1, product="temp"):
+    return {"product": product, "config": {"mae": mae}, "mae": mae, "rmse": mae, "fit_time": fit_time,
+            "predict_time": predict_time}
+
+
+def test_candidate_configs_start_with_the_current_config():
+    configs = candidate_configs(BASIC_PROPHET_MODEL_CONFIG, 5, seed=1)
+
+    assert configs[0] == BASIC_PROPHET_MODEL_CONFIG
+    assert len(configs) == 5
+    assert all(c["model"]["n_changepoints"] in (10, 25) for c in configs[1:])
+    assert BASIC_PROPHET_MODEL_CONFIG["seasonalities"][0]["fourier_order"] == 5
+
+
+def test_pareto_front_and_selection():
+    trials = [trial(1.0, 5.0), trial(1.01, 1.0), trial(1.2, 0.5), trial(1.3, 2.0)]
+
+    front = pareto_front(trials)
+
+    assert [t["mae"] for t in front] == [1.0, 1.01, 1.2]
+    assert select_config(front, tolerance=0.02)["mae"] == 1.01
+    assert select_config(front, tolerance=0.)["mae"] == 1.0
+
+
+@patch("src.scripts.tuning.tuning.dataset_keys", return_value={"chicago": [100, 1700000000]})
+@patch("src.scripts.tuning.tuning.evaluate_trial")
+def test_run_search_caches_trials_and_writes_configs(evaluate_trial, dataset_keys, tmp_path, monkeypatch):
+    evaluate_trial.side_effect = lambda product, config, *args: dict(
+        trial(config["seasonalities"][0]["fourier_order"] / 10, config["seasonalities"][0]["fourier_order"],
+              product=product), config=config)
+    output = str(tmp_path / "model_configs.json")
+    trials_dir = str(tmp_path / "trials")
+
+    summary = run_search(["temp", "pressure"], ["chicago"], trials=4, max_workers=1, output=output,
+                         trials_dir=trials_dir)
+    run_search(["temp", "pressure"], ["chicago"], trials=4, max_workers=1, output=output, trials_dir=trials_dir)
+
+    assert evaluate_trial.call_count == 8
+    assert summary["trials"] == 8
+    tuned = loads(open(output).read())["products"]
+    assert sorted(tuned) == ["pressure", "temp"]
+    # Every objective grows with the Fourier order, the lowest one dominates.
+    orders = {t["config"]["seasonalities"][0]["fourier_order"] for t in tuned["pressure"]["pareto_front"]}
+    assert orders == {tuned["pressure"]["config"]["seasonalities"][0]["fourier_order"]}
+    assert orders != {25}
+    assert tuned["pressure"]["trials"] == 4
+
+    monkeypatch.setattr(model_training, "TUNED_MODEL_CONFIGS_FILENAME", output)
+    assert get_product_config("pressure") == tuned["pressure"]["config"]
+    assert get_product_config("humidity") == BASIC_PROPHET_MODEL_CONFIG
+
+
+def test_run_search_rejects_non_prophet_products():
+    with pytest.raises(ValueError):
+        run_search(["weather_description"], ["chicago"], max_workers=1, output=None)
+
+
+def test_write_tuned_configs_keeps_other_products(tmp_path):
+    output = str(tmp_path / "model_configs.json")
+    write_tuned_configs({"temp": {"config": {"a": 1}}}, {}, output)
+
+    products = write_tuned_configs({"humidity": {"config": {"b": 2}}}, {"tuned_at": "now"}, output)
+
+    assert products == {"temp": {"config": {"a": 1}}, "humidity": {"config": {"b": 2}}}